@@ -0,0 +1,84 @@
+"""
+batch triage ด้วย numpy: ให้คะแนนทั้งคอลัมน์ในครั้งเดียว เกณฑ์เดียวกับ rule_based_triage ทุกข้อ
+(แยกจาก rules.py เพื่อให้ทางปกติ (apply_ai_triage) ไม่ต้อง import numpy)
+"""
+import numpy as np
+
+# เหตุผลแต่ละข้อ = 1 bit ตามลำดับนี้ (ลำดับเดียวกับที่ rule_based_triage ต่อ string)
+REASONS = (
+    "O2Sat < 95", "RR > 30", "SYS BP < 90", "BT >= 39",             # RED
+    "O2Sat 95-96", "RR 21-30", "PR >= 120", "BT 38-38.9",           # YELLOW
+)
+RED_REASONS = 0x0F
+NO_DANGER = "No danger signs"
+
+# severity code ของ batch_triage → ชื่อ / confidence (index เดียวกัน)
+SEVERITIES = ("RED", "YELLOW", "GREEN")
+CONFIDENCES = (0.90, 0.75, 0.60)
+COLUMNS = ("rr", "pr", "sys_bp", "bt", "o2sat")
+
+
+def _column(values, missing=None):
+    """→ (float64 array, valid mask)  None / NaN / masked / missing=True นับเป็นไม่มีค่า"""
+    if isinstance(values, np.ma.MaskedArray):
+        extra = np.ma.getmaskarray(values)
+        missing = extra if missing is None else (np.asarray(missing, dtype=bool) | extra)
+        values = values.astype(np.float64).filled(np.nan)
+    arr = np.asarray(values, dtype=np.float64)  # None → nan
+    valid = ~np.isnan(arr)
+    if missing is not None:
+        valid &= ~np.asarray(missing, dtype=bool)
+    return arr, valid
+
+
+def _bits(*conds):
+    out = np.zeros(conds[0].shape, dtype=np.uint8)
+    for i, cond in enumerate(conds):
+        out |= cond.astype(np.uint8) << np.uint8(i)
+    return out
+
+
+def batch_triage(rr, pr, sys_bp, bt, o2sat, missing=None):
+    """
+    ให้คะแนนทีละหลายแถวพร้อมกัน ผลเท่ากับ rule_based_triage ทุกแถว
+    - แต่ละคอลัมน์เป็น array / list ยาวเท่ากัน (None, NaN หรือ masked array = ไม่มีค่า)
+    - missing = dict ชื่อคอลัมน์ → bool array (True = ไม่มีค่า) ใช้แทนค่า sentinel ได้
+    return: (codes uint8 index ของ SEVERITIES, confidence float64, reasons uint8 bitmask ตาม REASONS)
+    """
+    missing = missing or {}
+    rr, rr_ok = _column(rr, missing.get("rr"))
+    pr, pr_ok = _column(pr, missing.get("pr"))
+    sys_bp, bp_ok = _column(sys_bp, missing.get("sys_bp"))
+    bt, bt_ok = _column(bt, missing.get("bt"))
+    o2, o2_ok = _column(o2sat, missing.get("o2sat"))
+
+    red = _bits(
+        o2_ok & (o2 < 95),
+        rr_ok & (rr > 30),
+        bp_ok & (sys_bp < 90),
+        bt_ok & (bt >= 39),
+    )
+    yellow = _bits(
+        o2_ok & (o2 >= 95) & (o2 <= 96),
+        rr_ok & (rr >= 21) & (rr <= 30),
+        pr_ok & (pr >= 120),
+        bt_ok & (bt >= 38) & (bt < 39),
+    )
+    is_red = red != 0
+    # แถว RED ไม่ดูเกณฑ์ YELLOW (เหมือน return ก่อนใน rule_based_triage)
+    reasons = np.where(is_red, red, yellow << np.uint8(4)).astype(np.uint8)
+    codes = np.where(is_red, 0, np.where(yellow != 0, 1, 2)).astype(np.uint8)
+    confidence = np.asarray(CONFIDENCES, dtype=np.float64)[codes]
+    return codes, confidence, reasons
+
+
+def batch_triage_rows(rows):
+    """rows = [(rr, pr, sys_bp, bt, o2sat), ...] เช่นจาก VitalSign.objects.values_list(*COLUMNS)"""
+    table = np.array(rows, dtype=np.float64).reshape(-1, len(COLUMNS))
+    return batch_triage(*table.T)
+
+
+def reason_text(mask):
+    """bitmask จาก batch_triage → string เดียวกับ rule_based_triage"""
+    mask = int(mask)
+    return ", ".join(r for i, r in enumerate(REASONS) if mask >> i & 1) or NO_DANGER
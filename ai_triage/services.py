@@ -1,5 +1,8 @@
+import time
+
 from django.utils import timezone
 from ai_triage.rules import rule_based_triage
+from queues import metrics
 from queues.models import TriageResult
 
 SEV_TO_PRIORITY = {"RED": 1, "YELLOW": 2, "GREEN": 3}
@@ -15,6 +18,7 @@ def apply_ai_triage(visit):
     if not hasattr(visit, "vitals"):
         return None  # ไม่มี vitals
 
+    started = time.perf_counter()
     sev, conf, reason = rule_based_triage(visit.vitals)
 
     triage_obj, _ = TriageResult.objects.get_or_create(visit=visit)
@@ -32,4 +36,6 @@ def apply_ai_triage(visit):
         visit.queue.priority = SEV_TO_PRIORITY[sev]
         visit.queue.save()
 
+    metrics.ai_triage.inc(sev)
+    metrics.ai_triage_latency.observe(time.perf_counter() - started)
     return {"severity": sev, "confidence": conf, "reason": reason}
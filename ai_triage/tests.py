@@ -1,3 +1,68 @@
-from django.test import TestCase
+import itertools
+import random
+import subprocess
+import sys
+from pathlib import Path
+from types import SimpleNamespace
 
-# Create your tests here.
+import numpy as np
+from django.test import SimpleTestCase
+
+from ai_triage.batch import COLUMNS, SEVERITIES, batch_triage, batch_triage_rows, reason_text
+from ai_triage.rules import rule_based_triage
+
+# ค่าที่อยู่บน/รอบขอบเกณฑ์ทุกข้อ + None
+GRID = {
+    "rr": [None, 0, 20, 21, 30, 31],
+    "pr": [None, 60, 119, 120],
+    "sys_bp": [None, 89, 90, 140],
+    "bt": [None, 36.5, 37.99, 38.0, 38.95, 39.0, 41.2],
+    "o2sat": [None, 80, 94, 95, 96, 97, 100],
+}
+
+
+class BatchTriageTests(SimpleTestCase):
+    def assert_matches_scalar(self, rows):
+        codes, confidence, reasons = batch_triage_rows(rows)
+        self.assertEqual(len(codes), len(rows))
+        for row, code, conf, mask in zip(rows, codes, confidence, reasons):
+            expected = rule_based_triage(SimpleNamespace(**dict(zip(COLUMNS, row))))
+            self.assertEqual((SEVERITIES[code], float(conf), reason_text(mask)), expected, row)
+
+    def test_boundary_grid_equals_scalar_rules(self):
+        self.assert_matches_scalar(list(itertools.product(*GRID.values())))
+
+    def test_random_rows_equal_scalar_rules(self):
+        rng = random.Random(7)
+
+        def maybe(value):
+            return None if rng.random() < 0.1 else value
+
+        rows = [
+            (
+                maybe(rng.randint(8, 40)), maybe(rng.randint(40, 180)), maybe(rng.randint(60, 200)),
+                maybe(round(rng.uniform(35.0, 41.0), 1)), maybe(rng.randint(80, 100)),
+            )
+            for _ in range(5000)
+        ]
+        self.assert_matches_scalar(rows)
+
+    def test_missing_masks_and_masked_arrays(self):
+        # ค่า sentinel 0 ที่ mask ไว้ต้องเท่ากับ None
+        o2 = np.array([0, 90, 0])
+        codes, _, reasons = batch_triage(
+            rr=[18, 18, 35], pr=[80, 80, 80], sys_bp=np.ma.masked_array([0, 120, 120], mask=[1, 0, 0]),
+            bt=[37.0, 37.0, 37.0], o2sat=o2, missing={"o2sat": o2 == 0},
+        )
+        self.assertEqual([SEVERITIES[c] for c in codes], ["GREEN", "RED", "RED"])
+        self.assertEqual([reason_text(m) for m in reasons], ["No danger signs", "O2Sat < 95", "RR > 30"])
+
+    def test_empty_batch(self):
+        codes, confidence, reasons = batch_triage_rows([])
+        self.assertEqual((len(codes), len(confidence), len(reasons)), (0, 0, 0))
+
+    def test_scalar_rules_do_not_import_numpy(self):
+        # apply_ai_triage ใช้แค่ rules.py → worker ที่ไม่ได้ใช้ batch ไม่ต้องโหลด numpy
+        code = "import sys, ai_triage.rules; sys.exit('numpy' in sys.modules)"
+        root = Path(__file__).resolve().parent.parent
+        self.assertEqual(subprocess.run([sys.executable, "-c", code], cwd=root).returncode, 0)
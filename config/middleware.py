@@ -1,8 +1,135 @@
-from django.utils.deprecation import MiddlewareMixin
-
-class NoCacheMiddleware(MiddlewareMixin):
-    def process_response(self, request, response):
-        response['Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0'
-        response['Pragma'] = 'no-cache'
-        response['Expires'] = '0'
-        return response
+import cProfile
+import hmac
+import io
+import pstats
+import random
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.deprecation import MiddlewareMixin
+
+from config import profiling
+
+
+class NoCacheMiddleware(MiddlewareMixin):
+    def process_response(self, request, response):
+        response['Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0'
+        response['Pragma'] = 'no-cache'
+        response['Expires'] = '0'
+        return response
+
+
+# cProfile ทำงานได้ทีละตัวต่อ process (Python 3.12+) → ทีละ request
+_cprofile_lock = threading.Lock()
+
+
+def _view_name(request):
+    match = getattr(request, "resolver_match", None)
+    return match.view_name if match else "<unresolved>"
+
+
+def _asks_cprofile(request):
+    return request.headers.get("X-Profile") == "1"
+
+
+def _may_cprofile(request):
+    token = getattr(settings, "PROFILING_CPROFILE_TOKEN", "")
+    given = request.headers.get("X-Profile-Token", "")
+    if token and hmac.compare_digest(given.encode(), token.encode()):
+        return True
+    user = getattr(request, "user", None)
+    return bool(user is not None and user.is_staff)
+
+
+def _pstats_text(profiler):
+    out = io.StringIO()
+    stats = pstats.Stats(profiler, stream=out)
+    stats.sort_stats("cumulative").print_stats(getattr(settings, "PROFILING_CPROFILE_LINES", 60))
+    return out.getvalue()
+
+
+class ProfilingMiddleware:
+    """
+    วัด wall time / จำนวน query / เวลา SQL ต่อ view แบบสุ่มตัวอย่าง (ดู config/profiling.py)
+    ต้องอยู่หลัง AuthenticationMiddleware (ใช้ request.user ตรวจสิทธิ์ cProfile)
+    PROFILING_ENABLED=False → ส่งต่ออย่างเดียว
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        if profiling.is_enabled():
+            profiling.install()
+
+    def _sampled(self, request):
+        return random.random() < profiling.sample_rate()
+
+    def _record(self, request, t0, response, prof):
+        wall_ms = (time.perf_counter() - t0) * 1000
+        profiling.store.record(_view_name(request), wall_ms, response.status_code, prof)
+        return wall_ms
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not profiling.is_enabled():
+            return self.get_response(request)
+
+        asked = _asks_cprofile(request)
+        sampled = self._sampled(request)
+        if not asked and not sampled:
+            return self.get_response(request)
+
+        prof, token = profiling.start()
+        t0 = time.perf_counter()
+        profiler = None
+        try:
+            # ตรวจสิทธิ์หลัง start: query โหลด session / user นับรวมใน request นี้ด้วย
+            # X-Profile จาก client ที่ไม่มีสิทธิ์ไม่นับเป็นตัวอย่าง (ไม่งั้นบังคับสุ่มให้สถิติเอียงได้)
+            allowed = asked and _may_cprofile(request)
+            if allowed and _cprofile_lock.acquire(blocking=False):
+                profiler = cProfile.Profile()
+                profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                if profiler is not None:
+                    profiler.disable()
+                    _cprofile_lock.release()
+        finally:
+            profiling.stop(token)
+        if not (sampled or allowed):
+            return response
+        wall_ms = self._record(request, t0, response, prof)
+
+        if profiler is not None:
+            profile_id = profiling.store.add_profile(
+                _view_name(request), request.get_full_path(), wall_ms, _pstats_text(profiler),
+            )
+            response["X-Profile-Id"] = str(profile_id)
+        elif allowed:
+            response["X-Profile-Id"] = "busy"  # มี request อื่นกำลังถูก profile อยู่
+        return response
+
+    async def __acall__(self, request):
+        if not profiling.is_enabled() or not self._sampled(request):
+            response = await self.get_response(request)
+        else:
+            prof, token = profiling.start()
+            t0 = time.perf_counter()
+            try:
+                response = await self.get_response(request)
+            finally:
+                profiling.stop(token)
+            self._record(request, t0, response, prof)
+
+        if _asks_cprofile(request):
+            # cProfile วัดได้แค่ thread เดียว แต่ ASGI แบ่งงานข้าม event loop / thread pool
+            response["X-Profile-Id"] = "unsupported"
+        return response
@@ -0,0 +1,275 @@
+"""
+Request profiling (ใช้คู่กับ config.middleware.ProfilingMiddleware)
+
+- สุ่มวัด PROFILING_SAMPLE_RATE ของ request: wall time, จำนวน query, เวลา SQL รวม
+  แยกตาม view เก็บเป็น histogram ช่องคงที่ + query ที่ช้าที่สุด K ตัวต่อ view
+  หน่วยความจำมีขอบเขต: view ไม่เกิน PROFILING_MAX_VIEWS (เกินรวมเป็น "<other>")
+- เวลา SQL วัดด้วย execute_wrapper ที่ติดกับทุก connection ตอนเปิด (connection_created)
+  แล้วบวกเข้า request ผ่าน ContextVar → ใช้ได้ทั้ง WSGI และ ASGI (sync_to_async ส่ง context ต่อให้)
+- cProfile ทีละ request: ส่ง header "X-Profile: 1" (staff หรือ X-Profile-Token ตรงกับ PROFILING_CPROFILE_TOKEN)
+  ผลเก็บไว้ PROFILING_CPROFILE_KEEP อันล่าสุด response ได้ X-Profile-Id ไปเปิดดูที่ /ops/profiling/<id>/
+  รองรับเฉพาะ request ที่วิ่งแบบ sync (WSGI) เพราะ cProfile วัดได้แค่ thread เดียว
+
+ข้อมูลอยู่ใน process เดียว (เหมือน queues/recent.py) หลาย worker → ดูทีละ worker
+GET /ops/profiling/?sort=total|p95|queries|sql&limit=20  (staff เท่านั้น)
+"""
+import heapq
+import itertools
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import Http404, HttpResponse, JsonResponse
+from django.views.decorators.http import require_GET
+
+# ขอบบนของแต่ละช่อง histogram (ms) ช่องสุดท้าย = มากกว่านั้นทั้งหมด
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+SQL_PREVIEW = 500  # ตัด SQL ที่เก็บไว้ให้ยาวไม่เกินนี้
+SORT_KEYS = {
+    "total": lambda s: s["wall_total_ms"],
+    "p95": lambda s: s["p95_ms"],
+    "queries": lambda s: s["queries_mean"],
+    "sql": lambda s: s["sql_total_ms"],
+}
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def is_enabled():
+    return _setting("PROFILING_ENABLED", False)
+
+
+def sample_rate():
+    return float(_setting("PROFILING_SAMPLE_RATE", 0.05))
+
+
+# -----------------------------
+# per-request
+# -----------------------------
+class RequestProfile:
+    __slots__ = ("queries", "sql_seconds", "slow", "keep")
+
+    def __init__(self, keep):
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.slow = []  # min-heap [(seconds, sql)] ขนาดไม่เกิน keep
+        self.keep = keep
+
+    def add_query(self, sql, seconds):
+        self.queries += 1
+        self.sql_seconds += seconds
+        item = (seconds, sql[:SQL_PREVIEW])
+        if len(self.slow) < self.keep:
+            heapq.heappush(self.slow, item)
+        elif seconds > self.slow[0][0]:
+            heapq.heapreplace(self.slow, item)
+
+
+_current = ContextVar("profiling_request", default=None)
+
+
+def _sql_timer(execute, sql, params, many, context):
+    prof = _current.get()
+    if prof is None:
+        return execute(sql, params, many, context)
+    t0 = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        prof.add_query(sql, time.perf_counter() - t0)
+
+
+def _attach(connection, **kwargs):
+    if _sql_timer not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_sql_timer)
+
+
+def install():
+    """ติด _sql_timer กับ connection ที่จะเปิดต่อจากนี้ (เรียกครั้งเดียวตอนสร้าง middleware)"""
+    connection_created.connect(_attach, dispatch_uid="config.profiling.attach")
+
+
+def start():
+    # connection ของ thread นี้ที่เปิดไว้ก่อน install (CONN_MAX_AGE > 0)
+    for conn in connections.all(initialized_only=True):
+        _attach(conn)
+    prof = RequestProfile(int(_setting("PROFILING_SLOW_QUERIES", 5)))
+    return prof, _current.set(prof)
+
+
+def stop(token):
+    _current.reset(token)
+
+
+# -----------------------------
+# aggregate
+# -----------------------------
+def _bucket(ms):
+    return bisect_left(BUCKETS_MS, ms)
+
+
+def _percentile(hist, p, max_ms):
+    total = sum(hist)
+    if not total:
+        return 0.0
+    need = p / 100 * total
+    seen = 0
+    for i, n in enumerate(hist):
+        seen += n
+        if seen >= need:
+            # ขอบบนของช่อง (ช่องสุดท้ายไม่มีขอบ → ค่ามากสุดที่เคยเห็น)
+            return float(BUCKETS_MS[i]) if i < len(BUCKETS_MS) else max_ms
+    return max_ms
+
+
+class ViewStats:
+    __slots__ = (
+        "count", "errors", "wall_total", "wall_max", "wall_hist",
+        "sql_total", "sql_hist", "queries_total", "queries_max", "slow",
+    )
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.wall_total = 0.0
+        self.wall_max = 0.0
+        self.wall_hist = [0] * (len(BUCKETS_MS) + 1)
+        self.sql_total = 0.0
+        self.sql_hist = [0] * (len(BUCKETS_MS) + 1)
+        self.queries_total = 0
+        self.queries_max = 0
+        self.slow = []  # min-heap [(ms, sql)]
+
+    def add(self, wall_ms, status, prof, keep):
+        sql_ms = prof.sql_seconds * 1000
+        self.count += 1
+        self.errors += status >= 500
+        self.wall_total += wall_ms
+        self.wall_max = max(self.wall_max, wall_ms)
+        self.wall_hist[_bucket(wall_ms)] += 1
+        self.sql_total += sql_ms
+        self.sql_hist[_bucket(sql_ms)] += 1
+        self.queries_total += prof.queries
+        self.queries_max = max(self.queries_max, prof.queries)
+        for seconds, sql in prof.slow:
+            item = (seconds * 1000, sql)
+            if len(self.slow) < keep:
+                heapq.heappush(self.slow, item)
+            elif item[0] > self.slow[0][0]:
+                heapq.heapreplace(self.slow, item)
+
+    def as_dict(self, view):
+        n = self.count or 1
+        return {
+            "view": view,
+            "count": self.count,
+            "errors": self.errors,
+            "wall_total_ms": round(self.wall_total, 1),
+            "mean_ms": round(self.wall_total / n, 2),
+            "p50_ms": _percentile(self.wall_hist, 50, self.wall_max),
+            "p95_ms": _percentile(self.wall_hist, 95, self.wall_max),
+            "p99_ms": _percentile(self.wall_hist, 99, self.wall_max),
+            "max_ms": round(self.wall_max, 2),
+            "queries_mean": round(self.queries_total / n, 2),
+            "queries_max": self.queries_max,
+            "sql_total_ms": round(self.sql_total, 1),
+            "sql_mean_ms": round(self.sql_total / n, 2),
+            "sql_share": round(self.sql_total / self.wall_total, 3) if self.wall_total else 0.0,
+            "slowest_sql": [
+                {"ms": round(ms, 2), "sql": sql} for ms, sql in sorted(self.slow, reverse=True)
+            ],
+        }
+
+
+class ProfileStore:
+    def __init__(self):
+        self._views = {}
+        self._profiles = deque(maxlen=int(_setting("PROFILING_CPROFILE_KEEP", 10)))
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+
+    def record(self, view, wall_ms, status, prof):
+        keep = int(_setting("PROFILING_SLOW_QUERIES", 5))
+        with self._lock:
+            stats = self._views.get(view)
+            if stats is None:
+                if len(self._views) >= int(_setting("PROFILING_MAX_VIEWS", 200)):
+                    view = "<other>"
+                stats = self._views.setdefault(view, ViewStats())
+            stats.add(wall_ms, status, prof, keep)
+
+    def top(self, sort="total", limit=20):
+        with self._lock:
+            rows = [s.as_dict(view) for view, s in self._views.items()]
+        rows.sort(key=SORT_KEYS[sort], reverse=True)
+        return rows[:limit]
+
+    def add_profile(self, view, path, wall_ms, text):
+        with self._lock:
+            profile_id = next(self._ids)
+            self._profiles.append({
+                "id": profile_id, "view": view, "path": path,
+                "at": time.time(), "wall_ms": round(wall_ms, 2), "text": text,
+            })
+        return profile_id
+
+    def profiles(self):
+        with self._lock:
+            return [{k: v for k, v in p.items() if k != "text"} for p in self._profiles]
+
+    def profile(self, profile_id):
+        with self._lock:
+            return next((p for p in self._profiles if p["id"] == profile_id), None)
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+            self._profiles.clear()
+            self.started_at = time.time()
+
+
+store = ProfileStore()
+
+
+# -----------------------------
+# views (staff)
+# -----------------------------
+@staff_member_required
+@require_GET
+def profiling_api(request):
+    """GET /ops/profiling/  view ที่กินเวลามากที่สุด + รายการ cProfile ที่เก็บไว้"""
+    sort = request.GET.get("sort", "total")
+    if sort not in SORT_KEYS:
+        return JsonResponse({"ok": False, "error": f"sort must be one of {', '.join(SORT_KEYS)}"}, status=400)
+    try:
+        limit = max(1, min(200, int(request.GET.get("limit") or 20)))
+    except ValueError:
+        return JsonResponse({"ok": False, "error": "limit must be an integer"}, status=400)
+    return JsonResponse({
+        "ok": True,
+        "enabled": is_enabled(),
+        "sample_rate": sample_rate(),
+        "since": store.started_at,
+        "views": store.top(sort, limit),
+        "profiles": store.profiles(),
+    })
+
+
+@staff_member_required
+@require_GET
+def profile_detail(request, profile_id):
+    """GET /ops/profiling/<id>/  ผล cProfile (pstats เรียงตาม cumulative) เป็น text"""
+    p = store.profile(profile_id)
+    if p is None:
+        raise Http404("profile not found (only the most recent ones are kept)")
+    header = f"{p['view']}  {p['path']}  {p['wall_ms']} ms\n\n"
+    return HttpResponse(header + p["text"], content_type="text/plain; charset=utf-8")
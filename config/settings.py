@@ -52,6 +52,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'config.middleware.ProfilingMiddleware',  # ทำงานเมื่อ PROFILING_ENABLED (ดู config/profiling.py)
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -130,3 +131,65 @@ LOGIN_REDIRECT_URL = "/dashboard/"
 LOGOUT_REDIRECT_URL = "/accounts/login/"
 # Default primary key field type
 # https://docs.djangoproject.com/en/6.0/ref/settings/#default-auto-field
+
+
+# Telemetry ingest
+# "sync" = เขียน DB ใน request, "buffered" = เข้าคิวในหน่วยความจำแล้วตอบ 202 (ดู queues/ingest_buffer.py)
+TELEMETRY_INGEST_MODE = "sync"
+TELEMETRY_BATCH_MAX = 500          # จำนวน reading สูงสุดต่อ request ของ batch endpoint
+TELEMETRY_BUFFER_MAX = 10000       # buffer เต็ม → ตอบ 429
+TELEMETRY_FLUSH_BATCH = 500        # flush เมื่อครบกี่ reading
+TELEMETRY_FLUSH_INTERVAL = 1.0     # หรือทุกกี่วินาที
+TELEMETRY_RETRY_AFTER = 1          # ค่า Retry-After (วินาที) ตอน 429
+
+DEVICE_AUTH_CACHE_TTL = 60                # วินาทีที่จำ credential ของอุปกรณ์
+DEVICE_LAST_SEEN_FLUSH_INTERVAL = 30.0    # รวบเขียน Device.last_seen ทุกกี่วินาที
+TELEMETRY_ROLLUPS_ENABLED = True          # เก็บ rollup 1m/5m ตอน ingest (ดู queues/rollups.py)
+
+# Telemetry retention (manage.py archive_telemetry)
+TELEMETRY_HOT_DAYS = 30                                  # log เก่ากว่านี้ย้ายออกจากตารางหลัก
+TELEMETRY_ARCHIVE_DIR = BASE_DIR / "archive" / "telemetry"  # ไฟล์ archive รายวัน
+
+# Ring ของ reading ล่าสุดต่อ visit ในหน่วยความจำ (queues/recent.py)
+# อยู่ใน process เดียว → เปิดเมื่อรัน worker เดียว (หลาย worker แต่ละตัวเห็นไม่ครบ)
+TELEMETRY_RECENT_ENABLED = False
+TELEMETRY_RECENT_SIZE = 120       # reading ต่อ visit
+
+# Live update ของหน้า monitor / dashboard / map (SSE: /async/monitor/api/stream/)
+MONITOR_STREAM_KEEPALIVE = 15.0   # วินาทีที่ไม่มีอะไรเปลี่ยน → ส่ง keepalive
+MONITOR_STREAM_COALESCE = 1.0     # รวมการเปลี่ยนภายในกี่วินาทีเป็น event เดียว
+MONITOR_CURSOR_SLACK = 2.0        # ?since= ย้อนเผื่อ transaction ที่ commit ช้า (วินาที, ส่งซ้ำได้ไม่หาย)
+MONITOR_TOMBSTONE_SECONDS = 86400 # visit ที่ถูกลบยังส่งใน removed ของ ?since= ได้นานเท่านี้ (order ยังถูกเสมอ)
+MONITOR_SUMMARY_CACHE_TTL = 2.0   # /monitor/api/summary/ ทั้งคิว: ใช้ผลเดิมได้กี่วินาทีถ้าไม่มีการเปลี่ยน (0 = ปิด)
+
+# หน้า map: cluster ฝั่ง server (/monitor/api/map/, queues/geo.py)
+MAP_INDEX_TTL = 5.0               # index ตำแหน่งล่าสุดใช้ได้กี่วินาทีถ้าไม่มีการเปลี่ยน
+MAP_CLUSTER_CELL_PX = 60          # จุดที่ห่างกันไม่เกินช่องนี้ (pixel บนจอ) รวมเป็น cluster
+MAP_MAX_CLUSTERS = 300            # items สูงสุดต่อ response
+MAP_CLUSTER_MAX_ZOOM = 18         # ซูมตั้งแต่ระดับนี้ไม่ cluster
+
+# เส้นทาง GPS (/monitor/api/visit/<id>/track/, queues/tracks.py)
+TRACK_TOLERANCE_M = 5.0           # Douglas-Peucker: เบี่ยงจากจุดจริงได้ไม่เกินกี่เมตร (ค่าเริ่มต้นของ ?tolerance=)
+TRACK_SEGMENT_SECONDS = 900       # ย่อ / cache ทีละช่วงเวลาเท่านี้
+TRACK_FINALIZE_SECONDS = 300      # segment ที่จบไปเกินนี้ถือว่าไม่มี log มาเพิ่มแล้ว → cache ได้
+TRACK_CACHE_TTL = 24 * 3600
+TRACK_MAX_WINDOW_HOURS = 24
+
+# ลำดับคิว WAITING ในหน่วยความจำ (queues/queue_index.py) เปิดเมื่อรัน process เดียว
+QUEUE_INDEX_ENABLED = False
+QUEUE_INDEX_RECONCILE_SECONDS = 60.0  # สร้างใหม่จาก DB ทุกกี่วินาที (เก็บตกการแก้ที่ไม่ผ่าน signal)
+
+# ตัวเลขคิวของหน้า dashboard (queues/stats.py) counter cache เปิดเมื่อรัน process เดียว
+QUEUE_STATS_CACHE_ENABLED = False
+QUEUE_STATS_RECONCILE_SECONDS = 60.0
+
+# Profiling ต่อ view (config/profiling.py, staff: /ops/profiling/) เปิดใน production ได้ด้วย sampling
+PROFILING_ENABLED = False
+PROFILING_SAMPLE_RATE = 0.05      # สัดส่วน request ที่วัด
+PROFILING_MAX_VIEWS = 200         # view ที่เก็บแยก (เกินรวมเป็น "<other>")
+PROFILING_SLOW_QUERIES = 5        # query ที่ช้าที่สุดที่เก็บต่อ view
+PROFILING_CPROFILE_KEEP = 10      # ผล cProfile (header X-Profile: 1) ที่เก็บไว้ล่าสุด
+PROFILING_CPROFILE_TOKEN = ""     # ให้ client ที่ไม่ใช่ staff ขอ cProfile ได้ด้วย X-Profile-Token (ว่าง = staff เท่านั้น)
+
+# /metrics (queues/metrics.py, Prometheus text format)
+METRICS_TOKEN = ""                # ตั้งไว้ → scraper ส่ง Authorization: Bearer <token> ได้  ว่าง = staff เท่านั้น
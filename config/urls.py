@@ -2,6 +2,8 @@ from django.contrib import admin
 from django.urls import path, include
 from django.contrib.auth import views as auth_views
 
+from config import profiling
+
 urlpatterns = [
     path("admin/", admin.site.urls),
 
@@ -13,6 +15,11 @@ urlpatterns = [
     path("accounts/", include("accounts.urls")),
     path("dashboard/", include("dashboard.urls")),  # ✅ เพิ่มบรรทัดนี้
 
+    # profiling (staff)
+    path("ops/profiling/", profiling.profiling_api, name="profiling_api"),
+    path("ops/profiling/<int:profile_id>/", profiling.profile_detail, name="profile_detail"),
+
+    path("async/", include("queues.async_urls")),  # async views สำหรับ ASGI
     path("", include("queues.urls")),
     path("patients/", include("patients.urls")),
 ]
@@ -1,8 +1,9 @@
 from django.urls import path
-from .views import dashboard_view
+from .views import dashboard_view, stats_api
 
 app_name = "dashboard"
 
 urlpatterns = [
     path("", dashboard_view, name="home"),
+    path("api/stats/", stats_api, name="stats_api"),
 ]
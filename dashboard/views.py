@@ -1,19 +1,20 @@
 from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse
 from django.shortcuts import render
 from django.utils import timezone
-from queues.models import Queue
+from django.views.decorators.http import require_GET
+from queues import stats
 
 @login_required
 def dashboard_view(request):
-    waiting = Queue.objects.filter(status="WAITING")
-    called = Queue.objects.filter(status="CALLED")
-
-    context = {
-        "waiting_total": waiting.count(),
-        "called_total": called.count(),
-        "red_total": waiting.filter(priority=1).count(),
-        "yellow_total": waiting.filter(priority=2).count(),
-        "green_total": waiting.filter(priority=3).count(),
-        "now": timezone.now(),
-    }
+    # นับทุก status / priority ใน query เดียว (หรือจาก counter cache) ดู queues/stats.py
+    context = stats.queue_stats()
+    context["now"] = timezone.now()
     return render(request, "dashboard/dashboard.html", context)
+
+
+@login_required
+@require_GET
+def stats_api(request):
+    """ตัวเลขชุดเดียวกับหน้า dashboard ให้ JS รีเฟรชโดยไม่ต้องโหลดหน้าใหม่"""
+    return JsonResponse({"ok": True, **stats.queue_stats(), "server_time": timezone.now().isoformat()})
@@ -6,6 +6,7 @@ from django.utils import timezone
 
 from .forms import PatientForm
 from .models import Patient
+from queues import metrics
 from queues.models import Visit, Queue
 from ai_triage.services import apply_ai_triage
 
@@ -14,6 +15,7 @@ def severity_to_priority(sev: str) -> int:
     return {"RED": 1, "YELLOW": 2, "GREEN": 3}.get(sev, 3)
 
 
+@metrics.instrument("register_patient")
 @login_required
 def register_patient(request):
     if request.method == "POST":
@@ -59,6 +61,7 @@ def register_patient(request):
                 visit=visit,
                 priority=severity_to_priority(severity),
             )
+        metrics.queue_actions.inc("register")
 
         return redirect("queue_list")
 
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Visit, VitalSign, Queue, TriageResult,Device, TelemetryLog
+from .models import Visit, VitalSign, Queue, TriageResult,Device, TelemetryLog, TelemetryRollup, VisitSnapshot
 
 admin.site.register(Visit)
 admin.site.register(VitalSign)
@@ -7,3 +7,5 @@ admin.site.register(Queue)
 admin.site.register(TriageResult)
 admin.site.register(Device)
 admin.site.register(TelemetryLog)
+admin.site.register(TelemetryRollup)
+admin.site.register(VisitSnapshot)
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class QueuesConfig(AppConfig):
     name = 'queues'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,358 @@
+"""
+Telemetry archive: ย้าย TelemetryLog เก่า/ของ visit ที่จบแล้วออกจากตารางหลัก
+ไปเก็บเป็นไฟล์รายวัน (UTC) แบบ columnar + zlib ใน TELEMETRY_ARCHIVE_DIR
+
+ไฟล์ telemetry-YYYY-MM-DD.tla = segment ต่อกันหลายก้อน (archive หลายรอบในวันเดียวกันได้)
+
+segment:
+  4s  magic  b"TLA1"
+  I   จำนวนแถว
+  H   จำนวนคอลัมน์
+  ต่อคอลัมน์: B ความยาวชื่อ, ชื่อ, I ความยาวข้อมูล, zlib(int64 little-endian[])
+
+แถวเรียงตาม (visit_id, ts) ทุกคอลัมน์เป็น int64 ค่า NULL = NULL_VALUE
+เวลาเก็บเป็น epoch microseconds, คอลัมน์ id / visit_id / ts_us เก็บเป็นผลต่างจากแถวก่อน (delta) ให้บีบอัดได้ดี
+bt (FloatField) เก็บ bit ของ float64 ตรง ๆ (คอลัมน์ bt_f64 ไม่ปัดเศษ)  ไฟล์เก่ามีคอลัมน์ bt แบบ x100 ยังอ่านได้
+lat/lng (DecimalField 6 ตำแหน่ง) เก็บ x1e6 ครบทุกหลัก
+
+วันไหนมี log ของ visit ไหน บันทึกใน TelemetryArchiveDay (transaction เดียวกับที่ลบจาก DB)
+read_visit_logs() เปิดเฉพาะไฟล์ของวันเหล่านั้น อ่านกลับเป็น TelemetryLog (ยังไม่ save) ให้หน้า detail/export ใช้ปนกับของใน DB
+ถ้า archive ค้างกลางทาง (เขียนไฟล์แล้วแต่ยังไม่ลบจาก DB) ตอนอ่านจะตัดซ้ำด้วย id
+ไฟล์ที่เขียนก่อนมี index: manage.py archive_telemetry --reindex
+"""
+import os
+import struct
+import sys
+import zlib
+from array import array
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import Device, TelemetryArchiveDay, TelemetryLog, Visit
+
+MAGIC = b"TLA1"
+SEGMENT_HEADER = struct.Struct("<4sIH")
+NULL_VALUE = -(2 ** 63)
+F64 = "f64"  # scale พิเศษ: เก็บ bit ของ float64 เป็น int64 (ไม่เสียความละเอียด)
+FLOAT_BITS = struct.Struct("<d")
+INT_BITS = struct.Struct("<q")
+
+# (ชื่อคอลัมน์, field ของ TelemetryLog, scale, delta)
+COLUMNS = (
+    ("id", "id", 1, True),
+    ("visit_id", "visit_id", 1, True),
+    ("device_id", "device_id", 1, False),
+    ("ts_us", "ts", None, True),
+    ("created_us", "created_at", None, False),
+    ("bpm", "bpm", 1, False),
+    ("o2sat", "o2sat", 1, False),
+    ("bt_f64", "bt", F64, False),
+    ("rr", "rr", 1, False),
+    ("sys_bp", "sys_bp", 1, False),
+    ("dia_bp", "dia_bp", 1, False),
+    ("lat", "lat", 1_000_000, False),
+    ("lng", "lng", 1_000_000, False),
+)
+FIELDS = [c[1] for c in COLUMNS]
+# คอลัมน์ที่ segment รุ่นเก่าใช้แทน (ชื่อใหม่ → spec เดิม)
+LEGACY_COLUMNS = {"bt_f64": ("bt", "bt", 100, False)}
+
+
+def archive_dir():
+    return Path(getattr(settings, "TELEMETRY_ARCHIVE_DIR", settings.BASE_DIR / "archive" / "telemetry"))
+
+
+def day_path(day):
+    return archive_dir() / f"telemetry-{day.isoformat()}.tla"
+
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+
+
+def _to_us(dt):
+    return (dt - EPOCH) // MICROSECOND
+
+
+def _from_us(us):
+    return EPOCH + timedelta(microseconds=us)
+
+
+def _pack(values):
+    arr = array("q", values)
+    if sys.byteorder == "big":
+        arr.byteswap()
+    return zlib.compress(arr.tobytes(), 6)
+
+
+def _unpack(blob):
+    arr = array("q")
+    arr.frombytes(zlib.decompress(blob))
+    if sys.byteorder == "big":
+        arr.byteswap()
+    return arr
+
+
+def _float_bits(value):
+    # + 0.0: -0.0 มี bit เดียวกับ NULL_VALUE
+    return INT_BITS.unpack(FLOAT_BITS.pack(float(value) + 0.0))[0]
+
+
+def _bits_float(value):
+    return FLOAT_BITS.unpack(INT_BITS.pack(value))[0]
+
+
+def _delta(values):
+    out, prev = [], 0
+    for v in values:
+        out.append(v - prev)
+        prev = v
+    return out
+
+
+def _undelta(values):
+    out, acc = [], 0
+    for v in values:
+        acc += v
+        out.append(acc)
+    return out
+
+
+# -----------------------------
+# write
+# -----------------------------
+def encode_segment(rows):
+    """rows: dict จาก TelemetryLog.values(*FIELDS) → bytes ของ 1 segment"""
+    rows = sorted(rows, key=lambda r: (r["visit_id"], r["ts"]))
+    parts = [SEGMENT_HEADER.pack(MAGIC, len(rows), len(COLUMNS))]
+    for name, field, scale, delta in COLUMNS:
+        values = []
+        for r in rows:
+            v = r[field]
+            if v is None:
+                values.append(NULL_VALUE)
+            elif scale is None:
+                values.append(_to_us(v))
+            elif scale == F64:
+                values.append(_float_bits(v))
+            else:
+                values.append(int(round(float(v) * scale)))
+        if delta:
+            values = _delta(values)
+        blob = _pack(values)
+        encoded = name.encode()
+        parts.append(struct.pack("<B", len(encoded)) + encoded + struct.pack("<I", len(blob)) + blob)
+    return b"".join(parts)
+
+
+def append_segment(day, rows):
+    path = day_path(day)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "ab") as f:
+        f.write(encode_segment(rows))
+        f.flush()
+        os.fsync(f.fileno())
+    return path
+
+
+def archive_queryset(logs, chunk_size=5000, dry_run=False):
+    """
+    ย้าย logs (queryset) ลงไฟล์ archive แล้วลบออกจาก DB ทีละ chunk
+    return: จำนวนแถวที่ย้าย
+    """
+    moved = 0
+    last_id = 0
+    while True:
+        chunk = list(
+            logs.filter(id__gt=last_id).order_by("id").values(*FIELDS)[:chunk_size]
+        )
+        if not chunk:
+            break
+        last_id = chunk[-1]["id"]
+        moved += len(chunk)
+        if dry_run:
+            continue
+
+        by_day = {}
+        for r in chunk:
+            by_day.setdefault(r["ts"].astimezone(dt_timezone.utc).date(), []).append(r)
+        # เขียนไฟล์ (fsync) ก่อน แล้วค่อยลบจาก DB พร้อมบันทึก index
+        for day, rows in by_day.items():
+            append_segment(day, rows)
+        with transaction.atomic():
+            _index_days({(r["visit_id"], day) for day, rows in by_day.items() for r in rows})
+            TelemetryLog.objects.filter(id__in=[r["id"] for r in chunk]).delete()
+    return moved
+
+
+def _index_days(pairs):
+    TelemetryArchiveDay.objects.bulk_create(
+        [TelemetryArchiveDay(visit_id=visit_id, day=day) for visit_id, day in pairs],
+        ignore_conflicts=True,
+    )
+
+
+def reindex():
+    """สร้าง TelemetryArchiveDay จากไฟล์ที่มีอยู่ (ไฟล์ที่เขียนก่อนมี index)  return: จำนวนคู่ (visit, วัน)"""
+    pairs = set()
+    for day in archived_days():
+        for _, cols in iter_segments(day_path(day)):
+            pairs.update((visit_id, day) for visit_id in set(_undelta(_unpack(cols["visit_id"]))))
+    # visit ที่ถูกลบไปแล้วไม่ต้องมี index (FK)
+    existing = set(Visit.objects.filter(id__in={v for v, _ in pairs}).values_list("id", flat=True))
+    pairs = {(v, d) for v, d in pairs if v in existing}
+    with transaction.atomic():
+        _index_days(pairs)
+    return len(pairs)
+
+
+# -----------------------------
+# read
+# -----------------------------
+def iter_segments(path):
+    """ไฟล์ → segment ละ dict {ชื่อคอลัมน์: blob} (ยังไม่ decompress)"""
+    data = path.read_bytes()
+    pos = 0
+    while pos < len(data):
+        magic, nrows, ncols = SEGMENT_HEADER.unpack_from(data, pos)
+        if magic != MAGIC:
+            raise ValueError(f"{path}: bad segment at byte {pos}")
+        pos += SEGMENT_HEADER.size
+        cols = {}
+        for _ in range(ncols):
+            (name_len,) = struct.unpack_from("<B", data, pos)
+            pos += 1
+            name = data[pos:pos + name_len].decode()
+            pos += name_len
+            (blob_len,) = struct.unpack_from("<I", data, pos)
+            pos += 4
+            cols[name] = data[pos:pos + blob_len]
+            pos += blob_len
+        yield nrows, cols
+
+
+def _decode_column(blob, delta):
+    values = _unpack(blob)
+    return _undelta(values) if delta else values
+
+
+def _segment_columns(cols):
+    return [
+        spec if spec[0] in cols or spec[0] not in LEGACY_COLUMNS else LEGACY_COLUMNS[spec[0]]
+        for spec in COLUMNS
+    ]
+
+
+def read_day(day, visit_id=None, visit_ids=None):
+    """แถวของวันนั้น (กรอง visit_id หรือ set ของ visit_ids ได้) → list ของ dict field → value"""
+    path = day_path(day)
+    if not path.exists():
+        return []
+    if visit_id is not None:
+        visit_ids = {visit_id}
+
+    out = []
+    for nrows, cols in iter_segments(path):
+        visit_col = _undelta(_unpack(cols["visit_id"]))
+        if visit_ids is not None:
+            wanted = [i for i, v in enumerate(visit_col) if v in visit_ids]
+            if not wanted:
+                continue  # ไม่ต้องคลายคอลัมน์อื่นเลย
+        else:
+            wanted = range(nrows)
+
+        columns = _segment_columns(cols)
+        decoded = {}
+        for name, field, scale, delta in columns:
+            decoded[field] = visit_col if name == "visit_id" else _decode_column(cols[name], delta)
+
+        for i in wanted:
+            row = {}
+            for name, field, scale, delta in columns:
+                v = decoded[field][i]
+                if v == NULL_VALUE:
+                    row[field] = None
+                elif scale is None:
+                    row[field] = _from_us(v)
+                elif scale == F64:
+                    row[field] = _bits_float(v)
+                elif field == "bt":
+                    row[field] = v / scale
+                elif field in ("lat", "lng"):
+                    row[field] = Decimal(v).scaleb(-6)
+                else:
+                    row[field] = v
+            out.append(row)
+    return out
+
+
+def archived_days(since=None, until=None):
+    days = []
+    d = archive_dir()
+    if not d.exists():
+        return days
+    for p in d.glob("telemetry-*.tla"):
+        try:
+            day = date.fromisoformat(p.stem[len("telemetry-"):])
+        except ValueError:
+            continue
+        if (since is None or day >= since) and (until is None or day <= until):
+            days.append(day)
+    return sorted(days)
+
+
+def visit_days(visit_id):
+    """วันที่มีไฟล์ archive ของ visit นี้ (ตาม TelemetryArchiveDay) เรียงเก่า → ใหม่"""
+    return list(TelemetryArchiveDay.objects.filter(visit_id=visit_id).order_by("day").values_list("day", flat=True))
+
+
+def read_visit_logs(visit, exclude_ids=(), limit=None):
+    """
+    log ที่ archive แล้วของ visit นี้ เป็น TelemetryLog (ยังไม่ save, มี .device) เรียงใหม่ → เก่า
+    เปิดเฉพาะไฟล์ของวันที่มีแถวของ visit จริง (ไม่เดาจากเวลาลงทะเบียน: นาฬิกาอุปกรณ์อาจเพี้ยน)
+    เปิดจากวันใหม่ → เก่า  ได้ครบ limit แถวแล้วหยุด (วันที่เก่ากว่ามีแต่ log ที่เก่ากว่า)
+    """
+    seen = set(exclude_ids)
+    rows = []
+    for day in reversed(visit_days(visit.id)):
+        for row in read_day(day, visit_id=visit.id):
+            if row["id"] in seen:
+                continue
+            seen.add(row["id"])
+            rows.append(row)
+        if limit is not None and len(rows) >= limit:
+            break
+
+    rows.sort(key=lambda r: r["ts"], reverse=True)
+    if limit is not None:
+        rows = rows[:limit]
+
+    devices = Device.objects.in_bulk({r["device_id"] for r in rows if r["device_id"]})
+    logs = []
+    for r in rows:
+        log = TelemetryLog(**r)
+        log.device = devices.get(r["device_id"])
+        logs.append(log)
+    return logs
+
+
+def visit_logs(visit, limit=None):
+    """
+    log ของ visit ทั้งในตารางหลักและใน archive (ใหม่ → เก่า)
+    limit: ถ้าตารางหลักมีครบแล้วจะไม่เปิดไฟล์ archive เลย  ไม่ครบก็อ่าน archive แค่พอให้ได้ limit แถว
+    """
+    hot = TelemetryLog.objects.filter(visit=visit).select_related("device").order_by("-ts")
+    if limit is not None:
+        hot_logs = list(hot[:limit])
+        if len(hot_logs) >= limit:
+            return hot_logs
+    else:
+        hot_logs = list(hot)
+
+    archived = read_visit_logs(visit, exclude_ids={log.id for log in hot_logs}, limit=limit)
+    merged = sorted(hot_logs + archived, key=lambda x: x.ts, reverse=True)
+    return merged[:limit] if limit is not None else merged
@@ -0,0 +1,14 @@
+from django.urls import path
+from . import async_views
+
+# async (ASGI) endpoints: path เหมือน queues/urls.py แต่อยู่ใต้ /async/
+urlpatterns = [
+    path("api/iot/telemetry/", async_views.iot_telemetry, name="async_iot_telemetry"),
+    path("api/iot/telemetry/batch/", async_views.iot_telemetry_batch, name="async_iot_telemetry_batch"),
+
+    path("monitor/api/latest/", async_views.monitor_latest_api, name="async_monitor_latest_api"),
+    path("monitor/api/summary/", async_views.monitor_summary_api, name="async_monitor_summary_api"),
+    path("monitor/api/sparklines/", async_views.monitor_sparklines_api, name="async_monitor_sparklines_api"),
+    path("monitor/api/map/", async_views.monitor_map_api, name="async_monitor_map_api"),
+    path("monitor/api/stream/", async_views.monitor_stream, name="monitor_stream"),
+]
@@ -0,0 +1,279 @@
+"""
+Async (ASGI) versions ของ ingest + monitor JSON APIs
+
+ใช้ async ORM (aget / afirst / async for) ตรง ๆ ส่วนที่ยังผ่าน sync_to_async:
+- ingest_logs: ต้องอยู่ใน transaction ทั้งก้อน (async ORM ยังไม่รองรับ transaction)
+- recent.get_store / queue_index (ตอนเปิดใช้): warm / reconcile ครั้งแรกถือ threading lock ของ process
+mount ไว้ที่ /async/ (ดู queues/async_urls.py) ใช้คู่กับ config.asgi:application เช่น
+  uvicorn config.asgi:application --workers 2
+"""
+import asyncio
+import json
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+
+from . import events, geo, metrics, queue_index, recent, snapshots, sparklines, summary_cache
+from .ingest_buffer import get_buffer, is_buffered
+from .telemetry import TelemetryError, aauthenticate_device, amissing_visit_ids, ingest_logs
+from .views import (
+    LATEST_ONLINE_SECONDS,
+    SUMMARY_ONLINE_SECONDS,
+    _batch_response,
+    _batch_results,
+    _buffer_full_response,
+    _cached_response,
+    _etag_response,
+    _latest_logs_query,
+    _latest_misses,
+    _latest_rows,
+    _map_params,
+    _map_payload,
+    _parse_batch_body,
+    _parse_single_body,
+    _parse_visit_ids,
+    _since_fields,
+    _sparkline_params,
+    _summary_body,
+    _summary_from,
+    _summary_visits,
+    _summary_wanted,
+    _telemetry_error,
+    _waiting_order,
+    _waiting_queue,
+    _with_since_fields,
+)
+
+
+# -----------------------------
+# IoT API
+# -----------------------------
+@metrics.instrument("async_iot_telemetry")
+@csrf_exempt
+@require_POST
+async def iot_telemetry(request):
+    """POST /async/api/iot/telemetry/ (body เหมือน views.iot_telemetry)"""
+    try:
+        device = await aauthenticate_device(request)
+        log = _parse_single_body(request, device)
+    except TelemetryError as e:
+        return _telemetry_error(e.message, e.status)
+
+    if await amissing_visit_ids([log]):
+        return _telemetry_error("Visit not found", 404)
+
+    if is_buffered():
+        if not get_buffer().offer([log]):
+            return _buffer_full_response()
+        return JsonResponse({"ok": True, "queued": True}, status=202)
+
+    await sync_to_async(ingest_logs)([log])
+    return JsonResponse({"ok": True, "log_id": log.id})
+
+
+@metrics.instrument("async_iot_telemetry_batch")
+@csrf_exempt
+@require_POST
+async def iot_telemetry_batch(request):
+    """POST /async/api/iot/telemetry/batch/ (body เหมือน views.iot_telemetry_batch)"""
+    try:
+        device = await aauthenticate_device(request)
+        entries = _parse_batch_body(request, device)
+    except TelemetryError as e:
+        return _telemetry_error(e.message, e.status)
+
+    missing = await amissing_visit_ids([e for e in entries if not isinstance(e, TelemetryError)])
+    results, good = _batch_results(entries, missing)
+
+    queued = is_buffered()
+    if queued:
+        if not get_buffer().offer([log for _, log in good]):
+            return _buffer_full_response()
+    else:
+        await sync_to_async(ingest_logs)([log for _, log in good])
+
+    return _batch_response(entries, results, good, queued)
+
+
+# -----------------------------
+# MONITOR API
+# -----------------------------
+@metrics.instrument("async_monitor_latest_api")
+@login_required
+async def monitor_latest_api(request):
+    now = timezone.now()
+    offline_after = now - timedelta(seconds=LATEST_ONLINE_SECONDS)
+    try:
+        changed = await _changed_since(request, now, LATEST_ONLINE_SECONDS)
+    except ValueError as e:
+        return JsonResponse({"ok": False, "error": str(e)}, status=400)
+    store = await sync_to_async(recent.get_store)()
+
+    q_items = [q async for q in _waiting_queue()]
+    order = [q.visit_id for q in q_items]
+    if changed is not None:
+        q_items = [q for q in q_items if q.visit_id in changed]
+
+    misses = _latest_misses(q_items, store)
+    logs = {log.visit_id: log async for log in _latest_logs_query(misses)} if misses else {}
+    rows = _latest_rows(q_items, logs, store, offline_after)
+
+    return _etag_response(request, {"ok": True, "rows": rows, **_since_fields(changed, order, now)})
+
+
+# ---------- helpers (async ORM ของ views._changed_since / _summary_payload / ...) ----------
+async def _changed_since(request, now, online_seconds):
+    since = snapshots.parse_cursor(request.GET.get("since"))
+    if since is None:
+        return None
+    return await snapshots.achanged_visit_ids(since, now, online_seconds)
+
+
+async def _waiting_order_async():
+    if queue_index.is_enabled():
+        return await sync_to_async(_waiting_order)()
+    return [vid async for vid in _waiting_queue().values_list("visit_id", flat=True)]
+
+
+async def _summary_payload(changed=None, now=None):
+    now = now or timezone.now()
+    order = await _waiting_order_async()
+    wanted = _summary_wanted(order, changed)
+    visits = {v.id: v async for v in _summary_visits(wanted)}
+    return _summary_from(order, changed, wanted, visits, now)
+
+
+async def _build_summary_body():
+    now = timezone.now()
+    payload, _ = await _summary_payload(None, now)
+    return _summary_body(payload, now)
+
+
+@metrics.instrument("async_monitor_summary_api")
+@login_required
+async def monitor_summary_api(request):
+    if not request.GET.get("since"):
+        max_age = summary_cache.ttl()
+        if max_age > 0:
+            entry = await summary_cache.summary_cache.aget(_build_summary_body, max_age)
+            return _cached_response(request, entry)
+    now = timezone.now()
+    try:
+        changed = await _changed_since(request, now, SUMMARY_ONLINE_SECONDS)
+    except ValueError as e:
+        return JsonResponse({"ok": False, "error": str(e)}, status=400)
+    payload, _ = await _summary_payload(changed, now)
+    return _etag_response(request, _with_since_fields(payload, changed, now))
+
+
+async def _sparkline_data(visit_ids, n, series, resolution):
+    store = await sync_to_async(recent.get_store)() if resolution is None else None
+    if store is None:
+        return await sparklines.afetch(visit_ids, n, series, resolution)
+
+    data, missing = store.sparklines(visit_ids, n, {name: sparklines.SERIES[name] for name in series})
+    if missing:
+        data.update(await sparklines.afetch(missing, n, series))
+    return data
+
+
+@metrics.instrument("async_monitor_sparklines_api")
+@login_required
+@require_GET
+async def monitor_sparklines_api(request):
+    now = timezone.now()
+    try:
+        n, series, resolution = _sparkline_params(request)
+        visit_ids = _parse_visit_ids(request)
+        changed = await _changed_since(request, now, 0) if visit_ids else None
+    except ValueError as e:
+        return JsonResponse({"ok": False, "error": str(e)}, status=400)
+    if changed is not None:
+        visit_ids = [vid for vid in visit_ids if vid in changed]
+
+    data = await _sparkline_data(visit_ids, n, series, resolution) if visit_ids else {}
+    return _etag_response(request, {"ok": True, "series": data, "cursor": snapshots.cursor_for(now)})
+
+
+@metrics.instrument("async_monitor_map_api")
+@login_required
+@require_GET
+async def monitor_map_api(request):
+    try:
+        bbox, zoom = _map_params(request)
+    except ValueError as e:
+        return JsonResponse({"ok": False, "error": str(e)}, status=400)
+    return _etag_response(request, _map_payload(await geo.aget_index(), bbox, zoom))
+
+
+# -----------------------------
+# LIVE (Server-Sent Events)
+# -----------------------------
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n"
+
+
+async def _stream_events(sub):
+    """
+    snapshot ทั้งคิวครั้งแรก แล้วส่งเฉพาะแถวที่เปลี่ยน (event: rows)
+    - รวมการเปลี่ยนที่เข้ามาภายใน MONITOR_STREAM_COALESCE วินาทีเป็นครั้งเดียว
+    - แถวที่ ONLINE จะถูกส่งซ้ำเมื่อถึงเวลากลายเป็น OFFLINE (ไม่มี event จาก DB ให้)
+    - ไม่มีอะไรเลยใน MONITOR_STREAM_KEEPALIVE วินาที → ส่ง comment กัน proxy ตัดสาย
+    """
+    keepalive = getattr(settings, "MONITOR_STREAM_KEEPALIVE", 15.0)
+    coalesce = getattr(settings, "MONITOR_STREAM_COALESCE", 1.0)
+    try:
+        payload, offline_at = await _summary_payload()
+        yield _sse("snapshot", payload)
+
+        while True:
+            timeout = keepalive
+            if offline_at:
+                due = (min(offline_at.values()) - timezone.now()).total_seconds()
+                timeout = max(0.0, min(timeout, due))
+            try:
+                changed = await asyncio.wait_for(sub.get(), timeout)
+                await asyncio.sleep(coalesce)
+                changed |= sub.drain()
+            except asyncio.TimeoutError:
+                changed = set()
+
+            now = timezone.now()
+            changed |= {vid for vid, at in offline_at.items() if at <= now}
+            if not changed:
+                yield ": keepalive\n\n"
+                continue
+
+            for vid in changed:
+                offline_at.pop(vid, None)
+            payload, still_online = await _summary_payload(changed)
+            offline_at.update(still_online)
+            yield _sse("rows", payload)
+    finally:
+        events.broker.unsubscribe(sub)
+
+
+@login_required
+@require_GET
+async def monitor_stream(request):
+    """
+    GET /async/monitor/api/stream/  (text/event-stream)
+    event: snapshot → {items, order, server_time}  (เหมือน monitor_summary_api + order)
+    event: rows     → {items ที่เปลี่ยน, order, removed, server_time}
+    ต้องรันผ่าน ASGI (WSGI จะถือ worker ไว้ทั้ง connection) → ตอบ 503 ให้ client กลับไป polling
+    """
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({"ok": False, "error": "Live stream requires ASGI"}, status=503)
+
+    resp = StreamingHttpResponse(_stream_events(events.broker.subscribe()), content_type="text/event-stream")
+    resp["Cache-Control"] = "no-cache"
+    resp["X-Accel-Buffering"] = "no"  # nginx: ไม่ buffer
+    return resp
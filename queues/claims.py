@@ -0,0 +1,116 @@
+"""
+เรียกคิวแบบ atomic: หลายจุดเรียก (station) เรียกพร้อมกันได้โดยไม่มีใครได้ผู้ป่วยคนเดียวกัน
+
+- DB ที่มี SELECT ... FOR UPDATE SKIP LOCKED (PostgreSQL / MySQL 8 / Oracle):
+  lock แถวแรกที่ยังไม่มีใคร lock แล้วเปลี่ยนเป็น CALLED ใน transaction เดียว
+  station อื่นข้ามแถวที่ถูก lock ไปแถวถัดไปทันที ไม่ต้องรอกัน
+- SQLite (lock ทั้งไฟล์ ไม่มี row lock): compare-and-set
+  UPDATE ... SET status='CALLED' WHERE visit_id=? AND status='WAITING'
+  เปลี่ยนได้ 0 แถว = มีคนได้ไปแล้ว → ลองคนถัดไป
+
+scripts/bench_call_next.py: จำลองหลาย station แล้วนับ claim/วินาที และการได้คนซ้ำ
+"""
+from django.db import connection, transaction
+from django.db.models.signals import post_save
+from django.utils import timezone
+
+from . import metrics, queue_index
+from .models import Queue
+
+CANDIDATES = 5  # compare-and-set: ดึงคนต้นคิวมาทีละกี่คน (แพ้คนแรกแล้วลองคนถัดไปโดยไม่ต้อง query ใหม่)
+
+
+def _waiting():
+    return Queue.objects.filter(status=Queue.Status.WAITING)
+
+
+def _load(visit_id):
+    # โหลดก่อน UPDATE: receiver (stats) เห็นสถานะเดิมเป็น WAITING ถูกต้อง
+    return _waiting().select_related("visit").filter(visit_id=visit_id).first()
+
+
+def _claim(q):
+    """True ถ้าเราเป็นคนเปลี่ยน WAITING → CALLED"""
+    return _waiting().filter(pk=q.pk).update(status=Queue.Status.CALLED) == 1
+
+
+def _called(q, now):
+    # UPDATE ไม่ผ่าน save() → ส่ง post_save เองให้ receiver (queue_index / recent / events / snapshot)
+    q.status = Queue.Status.CALLED
+    post_save.send(
+        sender=Queue, instance=q, created=False, update_fields=frozenset({"status"}),
+        raw=False, using=q._state.db,
+    )
+    return _mark_visit(q, now)
+
+
+def _mark_visit(q, now):
+    visit = q.visit
+    visit.called_at = now or timezone.now()
+    visit.save(update_fields=["called_at"])
+    metrics.queue_actions.inc("call")
+    metrics.queue_wait.observe((visit.called_at - visit.registered_at).total_seconds())
+    return visit
+
+
+def call_visit(visit_id, now=None):
+    """เรียก visit ที่ระบุ  return: Visit ถ้าเรียกสำเร็จ, None ถ้าไม่ได้รออยู่ / มีคนเรียกไปแล้ว"""
+    with transaction.atomic():
+        q = _load(visit_id)
+        if q is None or not _claim(q):
+            return None
+        return _called(q, now)
+
+
+def _candidates(n, use_index):
+    index = queue_index.get_index() if use_index else None
+    if index is not None:
+        return index.top(n)
+    return list(
+        _waiting().order_by("priority", "created_at", "id").values_list("visit_id", flat=True)[:n]
+    )
+
+
+def _call_next_skip_locked(now):
+    with transaction.atomic():
+        q = (
+            _waiting()
+            .select_for_update(skip_locked=True)
+            .order_by("priority", "created_at", "id")
+            .first()
+        )
+        if q is None:
+            return None
+        q.status = Queue.Status.CALLED
+        q.save(update_fields=["status"])
+        return _mark_visit(q, now)
+
+
+def _call_next_cas(now):
+    use_index = True
+    while True:
+        candidates = _candidates(CANDIDATES, use_index)
+        if not candidates:
+            if use_index:
+                use_index = False  # index ว่างอาจแค่ช้ากว่า DB → ยืนยันกับ DB ก่อน
+                continue
+            return None
+        for visit_id in candidates:
+            with transaction.atomic():
+                q = _load(visit_id)
+                if q is not None and _claim(q):
+                    return _called(q, now)
+        # แพ้ทั้งชุด: station อื่นได้ไปแล้ว (หรือ index ช้ากว่า DB) → รอบต่อไปถาม DB
+        # ทุกรอบที่อ่านจาก DB แล้วแพ้แปลว่ามีคนได้ จึงวนไม่จบไม่ได้
+        use_index = False
+
+
+def call_next(now=None):
+    """เรียกคนถัดไป (priority แล้วมาก่อนก่อน)  return: Visit ที่ได้ หรือ None ถ้าไม่มีคิวรอ"""
+    if connection.features.has_select_for_update_skip_locked:
+        visit = _call_next_skip_locked(now)
+    else:
+        visit = _call_next_cas(now)
+    if visit is None:
+        metrics.queue_actions.inc("call_next_empty")
+    return visit
@@ -0,0 +1,165 @@
+"""
+Device authentication cache + การเขียน last_seen แบบรวบ (coalesced)
+
+- credential ที่ผ่านแล้วจะถูกจำไว้ DEVICE_AUTH_CACHE_TTL วินาที
+  (ล้างทันทีเมื่อ Device ถูก save/delete ดู queues/signals.py)
+- last_seen ไม่เขียนทุก reading แต่เก็บค่าล่าสุดไว้ในหน่วยความจำ
+  แล้ว thread เบื้องหลัง flush ด้วย bulk_update ครั้งเดียวทุก DEVICE_LAST_SEEN_FLUSH_INTERVAL วินาที
+  (และตอนปิด process)
+"""
+import atexit
+import hmac
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+
+from .models import Device
+
+logger = logging.getLogger(__name__)
+
+
+class DeviceCredentialCache:
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self._entries = {}  # device_id -> (api_key, Device, expires_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _cached(self, device_id, api_key):
+        with self._lock:
+            entry = self._entries.get(device_id)
+            if entry is not None:
+                cached_key, device, expires_at = entry
+                # เทียบเป็น bytes: compare_digest กับ str ที่มีอักษรนอก ASCII โยน TypeError (header เพี้ยน → 500)
+                if expires_at > time.monotonic() and hmac.compare_digest(cached_key.encode(), api_key.encode()):
+                    self.hits += 1
+                    return device
+            self.misses += 1
+            return None
+
+    def _store(self, device_id, api_key, device):
+        with self._lock:
+            self._entries[device_id] = (api_key, device, time.monotonic() + self.ttl)
+        return device
+
+    def get(self, device_id, api_key):
+        """Device ที่ active และ key ถูก หรือ None"""
+        device = self._cached(device_id, api_key)
+        if device is not None:
+            return device
+        try:
+            device = Device.objects.get(device_id=device_id, api_key=api_key, is_active=True)
+        except Device.DoesNotExist:
+            return None
+        return self._store(device_id, api_key, device)
+
+    async def aget(self, device_id, api_key):
+        device = self._cached(device_id, api_key)
+        if device is not None:
+            return device
+        try:
+            device = await Device.objects.aget(device_id=device_id, api_key=api_key, is_active=True)
+        except Device.DoesNotExist:
+            return None
+        return self._store(device_id, api_key, device)
+
+    def invalidate(self, device):
+        """ล้าง entry ของ device นี้ (รวมกรณีเปลี่ยน device_id)"""
+        with self._lock:
+            self._entries.pop(device.device_id, None)
+            stale = [k for k, (_, d, _) in self._entries.items() if d.pk == device.pk]
+            for k in stale:
+                del self._entries[k]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class LastSeenTracker:
+    def __init__(self, flush_interval=30.0):
+        self.flush_interval = flush_interval
+        self._pending = {}  # device pk -> datetime ล่าสุด
+        self._lock = threading.Lock()
+        self._thread = None
+        self.flush_count = 0
+
+    def touch(self, device_pk, when):
+        with self._lock:
+            prev = self._pending.get(device_pk)
+            if prev is None or when > prev:
+                self._pending[device_pk] = when
+        self._ensure_started()
+
+    # ---------- timer ----------
+    def _ensure_started(self):
+        """thread เบื้องหลัง flush ทุก flush_interval (device ที่เงียบไปก็ได้ค่าสุดท้ายลง DB)"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="device-last-seen", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("could not flush device last_seen")
+            finally:
+                close_old_connections()
+
+    def flush(self):
+        """เขียน last_seen ที่ค้างทั้งหมดด้วย UPDATE เดียว (พลาด → คืนค่ากลับไปรอรอบหน้า)"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        try:
+            Device.objects.bulk_update(
+                [Device(pk=pk, last_seen=ts) for pk, ts in pending.items()],
+                ["last_seen"],
+            )
+        except Exception:
+            with self._lock:
+                for pk, ts in pending.items():
+                    if pk not in self._pending or ts > self._pending[pk]:
+                        self._pending[pk] = ts
+            raise
+        self.flush_count += 1
+        return len(pending)
+
+    def pending(self):
+        return dict(self._pending)
+
+
+credential_cache = DeviceCredentialCache(
+    ttl=getattr(settings, "DEVICE_AUTH_CACHE_TTL", 60),
+)
+last_seen_tracker = LastSeenTracker(
+    flush_interval=getattr(settings, "DEVICE_LAST_SEEN_FLUSH_INTERVAL", 30.0),
+)
+
+
+def _flush_on_exit():
+    if not last_seen_tracker.pending():
+        return
+    try:
+        # ตารางหายไปแล้ว (เช่น test database ถูกลบก่อน atexit) → ไม่มีที่ให้เขียน
+        if Device._meta.db_table not in connection.introspection.table_names():
+            return
+        last_seen_tracker.flush()
+    except Exception as e:
+        logger.warning("could not flush device last_seen on exit: %s", e)
+    finally:
+        close_old_connections()
+
+
+atexit.register(_flush_on_exit)
@@ -0,0 +1,105 @@
+"""
+Live updates: pub/sub ในหน่วยความจำ (ตัวแทน Redis / channel layer บนเครื่องเดียว)
+
+ฝั่งเขียน (sync: ingest / signals / views) เรียก visits_changed() หรือ publish_on_commit()
+ฝั่งอ่าน (async: SSE stream ใน async_views.monitor_stream) subscribe() แล้ว await sub.get()
+
+แต่ละ subscriber เก็บ visit_id ที่เปลี่ยนเป็น set รอไว้ → telemetry ถี่ ๆ ถูกรวมเป็นครั้งเดียวเอง
+ไม่มี queue ยาวค้างถ้า client อ่านช้า
+
+listener (sync callback ใน process เดียวกัน เช่น summary_cache.invalidate) ลงทะเบียนด้วย
+add_listener() แล้วถูกเรียกทุกครั้งที่มีการเปลี่ยน
+
+subscriber ต้องอยู่ process เดียวกับคนเขียน ถ้ารันหลาย worker ให้เปลี่ยน broker
+เป็นตัวที่ข้าม process ได้ (interface เดียวกัน: subscribe / unsubscribe / publish)
+"""
+import asyncio
+import threading
+
+from django.db import transaction
+
+
+class Subscription:
+    def __init__(self, loop):
+        self.loop = loop
+        self._pending = set()
+        self._ready = asyncio.Event()
+
+    def _put(self, visit_ids):
+        # รันใน event loop ของ subscriber เสมอ (ผ่าน call_soon_threadsafe)
+        self._pending.update(visit_ids)
+        self._ready.set()
+
+    async def get(self):
+        """รอจนมีการเปลี่ยน → set ของ visit_id ที่เปลี่ยนตั้งแต่ครั้งก่อน"""
+        await self._ready.wait()
+        return self.drain()
+
+    def drain(self):
+        """เอาที่ค้างอยู่ทั้งหมดโดยไม่รอ (อาจว่าง)"""
+        self._ready.clear()
+        changed, self._pending = self._pending, set()
+        return changed
+
+
+class InMemoryBroker:
+    def __init__(self):
+        self._subs = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self):
+        """เรียกจาก async code (ใช้ event loop ที่กำลังรัน)"""
+        sub = Subscription(asyncio.get_running_loop())
+        with self._lock:
+            self._subs.add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self._subs.discard(sub)
+
+    def publish(self, visit_ids):
+        """เรียกได้จากทุก thread"""
+        visit_ids = frozenset(visit_ids)
+        if not visit_ids:
+            return
+        with self._lock:
+            subs = list(self._subs)
+        for sub in subs:
+            try:
+                sub.loop.call_soon_threadsafe(sub._put, visit_ids)
+            except RuntimeError:  # event loop ปิดไปแล้ว
+                self.unsubscribe(sub)
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subs)
+
+
+broker = InMemoryBroker()
+_listeners = []
+
+
+def add_listener(callback):
+    """callback(frozenset ของ visit_id)  เรียกใน thread ของคนเขียน ต้องเร็วและไม่ raise"""
+    if callback not in _listeners:
+        _listeners.append(callback)
+
+
+def _notify(visit_ids):
+    for callback in list(_listeners):
+        callback(visit_ids)
+    broker.publish(visit_ids)
+
+
+def visits_changed(visit_ids):
+    visit_ids = frozenset(visit_ids)
+    if visit_ids:
+        _notify(visit_ids)
+
+
+def publish_on_commit(visit_ids):
+    """แจ้งหลัง transaction commit (ไม่มี transaction → แจ้งทันที)"""
+    visit_ids = frozenset(visit_ids)
+    if visit_ids:
+        transaction.on_commit(lambda: _notify(visit_ids))
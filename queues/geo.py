@@ -0,0 +1,188 @@
+"""
+Map: ตำแหน่งล่าสุดของ visit ที่อยู่ในคิว + clustering ฝั่ง server
+
+- index: grid ขนาด INDEX_CELL_DEG องศา เก็บในหน่วยความจำ สร้างจาก VisitSnapshot (query เดียว)
+  สร้างใหม่เมื่อมีการเปลี่ยน (events → invalidate) หรือเก่ากว่า MAP_INDEX_TTL วินาที
+  (SingleFlightCache เดียวกับ summary_cache: miss พร้อมกันสร้างครั้งเดียว)
+- query(bbox): อ่านเฉพาะช่อง grid ที่ทับกรอบที่เห็น
+- cluster(): รวมจุดที่อยู่ช่องเดียวกันบน grid pixel (Web Mercator) ของ zoom นั้น
+  ช่องเกิน MAP_MAX_CLUSTERS → ขยายช่องเท่าตัวจนพอ  payload จึงมีขนาดจำกัดไม่ว่าผู้ป่วยกี่คน
+"""
+import math
+from collections import namedtuple
+
+from django.conf import settings
+
+from .models import VisitSnapshot
+from .recent import ACTIVE_STATUSES
+from .summary_cache import SingleFlightCache
+
+TILE_SIZE = 256
+MAX_ZOOM = 22
+DEFAULT_ZOOM = 13
+MAX_LAT = 85.05112878  # ขอบของ Web Mercator
+INDEX_CELL_DEG = 0.05
+WORLD = (-180.0, -90.0, 180.0, 90.0)
+SEVERITY_RANK = {"RED": 0, "YELLOW": 1, "GREEN": 2}
+
+Point = namedtuple("Point", "visit_id lat lng severity patient_name gps_ts last_log_ts")
+
+
+def parse_bbox(value):
+    """"minLng,minLat,maxLng,maxLat" → tuple (ตัดให้อยู่ในโลก)  "" → ทั้งโลก  ผิดรูป → ValueError"""
+    if value in (None, ""):
+        return WORLD
+    try:
+        min_lng, min_lat, max_lng, max_lat = (float(x) for x in value.split(","))
+    except ValueError:
+        raise ValueError("bbox must be minLng,minLat,maxLng,maxLat")
+    if not all(math.isfinite(x) for x in (min_lng, min_lat, max_lng, max_lat)):
+        raise ValueError("bbox must be finite numbers")
+    if min_lng > max_lng or min_lat > max_lat:
+        raise ValueError("bbox min must not exceed max")
+    # Leaflet ซูมออกสุดแล้ว lng เกิน ±180 ได้
+    return (max(min_lng, -180.0), max(min_lat, -90.0), min(max_lng, 180.0), min(max_lat, 90.0))
+
+
+def parse_zoom(value):
+    if value in (None, ""):
+        return DEFAULT_ZOOM
+    try:
+        zoom = int(value)
+    except ValueError:
+        raise ValueError("zoom must be an integer")
+    if not 0 <= zoom <= MAX_ZOOM:
+        raise ValueError(f"zoom must be between 0 and {MAX_ZOOM}")
+    return zoom
+
+
+def world_px(lat, lng, zoom):
+    """พิกัด → pixel บนแผนที่ทั้งโลกที่ zoom นั้น (แบบเดียวกับ tile ของ Leaflet / OSM)"""
+    scale = TILE_SIZE * (1 << zoom)
+    s = math.sin(math.radians(max(min(lat, MAX_LAT), -MAX_LAT)))
+    x = (lng + 180.0) / 360.0 * scale
+    y = (0.5 - math.log((1 + s) / (1 - s)) / (4 * math.pi)) * scale
+    return x, y
+
+
+class GridIndex:
+    def __init__(self, points, cell=INDEX_CELL_DEG):
+        self.cell = cell
+        self.size = len(points)
+        self.cells = {}
+        for p in points:
+            self.cells.setdefault(self._key(p.lat, p.lng), []).append(p)
+
+    def _key(self, lat, lng):
+        return (math.floor(lng / self.cell), math.floor(lat / self.cell))
+
+    def query(self, bbox):
+        min_lng, min_lat, max_lng, max_lat = bbox
+        x0, y0 = self._key(min_lat, min_lng)
+        x1, y1 = self._key(max_lat, max_lng)
+        if (x1 - x0 + 1) * (y1 - y0 + 1) > len(self.cells):
+            # กรอบใหญ่กว่าจำนวนช่องที่มีจุด → ไล่ช่องที่มีอยู่แทน
+            keys = [k for k in self.cells if x0 <= k[0] <= x1 and y0 <= k[1] <= y1]
+        else:
+            keys = [(x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)]
+
+        out = []
+        for key in keys:
+            for p in self.cells.get(key, ()):
+                if min_lng <= p.lng <= max_lng and min_lat <= p.lat <= max_lat:
+                    out.append(p)
+        return out
+
+
+def _points_query():
+    return (
+        VisitSnapshot.objects
+        .filter(lat__isnull=False, lng__isnull=False, visit__queue__status__in=ACTIVE_STATUSES)
+        .values_list(
+            "visit_id", "lat", "lng", "gps_ts", "last_log_ts",
+            "visit__final_severity", "visit__patient__first_name", "visit__patient__last_name",
+        )
+    )
+
+
+def _point(row):
+    vid, lat, lng, gps_ts, last_log_ts, severity, first, last = row
+    return Point(vid, float(lat), float(lng), severity, f"{first} {last}", gps_ts, last_log_ts)
+
+
+def _build_index():
+    return GridIndex([_point(row) for row in _points_query()])
+
+
+async def _abuild_index():
+    return GridIndex([_point(row) async for row in _points_query()])
+
+
+_index = SingleFlightCache()
+
+
+def invalidate(*args):
+    _index.invalidate()
+
+
+def _max_age():
+    return getattr(settings, "MAP_INDEX_TTL", 5.0)
+
+
+def get_index():
+    return _index.get(_build_index, _max_age()).value
+
+
+async def aget_index():
+    return (await _index.aget(_abuild_index, _max_age())).value
+
+
+def cluster(points, zoom, cell_px=None, limit=None):
+    """points → list ของกลุ่ม (list ของ Point) ไม่เกิน limit กลุ่ม"""
+    cell_px = cell_px or getattr(settings, "MAP_CLUSTER_CELL_PX", 60)
+    limit = limit or getattr(settings, "MAP_MAX_CLUSTERS", 300)
+    if zoom >= getattr(settings, "MAP_CLUSTER_MAX_ZOOM", 18):
+        cell_px = 1  # ซูมใกล้สุด: แยกทุกจุด (เว้นแต่ทับกันพอดี)
+
+    px = [world_px(p.lat, p.lng, zoom) for p in points]
+    while True:
+        groups = {}
+        for p, (x, y) in zip(points, px):
+            groups.setdefault((int(x // cell_px), int(y // cell_px)), []).append(p)
+        if len(groups) <= limit:
+            return list(groups.values())
+        cell_px *= 2
+
+
+def _worst(severities):
+    return min(severities, key=lambda s: SEVERITY_RANK.get(s, len(SEVERITY_RANK)))
+
+
+def cluster_items(points, zoom, now, online_seconds):
+    items = []
+    for group in cluster(points, zoom):
+        if len(group) == 1:
+            p = group[0]
+            online = bool(p.last_log_ts) and (now - p.last_log_ts).total_seconds() <= online_seconds
+            items.append({
+                "type": "point",
+                "visit_id": p.visit_id,
+                "patient_name": p.patient_name,
+                "severity": p.severity,
+                "online": online,
+                "lat": p.lat,
+                "lng": p.lng,
+                "updated_at": p.gps_ts.isoformat() if p.gps_ts else None,
+            })
+            continue
+        lats = [p.lat for p in group]
+        lngs = [p.lng for p in group]
+        items.append({
+            "type": "cluster",
+            "count": len(group),
+            "severity": _worst(p.severity for p in group),
+            "lat": sum(lats) / len(lats),
+            "lng": sum(lngs) / len(lngs),
+            "bounds": [[min(lats), min(lngs)], [max(lats), max(lngs)]],
+        })
+    return items
@@ -0,0 +1,204 @@
+"""
+Write-behind buffer สำหรับ telemetry (TELEMETRY_INGEST_MODE = "buffered")
+
+view ตรวจ payload แล้วโยน TelemetryLog (ยังไม่ save) เข้า buffer แล้วตอบ 202 ทันที
+thread เบื้องหลังจะ drain buffer ลง DB ผ่าน telemetry.ingest_logs ทีละ batch
+(ครบ TELEMETRY_FLUSH_BATCH ตัว หรือทุก TELEMETRY_FLUSH_INTERVAL วินาที แล้วแต่อะไรถึงก่อน)
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class TelemetryBuffer:
+    def __init__(self, max_size=10000, batch_size=500, flush_interval=1.0, sink=None):
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._sink = sink  # callable(list[TelemetryLog]) ที่เขียนลง DB
+
+        self._items = deque()
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()  # กัน flush ซ้อนกัน (thread กับ shutdown)
+        self._thread = None
+        self._stopping = False
+
+        # counters
+        self.accepted = 0
+        self.rejected = 0
+        self.flushed = 0
+        self.failed = 0
+        self.flush_count = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+
+    # ---------- producer ----------
+    def offer(self, logs):
+        """
+        ใส่ logs ทั้งชุดเข้า buffer (all-or-nothing)
+        return False ถ้าเต็ม → view ตอบ 429 ให้อุปกรณ์ถอยแล้วส่งใหม่
+        """
+        with self._cond:
+            if len(self._items) + len(logs) > self.max_size:
+                self.rejected += len(logs)
+                metrics.telemetry_readings.inc("buffer_full", amount=len(logs))
+                return False
+            now = time.monotonic()
+            for log in logs:
+                log._queued_at = now  # วัด flush lag (metrics)
+            self._items.extend(logs)
+            self.accepted += len(logs)
+            metrics.telemetry_readings.inc("queued", amount=len(logs))
+            if len(self._items) >= self.batch_size:
+                self._cond.notify()
+        self._ensure_started()
+        return True
+
+    def depth(self):
+        return len(self._items)
+
+    def oldest_age(self):
+        """วินาทีที่ reading เก่าสุดใน buffer รอมาแล้ว (ว่าง = 0)"""
+        items = self._items
+        try:
+            return time.monotonic() - items[0]._queued_at
+        except IndexError:
+            return 0.0
+
+    # ---------- consumer ----------
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._cond:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping = False
+            self._thread = threading.Thread(
+                target=self._run, name="telemetry-flusher", daemon=True
+            )
+            self._thread.start()
+
+    def _take(self, limit):
+        batch = []
+        while self._items and len(batch) < limit:
+            batch.append(self._items.popleft())
+        return batch
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if len(self._items) < self.batch_size and not self._stopping:
+                    self._cond.wait(self.flush_interval)
+                if self._stopping and not self._items:
+                    return
+            try:
+                self.flush(max_batches=1)
+            finally:
+                close_old_connections()
+
+    def flush(self, max_batches=None):
+        """drain buffer ลง DB (max_batches=None = จนหมด) return จำนวนที่เขียนได้"""
+        written = 0
+        batches = 0
+        with self._flush_lock:
+            while max_batches is None or batches < max_batches:
+                with self._cond:
+                    batch = self._take(self.batch_size)
+                if not batch:
+                    break
+                batches += 1
+                written += self._write(batch)
+        return written
+
+    def _write(self, batch):
+        started = time.perf_counter()
+        queued_at = getattr(batch[0], "_queued_at", None)
+        if queued_at is not None:
+            metrics.telemetry_flush_lag.observe(time.monotonic() - queued_at)
+        written = 0
+        try:
+            self._sink(batch)
+            written = len(batch)
+        except Exception:
+            # ทั้ง batch พัง (เช่น visit ถูกลบไประหว่างรอ) → ลองทีละตัว ทิ้งเฉพาะตัวที่พัง
+            logger.exception("telemetry flush failed, retrying %d readings one by one", len(batch))
+            for log in batch:
+                log.pk = None
+                log._state.adding = True
+                try:
+                    self._sink([log])
+                    written += 1
+                except Exception:
+                    self.failed += 1
+                    logger.warning("dropping telemetry reading for visit %s", log.visit_id)
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.flushed += written
+        self.flush_count += 1
+        self.last_flush_ms = elapsed_ms
+        self.total_flush_ms += elapsed_ms
+        self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+        return written
+
+    def stop(self, timeout=10.0):
+        """หยุด thread แล้ว flush ที่ค้างทั้งหมด (เรียกตอน shutdown)"""
+        thread = self._thread
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if thread is not None and thread.is_alive():
+            thread.join(timeout)
+        try:
+            self.flush()
+        finally:
+            close_old_connections()
+
+    def stats(self):
+        return {
+            "depth": self.depth(),
+            "max_size": self.max_size,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "flushed": self.flushed,
+            "failed": self.failed,
+            "flush_count": self.flush_count,
+            "last_flush_ms": round(self.last_flush_ms, 3),
+            "max_flush_ms": round(self.max_flush_ms, 3),
+            "avg_flush_ms": round(self.total_flush_ms / self.flush_count, 3) if self.flush_count else 0.0,
+        }
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def is_buffered():
+    return getattr(settings, "TELEMETRY_INGEST_MODE", "sync") == "buffered"
+
+
+def get_buffer():
+    """buffer ตัวเดียวต่อ process (สร้างตอนใช้ครั้งแรก)"""
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                from .telemetry import ingest_logs
+
+                _buffer = TelemetryBuffer(
+                    max_size=getattr(settings, "TELEMETRY_BUFFER_MAX", 10000),
+                    batch_size=getattr(settings, "TELEMETRY_FLUSH_BATCH", 500),
+                    flush_interval=getattr(settings, "TELEMETRY_FLUSH_INTERVAL", 1.0),
+                    sink=ingest_logs,
+                )
+                atexit.register(_buffer.stop)
+    return _buffer
@@ -0,0 +1,59 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+from queues import archive
+from queues.models import TelemetryLog
+
+
+class Command(BaseCommand):
+    help = (
+        "ย้าย TelemetryLog เก่า / ของ visit ที่จบแล้ว ออกจากตารางหลักไปเป็นไฟล์ archive รายวัน "
+        "แล้วลบออกจาก DB ทีละ chunk (ตั้งเป็น cron วันละครั้งได้)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--older-than-days", type=float,
+            default=getattr(settings, "TELEMETRY_HOT_DAYS", 30),
+            help="ย้าย log ที่ ts เก่ากว่านี้ (วัน)",
+        )
+        parser.add_argument(
+            "--closed", action="store_true",
+            help="ย้าย log ทั้งหมดของ visit ที่คิวเป็น DONE/CANCELLED ด้วย",
+        )
+        parser.add_argument(
+            "--closed-min-age-hours", type=float, default=24,
+            help="ใช้กับ --closed: visit ต้องลงทะเบียนมาแล้วอย่างน้อยกี่ชั่วโมง",
+        )
+        parser.add_argument("--chunk-size", type=int, default=5000)
+        parser.add_argument("--dry-run", action="store_true", help="แค่นับ ไม่เขียนไฟล์/ไม่ลบ")
+        parser.add_argument(
+            "--reindex", action="store_true",
+            help="สร้าง index วัน/visit (TelemetryArchiveDay) จากไฟล์ archive ที่มีอยู่ แล้วจบ (ไม่ย้าย log)",
+        )
+
+    def handle(self, *args, **opts):
+        if opts["reindex"]:
+            pairs = archive.reindex()
+            self.stdout.write(self.style.SUCCESS(f"indexed {pairs} (visit, day) pairs from {archive.archive_dir()}"))
+            return
+
+        now = timezone.now()
+        cond = Q(ts__lt=now - timedelta(days=opts["older_than_days"]))
+        if opts["closed"]:
+            cond |= Q(
+                visit__queue__status__in=["DONE", "CANCELLED"],
+                visit__registered_at__lt=now - timedelta(hours=opts["closed_min_age_hours"]),
+            )
+
+        moved = archive.archive_queryset(
+            TelemetryLog.objects.filter(cond),
+            chunk_size=opts["chunk_size"],
+            dry_run=opts["dry_run"],
+        )
+        verb = "would archive" if opts["dry_run"] else "archived"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {moved} telemetry logs → {archive.archive_dir()}"))
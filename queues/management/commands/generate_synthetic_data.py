@@ -0,0 +1,67 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from queues import synth
+
+
+class Command(BaseCommand):
+    help = (
+        "สร้างข้อมูลสมมติทั้ง schema (ผู้ป่วย, visit, คิว, triage, อุปกรณ์, TelemetryLog หลักล้านแถว) "
+        "สำหรับทดสอบหน้า monitor / map ที่ปริมาณจริง  ใช้กับ DB ทดสอบเท่านั้น"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--preset", choices=sorted(synth.PRESETS), default="clinic")
+        parser.add_argument("--patients", type=int, help="แทนค่าใน preset")
+        parser.add_argument("--visits", type=int, help="แทนค่าใน preset")
+        parser.add_argument("--devices", type=int, help="แทนค่าใน preset")
+        parser.add_argument("--days", type=int, help="กระจาย visit ย้อนหลังกี่วัน (แทนค่าใน preset)")
+        parser.add_argument("--monitored", type=float, help="สัดส่วน visit ที่ติด monitor 0-1 (แทนค่าใน preset)")
+        parser.add_argument("--interval", type=float, dest="interval_s",
+                            help="วินาทีระหว่าง telemetry ของอุปกรณ์ (แทนค่าใน preset)")
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--chunk-size", type=int, default=5000, help="visit ต่อก้อน")
+        parser.add_argument("--batch-size", type=int, default=10000, help="TelemetryLog ต่อ bulk_create")
+        parser.add_argument("--rollups", action="store_true",
+                            help="สร้าง TelemetryRollup ด้วย (ช้า: ทำทีหลังด้วย rollup_telemetry ก็ได้)")
+        parser.add_argument("--dry-run", action="store_true", help="แค่แสดงจำนวนแถวโดยประมาณ")
+
+    def handle(self, *args, **opts):
+        cfg = dict(synth.PRESETS[opts["preset"]])
+        for key in cfg:
+            if opts.get(key) is not None:
+                cfg[key] = opts[key]
+        if min(cfg["patients"], cfg["visits"], cfg["devices"], cfg["days"]) < 1 or cfg["interval_s"] <= 0:
+            raise CommandError("patients, visits, devices, days and interval must be positive")
+        if not 0 <= cfg["monitored"] <= 1:
+            raise CommandError("--monitored must be between 0 and 1")
+
+        est = synth.estimate(cfg)
+        self.stdout.write(
+            f"{opts['preset']}: ~{est['patients']} patients, {est['visits']} visits, "
+            f"{est['devices']} devices, ~{est['telemetry_logs']} telemetry logs over {cfg['days']} days"
+        )
+        if opts["dry_run"]:
+            return
+
+        t0 = time.perf_counter()
+
+        def progress(c):
+            rate = c["telemetry_logs"] / (time.perf_counter() - t0)
+            self.stdout.write(
+                f"  visits {c['visits']}/{cfg['visits']}  telemetry {c['telemetry_logs']}  ({rate:.0f} logs/s)"
+            )
+
+        try:
+            counts = synth.generate(
+                cfg, seed=opts["seed"], chunk_size=opts["chunk_size"], batch_size=opts["batch_size"],
+                with_rollups=opts["rollups"], progress=progress,
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(
+            f"created {counts['patients']} patients, {counts['visits']} visits "
+            f"(ids {counts['visit_ids'][0]}-{counts['visit_ids'][1]}), {counts['devices']} devices, "
+            f"{counts['telemetry_logs']} telemetry logs in {time.perf_counter() - t0:.1f}s"
+        ))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from queues import snapshots
+
+
+class Command(BaseCommand):
+    help = "สร้าง VisitSnapshot ใหม่จาก VitalSign + TelemetryLog (backfill / ซ่อมข้อมูล)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--visit", type=int, action="append", dest="visits",
+                            help="visit id (ใส่ซ้ำได้) ไม่ใส่ = ทุก visit")
+        parser.add_argument("--chunk-size", type=int, default=500)
+
+    def handle(self, *args, **opts):
+        written = snapshots.rebuild(visit_ids=opts["visits"], chunk_size=opts["chunk_size"])
+        self.stdout.write(self.style.SUCCESS(f"rebuilt {written} visit snapshots"))
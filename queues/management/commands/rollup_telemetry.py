@@ -0,0 +1,35 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from queues import rollups
+
+
+class Command(BaseCommand):
+    help = "คำนวณ TelemetryRollup (1m/5m) ใหม่จาก TelemetryLog สำหรับข้อมูลที่มาช้าหรือย้อนหลัง"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--visit", type=int, action="append", dest="visits",
+                            help="visit id (ใส่ซ้ำได้) ไม่ใส่ = ทุก visit")
+        group = parser.add_mutually_exclusive_group()
+        group.add_argument("--since", help="ISO datetime เช่น 2025-12-17T08:00:00Z")
+        group.add_argument("--hours", type=float, help="ย้อนหลังกี่ชั่วโมงจากตอนนี้")
+        parser.add_argument("--all", action="store_true", help="คำนวณใหม่ทั้งหมด (ไม่จำกัดเวลา)")
+
+    def handle(self, *args, **opts):
+        since = None
+        if opts["since"]:
+            since = parse_datetime(opts["since"].replace("Z", "+00:00"))
+            if since is None:
+                raise CommandError("--since must be an ISO datetime")
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since)
+        elif opts["hours"] is not None:
+            since = timezone.now() - timedelta(hours=opts["hours"])
+        elif not opts["all"]:
+            raise CommandError("ระบุ --since, --hours หรือ --all")
+
+        written = rollups.rebuild(visit_ids=opts["visits"], since=since)
+        self.stdout.write(self.style.SUCCESS(f"rebuilt {written} rollup rows"))
@@ -0,0 +1,304 @@
+"""
+Metrics ในหน่วยความจำ + endpoint แบบ Prometheus text format (GET /metrics)
+
+- Counter / Gauge / Histogram (ช่องคงที่) มี label ได้ ทุกตัว thread-safe ด้วย lock ของตัวเอง
+  ต้นทุนต่อครั้ง = lock + dict lookup (+ bisect สำหรับ histogram) ไม่มี I/O
+- ค่าที่อ่านจากที่อื่นได้อยู่แล้ว (ความยาวคิว, buffer depth) ไม่นับเอง: คำนวณตอนถูก scrape (register_collector)
+- ไม่ต้องมี collector ภายนอก: scrape /metrics ตรง ๆ หรือเปิดดูด้วย browser / curl
+  ข้อมูลอยู่ใน process เดียว หลาย worker → แต่ละตัวตอบเฉพาะของตัวเอง (label ด้วย instance ฝั่ง Prometheus)
+
+สิทธิ์: staff หรือส่ง "Authorization: Bearer <METRICS_TOKEN>" (ไม่ตั้ง token → staff เท่านั้น)
+        ไม่ยกเว้น localhost: หลัง reverse proxy ทุก request มาจาก 127.0.0.1
+"""
+import functools
+import hmac
+import logging
+import math
+import threading
+import time
+from bisect import bisect_left
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse
+from django.views.decorators.http import require_GET
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    pairs += [f'{n}="{_escape(v)}"' for n, v in extra]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _num(v):
+    if v == math.inf:
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        return tuple(str(v) for v in labels)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help_text, labelnames=()):
+        super().__init__(name, help_text, labelnames)
+        self._values = {}
+
+    def inc(self, *labels, amount=1):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, k)} {_num(v)}" for k, v in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value, *labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}  # key → [ต่อช่อง (ไม่สะสม) ..., +Inf, sum]
+
+    def observe(self, value, *labels):
+        key = self._key(labels)
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            row[i] += 1
+            row[-1] += value
+
+    def count(self, *labels):
+        row = self._values.get(self._key(labels))
+        return sum(row[:-1]) if row else 0
+
+    def samples(self):
+        with self._lock:
+            items = sorted((k, list(row)) for k, row in self._values.items())
+        out = []
+        for key, row in items:
+            total = 0
+            for le, n in zip(self.buckets + (math.inf,), row[:-1]):
+                total += n
+                out.append(f"{self.name}_bucket{_labels(self.labelnames, key, [('le', _num(le))])} {total}")
+            out.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_num(row[-1])}")
+            out.append(f"{self.name}_count{_labels(self.labelnames, key)} {total}")
+        return out
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def add(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        return self.add(Counter(name, help_text, labelnames))
+
+    def gauge(self, name, help_text, labelnames=()):
+        return self.add(Gauge(name, help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.add(Histogram(name, help_text, labelnames, buckets))
+
+    def register_collector(self, fn):
+        """
+        fn() → list ของ metric ที่สร้างใหม่ทุกครั้ง (เรียกตอน scrape เท่านั้น)
+        ใช้เป็น decorator ได้
+        """
+        with self._lock:
+            self._collectors.append(fn)
+        return fn
+
+    def render(self):
+        lines = []
+        with self._lock:
+            metrics, collectors = list(self._metrics), list(self._collectors)
+        for fn in collectors:
+            try:
+                metrics.extend(fn())
+            except Exception:
+                # collector พัง (เช่น DB ล่ม) ไม่ทำให้ metric อื่นหายไปด้วย
+                logger.exception("metrics collector %s failed", getattr(fn, "__name__", fn))
+        for m in metrics:
+            lines.extend(m.header())
+            lines.extend(m.samples())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# -----------------------------
+# metrics
+# -----------------------------
+http_requests = registry.counter(
+    "hospital_http_requests_total", "Requests handled by instrumented views", ("view", "status"),
+)
+http_latency = registry.histogram(
+    "hospital_http_request_duration_seconds", "View latency", ("view",),
+)
+telemetry_readings = registry.counter(
+    "hospital_telemetry_readings_total", "Telemetry readings received, by outcome", ("result",),
+)
+telemetry_ingest = registry.histogram(
+    "hospital_telemetry_ingest_seconds", "Time to write one ingest batch to the DB (sync request or buffer flush)",
+)
+telemetry_flush_lag = registry.histogram(
+    "hospital_telemetry_flush_lag_seconds", "Time the oldest reading of a flushed batch waited in the buffer",
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0),
+)
+queue_actions = registry.counter(
+    "hospital_queue_actions_total", "Queue actions (register / triage / call)", ("action",),
+)
+queue_wait = registry.histogram(
+    "hospital_queue_wait_seconds", "Time from registration to being called",
+    buckets=(60, 300, 600, 900, 1800, 2700, 3600, 5400, 7200, 14400),
+)
+ai_triage = registry.counter(
+    "hospital_ai_triage_total", "AI triage results, by severity", ("severity",),
+)
+ai_triage_latency = registry.histogram(
+    "hospital_ai_triage_duration_seconds", "apply_ai_triage duration",
+)
+
+
+def _status_class(response):
+    # view โยน exception → Django ตอบ 500
+    return f"{response.status_code // 100}xx" if response is not None else "5xx"
+
+
+def instrument(view_name):
+    """นับ request + latency ของ view (sync หรือ async)  ใส่ไว้นอกสุดเพื่อรวม redirect login / 405 ด้วย"""
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @functools.wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                t0 = time.perf_counter()
+                response = None
+                try:
+                    response = await view(request, *args, **kwargs)
+                    return response
+                finally:
+                    http_latency.observe(time.perf_counter() - t0, view_name)
+                    http_requests.inc(view_name, _status_class(response))
+            return async_wrapper
+
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            t0 = time.perf_counter()
+            response = None
+            try:
+                response = view(request, *args, **kwargs)
+                return response
+            finally:
+                http_latency.observe(time.perf_counter() - t0, view_name)
+                http_requests.inc(view_name, _status_class(response))
+        return wrapper
+    return decorator
+
+
+# -----------------------------
+# collectors (อ่านตอน scrape)
+# -----------------------------
+@registry.register_collector
+def _queue_collector():
+    from . import stats
+
+    length = Gauge("hospital_queue_length", "Queue entries by status and priority", ("status", "priority"))
+    for (status, priority), n in stats.counts().items():
+        length.set(n, status, priority)
+    return [length]
+
+
+@registry.register_collector
+def _buffer_collector():
+    from . import ingest_buffer, recent
+
+    out = []
+    buf = ingest_buffer._buffer  # ยังไม่เคยใช้ → ไม่สร้าง (ไม่ start thread เพราะถูก scrape)
+    if buf is not None:
+        s = buf.stats()
+        depth = Gauge("hospital_telemetry_buffer_depth", "Readings waiting in the write-behind buffer")
+        depth.set(s["depth"])
+        oldest = Gauge("hospital_telemetry_buffer_oldest_seconds", "Age of the oldest reading still in the buffer")
+        oldest.set(buf.oldest_age())
+        totals = Counter("hospital_telemetry_buffer_total", "Write-behind buffer counters", ("event",))
+        for event in ("accepted", "rejected", "flushed", "failed"):
+            totals.inc(event, amount=s[event])
+        out += [depth, oldest, totals]
+    store = recent._store
+    if store is not None:
+        ring = Gauge("hospital_recent_ring_readings", "Readings held in the in-memory recent ring")
+        ring.set(store.stats()["readings"])
+        out.append(ring)
+    return out
+
+
+# -----------------------------
+# endpoint
+# -----------------------------
+def _allowed(request):
+    user = getattr(request, "user", None)
+    if user is not None and user.is_staff:
+        return True
+    token = getattr(settings, "METRICS_TOKEN", "")
+    if not token:
+        return False
+    given = request.headers.get("Authorization", "")
+    return hmac.compare_digest(given.encode(), f"Bearer {token}".encode())
+
+
+@require_GET
+def metrics_view(request):
+    """GET /metrics  Prometheus text exposition format 0.0.4"""
+    if not _allowed(request):
+        return HttpResponse("forbidden\n", status=403, content_type="text/plain")
+    return HttpResponse(registry.render(), content_type=CONTENT_TYPE)
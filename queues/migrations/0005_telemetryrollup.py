@@ -0,0 +1,34 @@
+# Generated by Django 6.0 on 2026-10-18 12:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('queues', '0004_visit_lat_visit_lng_visit_location_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TelemetryRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.PositiveIntegerField()),
+                ('metric', models.CharField(max_length=10)),
+                ('bucket', models.DateTimeField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('total', models.FloatField(default=0)),
+                ('min_value', models.FloatField()),
+                ('max_value', models.FloatField()),
+                ('last_value', models.FloatField()),
+                ('last_ts', models.DateTimeField()),
+                ('visit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='telemetry_rollups', to='queues.visit')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['visit', 'resolution', 'bucket'], name='queues_tele_visit_i_4b99ee_idx')],
+                'constraints': [models.UniqueConstraint(fields=('visit', 'resolution', 'metric', 'bucket'), name='uniq_rollup_visit_res_metric_bucket')],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 6.0 on 2026-10-18 12:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('queues', '0005_telemetryrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VisitSnapshot',
+            fields=[
+                ('visit', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='snapshot', serialize=False, to='queues.visit')),
+                ('bpm', models.IntegerField(blank=True, null=True)),
+                ('o2sat', models.IntegerField(blank=True, null=True)),
+                ('bt', models.FloatField(blank=True, null=True)),
+                ('rr', models.IntegerField(blank=True, null=True)),
+                ('sys_bp', models.IntegerField(blank=True, null=True)),
+                ('dia_bp', models.IntegerField(blank=True, null=True)),
+                ('vitals_updated_at', models.DateTimeField(blank=True, null=True)),
+                ('lat', models.DecimalField(blank=True, decimal_places=6, max_digits=9, null=True)),
+                ('lng', models.DecimalField(blank=True, decimal_places=6, max_digits=9, null=True)),
+                ('gps_ts', models.DateTimeField(blank=True, null=True)),
+                ('last_log_ts', models.DateTimeField(blank=True, null=True)),
+                ('last_device_id', models.CharField(blank=True, max_length=50, null=True)),
+            ],
+        ),
+    ]
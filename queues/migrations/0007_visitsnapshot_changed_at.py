@@ -0,0 +1,23 @@
+# Generated by Django 6.0 on 2026-10-18 13:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('queues', '0006_visitsnapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='visitsnapshot',
+            name='changed_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='visitsnapshot',
+            name='last_log_ts',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
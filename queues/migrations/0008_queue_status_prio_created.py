@@ -0,0 +1,17 @@
+# Generated by Django 6.0 on 2026-10-18 13:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('queues', '0007_visitsnapshot_changed_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='queue',
+            index=models.Index(fields=['status', 'priority', 'created_at'], name='queue_status_prio_created'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('queues', '0008_queue_status_prio_created'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TelemetryArchiveDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('visit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='telemetry_archive_days', to='queues.visit')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('visit', 'day'), name='uniq_archive_visit_day')],
+            },
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('queues', '0009_telemetryarchiveday'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VisitTombstone',
+            fields=[
+                ('visit_id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('deleted_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
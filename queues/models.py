@@ -50,6 +50,12 @@ class Queue(models.Model):
     priority = models.IntegerField(default=3)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # คิว WAITING เรียงตาม priority แล้วมาก่อนก่อน (queue_list / monitor / call next / stats)
+            models.Index(fields=["status", "priority", "created_at"], name="queue_status_prio_created"),
+        ]
+
 
 class TriageResult(models.Model):
     visit = models.OneToOneField(Visit, on_delete=models.CASCADE, related_name="triage_result")
@@ -101,3 +107,87 @@ class TelemetryLog(models.Model):
         indexes = [
             models.Index(fields=["visit", "ts"]),
         ]
+
+
+class TelemetryRollup(models.Model):
+    """
+    สรุป telemetry ต่อ visit ต่อ vital ต่อช่วงเวลา (1 นาที / 5 นาที)
+    อัปเดตทีละน้อยตอน ingest (queues/rollups.py) และซ่อมด้วย manage.py rollup_telemetry
+    """
+    visit = models.ForeignKey(Visit, on_delete=models.CASCADE, related_name="telemetry_rollups")
+    resolution = models.PositiveIntegerField()  # วินาที: 60 / 300
+    metric = models.CharField(max_length=10)    # bpm / o2sat / bt / rr / sys_bp / dia_bp
+    bucket = models.DateTimeField()             # เวลาเริ่มของช่วง
+
+    count = models.PositiveIntegerField(default=0)
+    total = models.FloatField(default=0)
+    min_value = models.FloatField()
+    max_value = models.FloatField()
+    last_value = models.FloatField()
+    last_ts = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["visit", "resolution", "metric", "bucket"],
+                name="uniq_rollup_visit_res_metric_bucket",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["visit", "resolution", "bucket"]),
+        ]
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+
+class TelemetryArchiveDay(models.Model):
+    """
+    ไฟล์ archive รายวัน (queues/archive.py) วันไหนมี log ของ visit ไหน
+    เขียนใน transaction เดียวกับที่ลบ log ออกจากตารางหลัก → อ่านเฉพาะไฟล์ที่มีข้อมูลของ visit จริง
+    """
+    visit = models.ForeignKey(Visit, on_delete=models.CASCADE, related_name="telemetry_archive_days")
+    day = models.DateField()  # UTC ตามชื่อไฟล์
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["visit", "day"], name="uniq_archive_visit_day"),
+        ]
+
+
+class VisitSnapshot(models.Model):
+    """
+    สถานะล่าสุดของ visit (vitals / GPS / log ล่าสุด) แถวเดียวต่อ visit
+    upsert ตอน ingest (queues/snapshots.py) ให้หน้า monitor / map join ตารางเดียวพอ
+    ซ่อม/เติมย้อนหลังด้วย manage.py rebuild_visit_snapshots
+    """
+    visit = models.OneToOneField(Visit, on_delete=models.CASCADE, primary_key=True, related_name="snapshot")
+
+    # ค่าเดียวกับ VitalSign (pr = bpm)
+    bpm = models.IntegerField(blank=True, null=True)
+    o2sat = models.IntegerField(blank=True, null=True)
+    bt = models.FloatField(blank=True, null=True)
+    rr = models.IntegerField(blank=True, null=True)
+    sys_bp = models.IntegerField(blank=True, null=True)
+    dia_bp = models.IntegerField(blank=True, null=True)
+    vitals_updated_at = models.DateTimeField(blank=True, null=True)
+
+    lat = models.DecimalField(max_digits=9, decimal_places=6, blank=True, null=True)
+    lng = models.DecimalField(max_digits=9, decimal_places=6, blank=True, null=True)
+    gps_ts = models.DateTimeField(blank=True, null=True)
+
+    last_log_ts = models.DateTimeField(blank=True, null=True, db_index=True)
+    last_device_id = models.CharField(max_length=50, blank=True, null=True)  # Device.device_id
+
+    # เวลาที่คิว / triage / vitals ของ visit เปลี่ยนล่าสุด → cursor ของ ?since= (monitor API)
+    changed_at = models.DateTimeField(blank=True, null=True, db_index=True)
+
+
+class VisitTombstone(models.Model):
+    """
+    visit ที่ถูกลบ (snapshot หายไปด้วย) → ?since= ยังส่ง id ใน removed ได้ (queues/snapshots.py)
+    เก็บไว้ MONITOR_TOMBSTONE_SECONDS แล้วลบทิ้งตอนมี visit ถูกลบครั้งถัดไป
+    """
+    visit_id = models.BigIntegerField(primary_key=True)  # ไม่ใช่ FK: visit ไม่อยู่แล้ว
+    deleted_at = models.DateTimeField(db_index=True)
@@ -0,0 +1,150 @@
+"""
+Queue index: ลำดับคิว WAITING ในหน่วยความจำ เรียงแบบเดียวกับ SQL (priority, created_at) แล้วตาม id
+
+- list ของ key ที่เรียงไว้แล้ว + dict visit_id → key
+  คนถัดไป O(1), ลำดับของ visit O(log n) (bisect), top N = slice
+- อัปเดตจาก signals.py หลัง commit ทุกครั้งที่ Queue ถูก save / ลบ
+  (ลงทะเบียน, triage เปลี่ยน priority, เรียกคิว, demo ใช้ save/create ทั้งหมด)
+- reconcile: สร้างใหม่จาก DB (query เดียว) เมื่อเก่ากว่า QUEUE_INDEX_RECONCILE_SECONDS
+  กันกรณีมีการแก้ที่ไม่ผ่าน signal (.update() / SQL ตรง / worker อื่น) แล้ว log จำนวนที่ไม่ตรง
+
+ข้อจำกัดเดียวกับ recent.py: index อยู่ใน process เดียว หลาย worker จะเห็นการเปลี่ยนของกันช้าสุด
+เท่ารอบ reconcile จึงปิดไว้เป็นค่าเริ่มต้น (QUEUE_INDEX_ENABLED) ปิดอยู่ → views เรียงใน SQL เหมือนเดิม
+"""
+import logging
+import threading
+import time
+from bisect import bisect_left, insort
+
+from django.conf import settings
+
+from .models import Queue
+
+logger = logging.getLogger(__name__)
+
+
+def is_enabled():
+    return getattr(settings, "QUEUE_INDEX_ENABLED", False)
+
+
+def _key(queue_id, visit_id, priority, created_at):
+    return (priority, created_at.timestamp(), queue_id, visit_id)
+
+
+class QueueIndex:
+    def __init__(self):
+        self._keys = []       # [(priority, created_ts, queue_id, visit_id)] เรียงแล้ว
+        self._by_visit = {}   # visit_id → key
+        self._lock = threading.Lock()
+        self._journal = None  # ระหว่าง reload: การเปลี่ยนที่ต้องเล่นซ้ำหลังโหลดเสร็จ
+        self.built_at = None
+
+    # -------- write --------
+    def _apply(self, visit_id, key):
+        old = self._by_visit.pop(visit_id, None)
+        if old is not None:
+            i = bisect_left(self._keys, old)
+            if i < len(self._keys) and self._keys[i] == old:
+                del self._keys[i]
+        if key is not None:
+            insort(self._keys, key)
+            self._by_visit[visit_id] = key
+
+    def update(self, queue_id, visit_id, status, priority, created_at):
+        key = _key(queue_id, visit_id, priority, created_at) if status == Queue.Status.WAITING else None
+        with self._lock:
+            self._apply(visit_id, key)
+            if self._journal is not None:
+                self._journal.append((visit_id, key))
+
+    def remove(self, visit_id):
+        with self._lock:
+            self._apply(visit_id, None)
+            if self._journal is not None:
+                self._journal.append((visit_id, None))
+
+    def reload(self):
+        """
+        สร้างใหม่จาก DB  return: จำนวน visit ที่ index เดิมไม่ตรงกับ DB
+        การเปลี่ยนที่เข้ามาระหว่าง query ถูกเล่นซ้ำทับผลจาก DB (ใหม่กว่า)
+        """
+        with self._lock:
+            self._journal = []
+        try:
+            rows = Queue.objects.filter(status=Queue.Status.WAITING).values_list(
+                "id", "visit_id", "priority", "created_at"
+            )
+            fresh = {vid: _key(qid, vid, prio, created) for qid, vid, prio, created in rows}
+        except Exception:
+            with self._lock:
+                self._journal = None
+            raise
+
+        with self._lock:
+            for visit_id, key in self._journal:
+                if key is None:
+                    fresh.pop(visit_id, None)
+                else:
+                    fresh[visit_id] = key
+            self._journal = None
+
+            drift = sum(1 for vid, key in fresh.items() if self._by_visit.get(vid) != key)
+            drift += sum(1 for vid in self._by_visit if vid not in fresh)
+            self._by_visit = fresh
+            self._keys = sorted(fresh.values())
+            self.built_at = time.monotonic()
+        return drift
+
+    # -------- read --------
+    def next(self):
+        with self._lock:
+            return self._keys[0][3] if self._keys else None
+
+    def position(self, visit_id):
+        """ลำดับที่ (เริ่ม 1) ของ visit ในคิว WAITING  ไม่ได้รอ → None"""
+        with self._lock:
+            key = self._by_visit.get(visit_id)
+            if key is None:
+                return None
+            return bisect_left(self._keys, key) + 1
+
+    def top(self, n=None):
+        with self._lock:
+            keys = self._keys if n is None else self._keys[:n]
+            return [k[3] for k in keys]
+
+    def __len__(self):
+        return len(self._keys)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """index ของ process นี้ (โหลด / reconcile เมื่อถึงรอบ)  ปิดอยู่ → None"""
+    global _index
+    if not is_enabled():
+        return None
+    interval = getattr(settings, "QUEUE_INDEX_RECONCILE_SECONDS", 60.0)
+    index = _index
+    if index is None or time.monotonic() - index.built_at > interval:
+        with _index_lock:
+            index = _index or QueueIndex()
+            if index.built_at is None or time.monotonic() - index.built_at > interval:
+                drift = index.reload()
+                if drift and _index is not None:
+                    logger.warning("queue index was out of sync for %d visits; rebuilt from DB", drift)
+                _index = index
+    return index
+
+
+def queue_saved(queue_id, visit_id, status, priority, created_at):
+    # ยังไม่มีใครเปิด index → ข้าม (โหลดครั้งแรกจะอ่านจาก DB เอง)
+    if _index is not None:
+        _index.update(queue_id, visit_id, status, priority, created_at)
+
+
+def queue_deleted(visit_id):
+    if _index is not None:
+        _index.remove(visit_id)
@@ -0,0 +1,316 @@
+"""
+Recent readings: ring ขนาดคงที่ของ reading ล่าสุดต่อ visit ที่ยังอยู่ในคิว (WAITING / CALLED)
+เก็บในหน่วยความจำของ process ให้ monitor API ตอบโดยไม่ต้องอ่าน TelemetryLog
+
+- เก็บแบบ column: array("d") ต่อ field (NULL = NaN) ไม่ใช่ dict ต่อ reading
+- เติมจาก telemetry.ingest_logs / views.update_location หลัง commit
+- warm จาก TelemetryLog ครั้งแรกที่เรียก get_store() (query เดียว ไม่อ่านใน AppConfig.ready)
+- Queue เปลี่ยนเป็น DONE / CANCELLED หรือถูกลบ → ทิ้ง ring (signals.py)
+
+ข้อจำกัด: ring อยู่ใน process เดียว ถ้ารันหลาย worker แต่ละตัวจะเห็นเฉพาะ reading ที่ตัวเองรับ
+จึงปิดไว้เป็นค่าเริ่มต้น (TELEMETRY_RECENT_ENABLED) เปิดเมื่อรัน process เดียว
+"""
+import math
+import threading
+from array import array
+from bisect import insort
+from collections import namedtuple
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+
+from .models import Queue, TelemetryLog
+
+FIELDS = ("bpm", "o2sat", "bt", "rr", "sys_bp", "dia_bp", "lat", "lng")
+INT_FIELDS = frozenset({"bpm", "o2sat", "rr", "sys_bp", "dia_bp"})
+ACTIVE_STATUSES = (Queue.Status.WAITING, Queue.Status.CALLED)
+NO_DEVICE = -1
+
+Reading = namedtuple("Reading", ("id", "ts", "device_id") + FIELDS)
+
+
+def reading_from_log(log):
+    """TelemetryLog (select_related device) → Reading  (None → None)"""
+    if log is None:
+        return None
+    return Reading(
+        log.pk,
+        log.ts,
+        log.device.device_id if log.device else None,
+        *(getattr(log, f) for f in FIELDS),
+    )
+
+
+def is_enabled():
+    return getattr(settings, "TELEMETRY_RECENT_ENABLED", False)
+
+
+def _decode(field, value):
+    if math.isnan(value):
+        return None
+    return int(value) if field in INT_FIELDS else value
+
+
+def _encode(value):
+    return math.nan if value is None else float(value)
+
+
+class VisitRing:
+    """reading ล่าสุดไม่เกิน capacity ตัวของ visit เดียว เรียงตาม ts (เก่า → ใหม่)"""
+
+    __slots__ = ("capacity", "size", "head", "ids", "ts", "devices", "cols", "complete")
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.size = 0
+        self.head = 0  # ช่องที่จะเขียนถัดไป
+        self.ids = array("q", bytes(8 * capacity))
+        self.ts = array("d", bytes(8 * capacity))
+        self.devices = array("q", bytes(8 * capacity))
+        self.cols = {f: array("d", bytes(8 * capacity)) for f in FIELDS}
+        # True = ยังไม่เคยทิ้ง reading เก่า (มีครบทุกตัวของ visit)
+        self.complete = True
+
+    def _slot(self, i):
+        """ตำแหน่งจริงของตัวที่ i (0 = เก่าสุด)"""
+        return (self.head - self.size + i) % self.capacity
+
+    def _write(self, row):
+        rid, ts, device, values = row
+        h = self.head
+        self.ids[h] = rid
+        self.ts[h] = ts
+        self.devices[h] = device
+        for f, v in zip(FIELDS, values):
+            self.cols[f][h] = v
+        self.head = (h + 1) % self.capacity
+        if self.size < self.capacity:
+            self.size += 1
+        else:
+            self.complete = False
+
+    def rows(self):
+        out = []
+        for i in range(self.size):
+            j = self._slot(i)
+            out.append((self.ids[j], self.ts[j], self.devices[j], tuple(self.cols[f][j] for f in FIELDS)))
+        return out
+
+    def _reload(self, rows):
+        if len(rows) > self.capacity:
+            self.complete = False
+            rows = rows[-self.capacity:]
+        self.size = self.head = 0
+        for row in rows:
+            self._write(row)
+        self.head %= self.capacity
+
+    def append(self, row):
+        if self.size and row[1] < self.ts[self._slot(self.size - 1)]:
+            # มาช้า (ไม่บ่อย) → แทรกตามเวลาแล้วเขียนใหม่ทั้ง ring
+            rows = self.rows()
+            insort(rows, row, key=lambda r: r[1])
+            self._reload(rows)
+        else:
+            self._write(row)
+
+    def merge(self, rows):
+        """รวม rows จาก DB (ตอน warm) กับที่ ingest เข้ามาระหว่างนั้น ตัดซ้ำด้วย id"""
+        seen = {r[0]: r for r in rows}
+        for r in self.rows():
+            seen.setdefault(r[0], r)
+        self._reload(sorted(seen.values(), key=lambda r: (r[1], r[0])))
+
+    def latest(self):
+        if not self.size:
+            return None
+        return self.rows_at([self._slot(self.size - 1)])[0]
+
+    def rows_at(self, slots):
+        return [
+            (self.ids[j], self.ts[j], self.devices[j], [_decode(f, self.cols[f][j]) for f in FIELDS])
+            for j in slots
+        ]
+
+    def series(self, field, n):
+        """n ค่าล่าสุดที่ไม่ใช่ NULL (เก่า → ใหม่)  ring ไม่ครบและมีไม่ถึง n → None (ให้ไปอ่าน DB)"""
+        col = self.cols[field]
+        out = []
+        for i in range(self.size - 1, -1, -1):
+            v = col[self._slot(i)]
+            if not math.isnan(v):
+                out.append(_decode(field, v))
+                if len(out) == n:
+                    break
+        if len(out) < n and not self.complete:
+            return None
+        out.reverse()
+        return out
+
+
+class RecentStore:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._rings = {}
+        self._device_names = {}
+        self._lock = threading.Lock()
+
+    # -------- write --------
+    def _row(self, log):
+        if log.device_id is not None and log.device_id not in self._device_names:
+            device = getattr(log, "device", None)
+            if device is not None:
+                self._device_names[log.device_id] = device.device_id
+        return (
+            log.pk or 0,
+            log.ts.timestamp(),
+            NO_DEVICE if log.device_id is None else log.device_id,
+            tuple(_encode(getattr(log, f)) for f in FIELDS),
+        )
+
+    def add(self, logs):
+        """logs ที่บันทึกแล้ว เฉพาะ visit ที่ track อยู่"""
+        with self._lock:
+            for log in logs:
+                ring = self._rings.get(log.visit_id)
+                if ring is not None:
+                    ring.append(self._row(log))
+
+    def track(self, visit_id, complete=True):
+        with self._lock:
+            if visit_id not in self._rings:
+                ring = self._rings[visit_id] = VisitRing(self.capacity)
+                ring.complete = complete
+
+    def evict(self, visit_id):
+        with self._lock:
+            self._rings.pop(visit_id, None)
+
+    def warm(self):
+        """สร้าง ring ให้ทุก visit ที่อยู่ในคิว แล้วเติม reading ล่าสุดจาก DB (2 query)"""
+        from .sparklines import cutoff_q, cutoffs
+
+        visit_ids = list(
+            Queue.objects.filter(status__in=ACTIVE_STATUSES).values_list("visit_id", flat=True)
+        )
+        with self._lock:
+            # สร้าง ring ก่อน query → reading ที่ ingest ระหว่าง warm ไม่หาย
+            for vid in visit_ids:
+                self._rings.setdefault(vid, VisitRing(self.capacity))
+        if not visit_ids:
+            return
+
+        cut = cutoffs(visit_ids, self.capacity, ["ts"])["ts"]
+        cond = cutoff_q(cut)
+        by_visit = {}
+        for log in TelemetryLog.objects.filter(cond).select_related("device").order_by("ts", "id"):
+            by_visit.setdefault(log.visit_id, []).append(self._row(log))
+
+        with self._lock:
+            for vid, rows in by_visit.items():
+                ring = self._rings.get(vid)
+                if ring is None:
+                    continue
+                if cut.get(vid) is not None:
+                    ring.complete = False  # มี log อย่างน้อย capacity ตัว อาจมีเก่ากว่านั้นใน DB
+                ring.merge(rows)
+
+    # -------- read --------
+    def _reading(self, row):
+        rid, ts, device, values = row
+        return Reading(
+            rid,
+            datetime.fromtimestamp(ts, dt_timezone.utc),
+            self._device_names.get(device),
+            *values,
+        )
+
+    def latest(self, visit_id):
+        """
+        return: (True, Reading | None) ตอบได้จาก ring
+                (False, None) visit ไม่ได้ track หรือ ring ว่างแต่ไม่ครบ → ให้ไปอ่าน DB
+        """
+        with self._lock:
+            ring = self._rings.get(visit_id)
+            if ring is None or (not ring.size and not ring.complete):
+                return False, None
+            row = ring.latest()
+        return True, (self._reading(row) if row else None)
+
+    def sparklines(self, visit_ids, n, fields):
+        """
+        fields: {ชื่อ series: field}
+        return: (series เหมือน sparklines.fetch, [visit_id ที่ต้องไปอ่าน DB])
+        """
+        out, missing = {}, []
+        with self._lock:
+            for vid in visit_ids:
+                ring = self._rings.get(vid)
+                if ring is None:
+                    missing.append(vid)
+                    continue
+                series = {name: ring.series(field, n) for name, field in fields.items()}
+                if any(v is None for v in series.values()):
+                    missing.append(vid)
+                elif ring.size:
+                    out[str(vid)] = series
+        return out, missing
+
+    def stats(self):
+        with self._lock:
+            return {
+                "visits": len(self._rings),
+                "readings": sum(r.size for r in self._rings.values()),
+                "capacity": self.capacity,
+            }
+
+
+_store = None
+_warming = None  # store ที่กำลัง warm: ingest ระหว่างนั้นยังต้องเติมเข้า
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """store ของ process นี้ (warm ครั้งแรก)  ปิดอยู่ → None"""
+    global _store, _warming
+    if not is_enabled():
+        return None
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _warming = RecentStore(getattr(settings, "TELEMETRY_RECENT_SIZE", 120))
+                try:
+                    _warming.warm()
+                    _store = _warming
+                finally:
+                    _warming = None
+    return _store
+
+
+def _current():
+    return _store or _warming
+
+
+def add_logs(logs):
+    """เรียกจาก ingest หลัง commit  ยังไม่มีใครเปิด store → ข้าม (warm จะอ่านจาก DB เอง)"""
+    store = _current()
+    if store is not None and is_enabled():
+        store.add(logs)
+
+
+def queue_changed(visit_id, status, created):
+    store = _current()
+    if store is None:
+        return
+    if status in ACTIVE_STATUSES:
+        # คิวใหม่ยังไม่มี log เลย → ring ว่างถือว่าครบ
+        # visit เดิมกลับเข้าคิว → อาจมี log เก่าใน DB ให้ไปอ่าน DB จนกว่า ring จะมีพอ
+        store.track(visit_id, complete=created)
+    else:
+        store.evict(visit_id)
+
+
+def queue_deleted(visit_id):
+    store = _current()
+    if store is not None:
+        store.evict(visit_id)
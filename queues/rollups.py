@@ -0,0 +1,247 @@
+"""
+Telemetry rollups: min / max / mean / last ต่อ vital ต่อ visit ต่อ bucket 1 นาทีและ 5 นาที
+
+- ingest_logs เรียก apply_logs() ใน transaction เดียวกับการ insert log
+- ข้อมูลมาช้า/ซ่อมย้อนหลัง: rebuild() (manage.py rollup_telemetry) คำนวณจาก log ในตารางหลัก + ไฟล์ archive
+- กราฟ (sparkline / หน้า visit detail) อ่านจากที่นี่แทน TelemetryLog ดิบ
+  จำนวนแถวที่อ่านจึงขึ้นกับจำนวนจุดในกราฟ ไม่ขึ้นกับว่า visit นานแค่ไหน
+"""
+import logging
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from . import archive
+from .models import TelemetryArchiveDay, TelemetryLog, TelemetryRollup
+
+logger = logging.getLogger(__name__)
+
+RESOLUTIONS = {"1m": 60, "5m": 300}
+METRICS = ("bpm", "o2sat", "bt", "rr", "sys_bp", "dia_bp")
+
+
+def is_enabled():
+    return getattr(settings, "TELEMETRY_ROLLUPS_ENABLED", True)
+
+
+def parse_resolution(value):
+    """"raw" / "" → None, "1m" / "5m" → วินาที, อื่น ๆ → ValueError"""
+    if not value or value == "raw":
+        return None
+    if value not in RESOLUTIONS:
+        raise ValueError(f"resolution must be one of raw, {', '.join(RESOLUTIONS)}")
+    return RESOLUTIONS[value]
+
+
+def bucket_start(ts, seconds):
+    epoch = int(ts.timestamp())
+    return datetime.fromtimestamp(epoch - epoch % seconds, dt_timezone.utc)
+
+
+def _aggregate(logs, acc=None):
+    """logs → {(visit_id, resolution, metric, bucket): [count, total, min, max, last, last_ts]}"""
+    acc = {} if acc is None else acc
+    for log in logs:
+        for seconds in RESOLUTIONS.values():
+            bucket = bucket_start(log.ts, seconds)
+            for metric in METRICS:
+                value = getattr(log, metric)
+                if value is None:
+                    continue
+                value = float(value)
+                key = (log.visit_id, seconds, metric, bucket)
+                a = acc.get(key)
+                if a is None:
+                    acc[key] = [1, value, value, value, value, log.ts]
+                    continue
+                a[0] += 1
+                a[1] += value
+                if value < a[2]:
+                    a[2] = value
+                if value > a[3]:
+                    a[3] = value
+                if log.ts >= a[5]:
+                    a[4] = value
+                    a[5] = log.ts
+    return acc
+
+
+def _new_row(key, a):
+    visit_id, seconds, metric, bucket = key
+    return TelemetryRollup(
+        visit_id=visit_id, resolution=seconds, metric=metric, bucket=bucket,
+        count=a[0], total=a[1], min_value=a[2], max_value=a[3],
+        last_value=a[4], last_ts=a[5],
+    )
+
+
+def _merge(acc):
+    keys = list(acc)
+    # ล็อกแถวเดิมไว้จนจบ transaction: ingest อื่นที่ลง bucket เดียวกันรอแล้วอ่านค่าที่เรารวมแล้ว
+    # (ไม่งั้นต่างคนต่างบวกจากค่าเก่า → หายไปหนึ่งก้อน)  เรียง pk กัน deadlock  SQLite ล็อกทั้ง DB อยู่แล้ว
+    existing = {
+        (r.visit_id, r.resolution, r.metric, r.bucket): r
+        for r in TelemetryRollup.objects.select_for_update().filter(
+            visit_id__in={k[0] for k in keys},
+            metric__in={k[2] for k in keys},
+            bucket__in={k[3] for k in keys},
+        ).order_by("pk")
+    }
+
+    to_create, to_update = [], []
+    for key, a in acc.items():
+        row = existing.get(key)
+        if row is None:
+            to_create.append(_new_row(key, a))
+            continue
+        row.count += a[0]
+        row.total += a[1]
+        row.min_value = min(row.min_value, a[2])
+        row.max_value = max(row.max_value, a[3])
+        if a[5] >= row.last_ts:  # ข้อมูลมาช้ากว่า last เดิมไม่ทับค่า last
+            row.last_value = a[4]
+            row.last_ts = a[5]
+        to_update.append(row)
+
+    if to_create:
+        TelemetryRollup.objects.bulk_create(to_create)
+    if to_update:
+        TelemetryRollup.objects.bulk_update(
+            to_update, ["count", "total", "min_value", "max_value", "last_value", "last_ts"]
+        )
+
+
+def apply_logs(logs):
+    """รวม logs ใหม่เข้า rollup (เรียกจาก ingest_logs ภายใน transaction)"""
+    if not is_enabled() or not logs:
+        return
+    acc = _aggregate(logs)
+    if not acc:
+        return
+    for _ in range(2):
+        try:
+            with transaction.atomic():
+                _merge(acc)
+            return
+        except IntegrityError:
+            # ingest อีกตัวสร้าง bucket เดียวกันไปก่อน → อ่านแถวนั้นใหม่แล้วรวมซ้ำอีกรอบ
+            continue
+    # ชนซ้ำสองรอบ: ไม่ทำให้ ingest ล้ม ให้ rollup_telemetry ซ่อมทีหลัง
+    logger.warning("telemetry rollup conflict after retry; run rollup_telemetry to repair")
+
+
+def rebuild(visit_ids=None, since=None, chunk_size=5000, visits_per_commit=100):
+    """
+    คำนวณ rollup ใหม่จาก TelemetryLog + log ที่ archive แล้ว (catch-up สำหรับข้อมูลมาช้า / ย้อนหลัง)
+    since: datetime หรือ None = ทั้งหมด  return: จำนวน rollup ที่เขียน
+    commit ทีละ visits_per_commit visit (ไม่ถือ transaction เดียวทั้งตาราง)
+    """
+    logs = TelemetryLog.objects.all()
+    rollups = TelemetryRollup.objects.all()
+    archived = TelemetryArchiveDay.objects.all()
+    if visit_ids:
+        logs = logs.filter(visit_id__in=visit_ids)
+        rollups = rollups.filter(visit_id__in=visit_ids)
+        archived = archived.filter(visit_id__in=visit_ids)
+    if since is not None:
+        # ปัดลงให้ตรงขอบ bucket ที่ใหญ่ที่สุด จะได้คำนวณ bucket แรกครบ
+        since = bucket_start(since, max(RESOLUTIONS.values()))
+        logs = logs.filter(ts__gte=since)
+        rollups = rollups.filter(bucket__gte=since)
+        archived = archived.filter(day__gte=since.date())
+
+    # visit ที่มี log (ตารางหลักหรือ archive) หรือ rollup เดิมในช่วงนั้น
+    # (rollup ค้างของ visit ที่ไม่มี log ที่ไหนแล้วก็ต้องลบ)
+    ids = sorted(
+        set(logs.order_by().values_list("visit_id", flat=True).distinct())
+        | set(rollups.order_by().values_list("visit_id", flat=True).distinct())
+        | set(archived.order_by().values_list("visit_id", flat=True).distinct())
+    )
+    written = 0
+    for start in range(0, len(ids), visits_per_commit):
+        chunk = ids[start:start + visits_per_commit]
+        with transaction.atomic():
+            rollups.filter(visit_id__in=chunk).delete()
+            old = _archived_logs(archived.filter(visit_id__in=chunk), since)
+
+            # เก็บผลรวมทีละ visit (ขนาดตามจำนวน bucket ไม่ใช่จำนวน log)
+            current_visit, acc, hot_ids = None, {}, set()
+            chunk_logs = logs.filter(visit_id__in=chunk).order_by("visit_id", "ts")
+            for log in chunk_logs.only("visit_id", "ts", *METRICS).iterator(chunk_size=chunk_size):
+                if log.visit_id != current_visit:
+                    if current_visit is not None:
+                        written += _finish_visit(acc, old.pop(current_visit, ()), hot_ids)
+                    current_visit, acc, hot_ids = log.visit_id, {}, set()
+                hot_ids.add(log.id)
+                _aggregate([log], acc)
+            if current_visit is not None:
+                written += _finish_visit(acc, old.pop(current_visit, ()), hot_ids)
+            # visit ที่เหลือ log แต่ใน archive
+            for visit_id in sorted(old):
+                written += _finish_visit({}, old[visit_id], ())
+    return written
+
+
+def _archived_logs(days, since):
+    """
+    log ใน archive ตาม TelemetryArchiveDay (queryset) → {visit_id: [TelemetryLog ยังไม่ save]}
+    เปิดไฟล์ละครั้งต่อ chunk  แถวซ้ำ (archive ค้างกลางทางแล้วรันซ้ำ) ตัดด้วย id
+    """
+    by_day = {}
+    for visit_id, day in days.values_list("visit_id", "day"):
+        by_day.setdefault(day, set()).add(visit_id)
+    out, seen = {}, set()
+    for day in sorted(by_day):
+        for row in archive.read_day(day, visit_ids=by_day[day]):
+            if row["id"] in seen or (since is not None and row["ts"] < since):
+                continue
+            seen.add(row["id"])
+            out.setdefault(row["visit_id"], []).append(TelemetryLog(**row))
+    return out
+
+
+def _finish_visit(acc, archived_logs, hot_ids):
+    # แถวที่ยังอยู่ในตารางหลักด้วย (archive ยังไม่ได้ลบ) นับจากตารางหลักแล้ว
+    _aggregate([log for log in archived_logs if log.id not in hot_ids], acc)
+    return _write_fresh(acc) if acc else 0
+
+
+def _write_fresh(acc):
+    rows = [_new_row(key, a) for key, a in acc.items()]
+    TelemetryRollup.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+# -----------------------------
+# read side
+# -----------------------------
+def sparkline_queryset(visit_ids, seconds, metrics, n, now):
+    """n bucket ล่าสุด (นับจากตอนนี้) ของแต่ละ visit เรียงเก่า → ใหม่"""
+    return (
+        TelemetryRollup.objects
+        .filter(
+            visit_id__in=visit_ids,
+            resolution=seconds,
+            metric__in=metrics,
+            bucket__gt=now - timedelta(seconds=seconds * n),
+        )
+        .order_by("visit_id", "metric", "bucket")
+        .values_list("visit_id", "metric", "total", "count")
+    )
+
+
+def visit_buckets(visit_id, seconds, limit=50):
+    """
+    bucket ล่าสุดของ visit (ใหม่ → เก่า) สำหรับหน้า visit detail
+    return: [{"bucket": dt, "bpm": TelemetryRollup, ...}, ...]  (vital ที่ไม่มีข้อมูลจะไม่มี key)
+    """
+    qs = TelemetryRollup.objects.filter(visit_id=visit_id, resolution=seconds)
+    latest = qs.order_by("-bucket").values_list("bucket", flat=True).first()
+    if latest is None:
+        return []
+
+    rows = {}
+    for r in qs.filter(bucket__gt=latest - timedelta(seconds=seconds * limit)):
+        rows.setdefault(r.bucket, {"bucket": r.bucket})[r.metric] = r
+    return sorted(rows.values(), key=lambda x: x["bucket"], reverse=True)
@@ -0,0 +1,102 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from . import events, geo, queue_index, recent, snapshots, stats, summary_cache
+from .device_auth import credential_cache
+from .models import Device, Queue, TriageResult, Visit, VitalSign
+
+
+# ingest / คิว / triage / vitals ทุกทางผ่าน events → summary / map index ที่ cache ไว้หมดอายุทันที
+events.add_listener(summary_cache.summary_cache.invalidate)
+events.add_listener(geo.invalidate)
+
+
+@receiver(post_save, sender=Device)
+@receiver(post_delete, sender=Device)
+def invalidate_device_credentials(sender, instance, **kwargs):
+    # แก้ key / ปิดใช้งานใน admin → ต้องมีผลทันที ไม่รอ TTL
+    credential_cache.invalidate(instance)
+
+
+@receiver(post_save, sender=VitalSign)
+def sync_vitals_snapshot(sender, instance, **kwargs):
+    # ingest ใช้ bulk_update (ไม่ผ่าน signal) และอัปเดต snapshot เอง
+    # ตรงนี้สำหรับการแก้ใน admin / ฟอร์ม
+    snapshots.sync_vitals(instance)
+
+
+@receiver(post_save, sender=Queue)
+def track_recent_readings(sender, instance, created, **kwargs):
+    # คิวเข้า/ออก (WAITING / CALLED ↔ DONE / CANCELLED) → สร้าง/ทิ้ง ring หลัง commit
+    visit_id, status = instance.visit_id, instance.status
+    transaction.on_commit(lambda: recent.queue_changed(visit_id, status, created))
+
+
+@receiver(post_delete, sender=Queue)
+def evict_recent_readings(sender, instance, **kwargs):
+    visit_id = instance.visit_id
+    transaction.on_commit(lambda: recent.queue_deleted(visit_id))
+
+
+@receiver(post_save, sender=Queue)
+def update_queue_index(sender, instance, **kwargs):
+    # ลงทะเบียน / triage (priority) / เรียกคิว (status) → ลำดับใน queue_index หลัง commit
+    args = (instance.pk, instance.visit_id, instance.status, instance.priority, instance.created_at)
+    transaction.on_commit(lambda: queue_index.queue_saved(*args))
+
+
+@receiver(post_delete, sender=Queue)
+def remove_from_queue_index(sender, instance, **kwargs):
+    visit_id = instance.visit_id
+    transaction.on_commit(lambda: queue_index.queue_deleted(visit_id))
+
+
+@receiver(post_init, sender=Queue)
+def remember_queue_state(sender, instance, **kwargs):
+    # สถานะตอนโหลด → ตอน save รู้ว่าต้องลดตัวนับช่องไหน
+    instance._stats_state = stats.state_of(instance)
+
+
+@receiver(post_save, sender=Queue)
+def count_queue_change(sender, instance, created, **kwargs):
+    old = None if created else getattr(instance, "_stats_state", None)
+    new = instance._stats_state = stats.state_of(instance)
+    if old != new:
+        transaction.on_commit(lambda: stats.queue_changed(old, new))
+
+
+@receiver(post_delete, sender=Queue)
+def count_queue_delete(sender, instance, **kwargs):
+    old = stats.state_of(instance)
+    transaction.on_commit(lambda: stats.queue_changed(old, None))
+
+
+@receiver(post_save, sender=Queue)
+@receiver(post_delete, sender=Queue)
+@receiver(post_save, sender=Visit)
+@receiver(post_delete, sender=Visit)
+@receiver(post_save, sender=VitalSign)
+@receiver(post_save, sender=TriageResult)
+def publish_visit_changed(sender, instance, **kwargs):
+    # คิว / severity / vitals ที่แก้นอก ingest → ส่ง live update ให้หน้าจอ (queues/events.py)
+    events.publish_on_commit([instance.pk if sender is Visit else instance.visit_id])
+
+
+@receiver(post_save, sender=Queue)
+@receiver(post_save, sender=Visit)
+@receiver(post_save, sender=TriageResult)
+def touch_snapshot(sender, instance, **kwargs):
+    # cursor ?since= ของ monitor API (VitalSign เลื่อนผ่าน sync_vitals แล้ว)
+    snapshots.touch([instance.pk if sender is Visit else instance.visit_id])
+
+
+@receiver(post_delete, sender=Queue)
+def touch_snapshot_on_queue_delete(sender, instance, **kwargs):
+    snapshots.touch([instance.visit_id], create=False)
+
+
+@receiver(post_delete, sender=Visit)
+def bury_deleted_visit(sender, instance, **kwargs):
+    # snapshot ถูกลบตาม (CASCADE) → client ที่ใช้ ?since= รู้จาก tombstone แทน
+    snapshots.bury([instance.pk])
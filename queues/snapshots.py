@@ -0,0 +1,222 @@
+"""
+VisitSnapshot: สถานะล่าสุดต่อ visit ที่ monitor / map / dashboard อ่านด้วย join เดียว
+
+เขียนจาก
+  - telemetry.ingest_logs → apply_logs() (หลังอัปเดต VitalSign ใน transaction เดียวกัน)
+  - views.update_location → apply_logs()
+  - VitalSign ถูก save ที่อื่น (admin / ฟอร์ม) → signals → sync_vitals()
+  - คิว / triage / severity เปลี่ยน → signals → touch() (เลื่อน changed_at อย่างเดียว)
+ซ่อม/เติมย้อนหลัง: rebuild() (manage.py rebuild_visit_snapshots)
+
+changed_at ใช้เป็น cursor ของ ?since= ใน monitor API (changed_visit_ids)
+visit ที่ถูกลบ (snapshot หายตาม) → VisitTombstone ให้ client ที่ใช้ cursor ได้ id ใน removed
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import OuterRef, Q, Subquery
+from django.utils import timezone
+
+from .models import TelemetryLog, Visit, VisitSnapshot, VisitTombstone, VitalSign
+
+# VisitSnapshot field → VitalSign field
+VITAL_FIELDS = {
+    "bpm": "pr",
+    "o2sat": "o2sat",
+    "bt": "bt",
+    "rr": "rr",
+    "sys_bp": "sys_bp",
+    "dia_bp": "dia_bp",
+}
+UPDATE_FIELDS = [
+    *VITAL_FIELDS, "vitals_updated_at",
+    "lat", "lng", "gps_ts",
+    "last_log_ts", "last_device_id",
+    "changed_at",
+]
+
+
+def _upsert(snaps):
+    if snaps:
+        VisitSnapshot.objects.bulk_create(
+            snaps, update_conflicts=True, unique_fields=["visit"], update_fields=UPDATE_FIELDS,
+        )
+
+
+def _copy_vitals(snap, vs):
+    for dst, src in VITAL_FIELDS.items():
+        setattr(snap, dst, getattr(vs, src))
+    snap.vitals_updated_at = vs.updated_at
+
+
+def apply_logs(logs, vitalsigns=None):
+    """
+    logs: TelemetryLog ที่เพิ่งบันทึก (มี .device แล้ว)
+    vitalsigns: {visit_id: VitalSign} ล่าสุดของ visit เหล่านั้น (ถ้ามี)
+    log ที่มาช้ากว่าค่าเดิมใน snapshot จะไม่ทับ GPS / last_log
+    """
+    if not logs:
+        return
+    vitalsigns = vitalsigns or {}
+    now = timezone.now()
+    existing = VisitSnapshot.objects.in_bulk({log.visit_id for log in logs})
+
+    snaps = {}
+    for log in logs:
+        snap = snaps.get(log.visit_id)
+        if snap is None:
+            snap = existing.get(log.visit_id) or VisitSnapshot(visit_id=log.visit_id)
+            snap.changed_at = now
+            snaps[log.visit_id] = snap
+
+        if snap.last_log_ts is None or log.ts >= snap.last_log_ts:
+            snap.last_log_ts = log.ts
+            snap.last_device_id = log.device.device_id if log.device_id else None
+        if log.lat is not None and log.lng is not None and (snap.gps_ts is None or log.ts >= snap.gps_ts):
+            snap.lat = log.lat
+            snap.lng = log.lng
+            snap.gps_ts = log.ts
+
+    for visit_id, vs in vitalsigns.items():
+        if visit_id in snaps:
+            _copy_vitals(snaps[visit_id], vs)
+
+    _upsert(list(snaps.values()))
+
+
+def sync_vitals(vs):
+    """คัดลอก VitalSign ตัวเดียวเข้า snapshot (ใช้จาก post_save)"""
+    snap = VisitSnapshot.objects.filter(visit_id=vs.visit_id).first() or VisitSnapshot(visit_id=vs.visit_id)
+    _copy_vitals(snap, vs)
+    snap.changed_at = timezone.now()
+    _upsert([snap])
+
+
+def touch(visit_ids, create=True):
+    """
+    เลื่อน changed_at อย่างเดียว (คิว / triage / severity เปลี่ยน) — 1 query
+    create=False: ไม่สร้างแถวใหม่ (ใช้ตอนลบ ซึ่ง visit อาจถูกลบไปด้วยแล้ว)
+    """
+    visit_ids = set(visit_ids)
+    if not visit_ids:
+        return
+    now = timezone.now()
+    if not create:
+        VisitSnapshot.objects.filter(visit_id__in=visit_ids).update(changed_at=now)
+        return
+    VisitSnapshot.objects.bulk_create(
+        [VisitSnapshot(visit_id=vid, changed_at=now) for vid in visit_ids],
+        update_conflicts=True, unique_fields=["visit"], update_fields=["changed_at"],
+    )
+
+
+def bury(visit_ids):
+    """บันทึก visit ที่ถูกลบ (post_delete) + ล้าง tombstone ที่เก่ากว่า MONITOR_TOMBSTONE_SECONDS"""
+    now = timezone.now()
+    keep = timedelta(seconds=getattr(settings, "MONITOR_TOMBSTONE_SECONDS", 86400))
+    VisitTombstone.objects.filter(deleted_at__lt=now - keep).delete()
+    VisitTombstone.objects.bulk_create(
+        [VisitTombstone(visit_id=vid, deleted_at=now) for vid in set(visit_ids)],
+        update_conflicts=True, unique_fields=["visit_id"], update_fields=["deleted_at"],
+    )
+
+
+# -----------------------------
+# rebuild จาก VitalSign + TelemetryLog
+# -----------------------------
+def _latest_annotations():
+    latest_gps_log = (
+        TelemetryLog.objects
+        .filter(visit=OuterRef("pk"), lat__isnull=False, lng__isnull=False)
+        .order_by("-ts")
+    )
+    latest_any_log = TelemetryLog.objects.filter(visit=OuterRef("pk")).order_by("-ts")
+
+    return dict(
+        s_lat=Subquery(latest_gps_log.values("lat")[:1]),
+        s_lng=Subquery(latest_gps_log.values("lng")[:1]),
+        s_gps_ts=Subquery(latest_gps_log.values("ts")[:1]),
+        s_last_log_ts=Subquery(latest_any_log.values("ts")[:1]),
+        s_last_device_id=Subquery(latest_any_log.values("device__device_id")[:1]),
+    )
+
+
+def rebuild(visit_ids=None, chunk_size=500):
+    """คำนวณ snapshot ใหม่ทั้งหมด (หรือเฉพาะ visit_ids) return: จำนวนแถว"""
+    visits = Visit.objects.order_by("id")
+    if visit_ids:
+        visits = visits.filter(id__in=visit_ids)
+    ids = list(visits.values_list("id", flat=True))
+
+    written = 0
+    for start in range(0, len(ids), chunk_size):
+        chunk = ids[start:start + chunk_size]
+        now = timezone.now()
+        vitals = {vs.visit_id: vs for vs in VitalSign.objects.filter(visit_id__in=chunk)}
+
+        snaps = []
+        for v in Visit.objects.filter(id__in=chunk).annotate(**_latest_annotations()):
+            snap = VisitSnapshot(
+                visit_id=v.id,
+                lat=v.s_lat,
+                lng=v.s_lng,
+                gps_ts=v.s_gps_ts,
+                last_log_ts=v.s_last_log_ts,
+                last_device_id=v.s_last_device_id,
+                changed_at=now,
+            )
+            if v.id in vitals:
+                _copy_vitals(snap, vitals[v.id])
+            snaps.append(snap)
+
+        _upsert(snaps)
+        written += len(snaps)
+    return written
+
+
+# -----------------------------
+# cursor ของ ?since= (microseconds ตั้งแต่ epoch ตามนาฬิกา server)
+# -----------------------------
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def cursor_for(dt):
+    return str((dt - EPOCH) // timedelta(microseconds=1))
+
+
+def parse_cursor(value):
+    """"" → None, ตัวเลข → datetime, อื่น ๆ → ValueError"""
+    if value in (None, ""):
+        return None
+    try:
+        return EPOCH + timedelta(microseconds=int(value))
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError("since must be a cursor returned by this API")
+
+
+def _changed_query(since, now, online_seconds):
+    since = since - timedelta(seconds=getattr(settings, "MONITOR_CURSOR_SLACK", 2.0))
+    window = timedelta(seconds=online_seconds)
+    changed = (
+        VisitSnapshot.objects
+        .filter(Q(changed_at__gt=since) | Q(last_log_ts__gt=since - window, last_log_ts__lte=now - window))
+        .values_list("visit_id", flat=True)
+    )
+    # UNION ใน query เดียวกัน: visit ที่ถูกลบไม่มี snapshot ให้เลื่อน changed_at แล้ว
+    deleted = VisitTombstone.objects.filter(deleted_at__gt=since).values_list("visit_id", flat=True)
+    return changed.union(deleted)
+
+
+def changed_visit_ids(since, now, online_seconds):
+    """
+    visit ที่ต้องส่งใหม่ให้ client ที่มีข้อมูลถึง since:
+      - changed_at หลัง since (ingest / vitals / คิว / triage)
+      - เพิ่งหลุดจาก ONLINE เป็น OFFLINE ระหว่าง since ถึง now (เปลี่ยนตามเวลา ไม่มีใครเขียน)
+      - visit ถูกลบหลัง since (VisitTombstone) → ไม่อยู่ใน order จึงไปอยู่ใน removed
+    ลบ MONITOR_CURSOR_SLACK วินาทีเผื่อ transaction ที่ได้เวลาก่อนแต่ commit ทีหลัง (ส่งซ้ำได้ ไม่หาย)
+    """
+    return set(_changed_query(since, now, online_seconds))
+
+
+async def achanged_visit_ids(since, now, online_seconds):
+    return {visit_id async for visit_id in _changed_query(since, now, online_seconds)}
@@ -0,0 +1,190 @@
+"""
+Sparkline engine: ดึงค่าล่าสุดไม่เกิน n จุดต่อ visit ต่อ series
+
+ใช้ index (visit, ts) ของ TelemetryLog ทุกขั้น ไม่ว่า visit จะมี log กี่หมื่นแถว:
+  1) query เดียว: หา ts ของจุดที่ n (นับจากล่าสุด) ของแต่ละ visit / series
+     (subquery ORDER BY ts DESC LIMIT 1 OFFSET n-1 ต่อ visit)
+  2) query ละ series: ดึงเฉพาะแถว ts >= จุดตัดของ visit นั้น
+ค่า NULL ไม่นับเป็นจุด (แต่ละ series มี n จุดของตัวเอง)
+
+ROW_NUMBER() OVER (PARTITION BY visit ...) ให้ผลเหมือนกันแต่ต้องเรียงทุกแถวของ visit
+ช้าพอ ๆ กับดึงมาทั้งหมด (ดู scripts/bench_sparklines.py)
+
+resolution=1m/5m อ่านค่าเฉลี่ยต่อ bucket จาก TelemetryRollup (queues/rollups.py)
+"""
+from django.db.models import OuterRef, Q, Subquery
+from django.utils import timezone
+
+from . import rollups
+from .models import TelemetryLog, Visit
+
+# ชื่อ series ใน API → field ของ TelemetryLog / metric ของ rollup
+SERIES = {
+    "bpm": "bpm",
+    "o2": "o2sat",
+    "bt": "bt",
+    "rr": "rr",
+    "sys": "sys_bp",
+    "dia": "dia_bp",
+}
+DEFAULT_SERIES = ("bpm", "o2")
+DEFAULT_POINTS = 20
+MAX_POINTS = 500
+
+
+def parse_points(value):
+    """"" → DEFAULT_POINTS, 1..MAX_POINTS → int, อื่น ๆ → ValueError"""
+    if value in (None, ""):
+        return DEFAULT_POINTS
+    try:
+        n = int(value)
+    except (TypeError, ValueError):
+        raise ValueError("n must be an integer")
+    if not 1 <= n <= MAX_POINTS:
+        raise ValueError(f"n must be between 1 and {MAX_POINTS}")
+    return n
+
+
+def parse_series(value):
+    """"bpm,o2,rr" → ("bpm", "o2", "rr")  ว่าง → DEFAULT_SERIES  ชื่อไม่รู้จัก → ValueError"""
+    if not value:
+        return DEFAULT_SERIES
+    names = tuple(dict.fromkeys(s.strip() for s in value.split(",") if s.strip()))
+    unknown = [s for s in names if s not in SERIES]
+    if unknown or not names:
+        raise ValueError(f"series must be a subset of {', '.join(SERIES)}")
+    return names
+
+
+def _non_null(field):
+    return TelemetryLog.objects.filter(**{f"{field}__isnull": False})
+
+
+def _cutoffs_query(visit_ids, n, fields):
+    annotations = {
+        f"cut_{field}": Subquery(
+            _non_null(field).filter(visit=OuterRef("pk")).order_by("-ts").values("ts")[n - 1:n]
+        )
+        for field in fields
+    }
+    return Visit.objects.filter(id__in=visit_ids).annotate(**annotations).values("id", *annotations)
+
+
+def _cutoffs_from(rows, fields):
+    out = {field: {} for field in fields}
+    for row in rows:
+        for field in fields:
+            out[field][row["id"]] = row[f"cut_{field}"]
+    return out
+
+
+def cutoffs(visit_ids, n, fields):
+    """
+    ts ของจุดที่ n นับจากล่าสุดต่อ visit ต่อ field (None = มีไม่ถึง n จุด เอาทั้งหมด)
+    return: {field: {visit_id: ts | None}}  (1 query)
+    """
+    return _cutoffs_from(_cutoffs_query(visit_ids, n, fields), fields)
+
+
+async def acutoffs(visit_ids, n, fields):
+    return _cutoffs_from([row async for row in _cutoffs_query(visit_ids, n, fields)], fields)
+
+
+def cutoff_q(cut):
+    """{visit_id: ts | None} → Q ของแถว ts >= จุดตัด (None = ทั้ง visit)  ว่าง → Q() เปล่า"""
+    cond = Q()
+    whole = [vid for vid, ts in cut.items() if ts is None]
+    if whole:
+        cond |= Q(visit_id__in=whole)
+    for vid, ts in cut.items():
+        if ts is not None:
+            cond |= Q(visit_id=vid, ts__gte=ts)
+    return cond
+
+
+def latest_points(field, cut):
+    """
+    cut: {visit_id: ts | None} จาก cutoffs()
+    return: queryset (visit_id, value) เรียง visit, เก่า → ใหม่  (ts ซ้ำกับจุดตัดอาจเกิน n แถว; build ตัดให้)
+    """
+    cond = cutoff_q(cut)
+    if not cond:
+        return TelemetryLog.objects.none().values_list("visit_id", field)
+    return (
+        _non_null(field)
+        .filter(cond)
+        .order_by("visit_id", "ts", "id")
+        .values_list("visit_id", field)
+    )
+
+
+def _raw(visit_ids, n, series):
+    """1 query หา cutoff + 1 query ต่อ series"""
+    fields = [SERIES[name] for name in series]
+    cut = cutoffs(visit_ids, n, fields)
+    return _raw_series(series, n, ((name, latest_points(SERIES[name], cut[SERIES[name]])) for name in series))
+
+
+async def _araw(visit_ids, n, series):
+    fields = [SERIES[name] for name in series]
+    cut = await acutoffs(visit_ids, n, fields)
+    points = []
+    for name, field in zip(series, fields):
+        points.append((name, [row async for row in latest_points(field, cut[field])]))
+    return _raw_series(series, n, points)
+
+
+def _raw_series(series, n, points):
+    """points: [(ชื่อ series, [(visit_id, value), ...] เรียงเก่า → ใหม่)]"""
+    out = {}
+    for name, rows in points:
+        for visit_id, value in rows:
+            out.setdefault(str(visit_id), _empty(series))[name].append(value)
+    for s in out.values():
+        for name in series:
+            del s[name][:-n]
+    return out
+
+
+def _rollup_query(visit_ids, seconds, n, series):
+    names = {SERIES[name]: name for name in series}
+    return names, rollups.sparkline_queryset(visit_ids, seconds, list(names), n, timezone.now())
+
+
+def _rollup_series(series, names, rows):
+    out = {}
+    for visit_id, metric, total, count in rows:
+        out.setdefault(str(visit_id), _empty(series))[names[metric]].append(round(total / count, 1))
+    return out
+
+
+def _rollup(visit_ids, seconds, n, series):
+    """mean ต่อ bucket จาก rollup (query เดียวทุก series, เรียงเก่า → ใหม่แล้ว)"""
+    names, rows = _rollup_query(visit_ids, seconds, n, series)
+    return _rollup_series(series, names, rows)
+
+
+async def _arollup(visit_ids, seconds, n, series):
+    names, rows = _rollup_query(visit_ids, seconds, n, series)
+    return _rollup_series(series, names, [row async for row in rows])
+
+
+def _empty(series):
+    return {name: [] for name in series}
+
+
+def fetch(visit_ids, n=DEFAULT_POINTS, series=DEFAULT_SERIES, resolution=None):
+    """
+    resolution: None = log ดิบ, วินาที = rollup
+    return: { "visit_id": {"bpm": [...], "o2": [...]} } เก่า → ใหม่  visit ที่ไม่มีข้อมูลเลยจะไม่มี key
+    """
+    if resolution is None:
+        return _raw(visit_ids, n, series)
+    return _rollup(visit_ids, resolution, n, series)
+
+
+async def afetch(visit_ids, n=DEFAULT_POINTS, series=DEFAULT_SERIES, resolution=None):
+    """fetch() สำหรับ async view (async ORM, query เดียวกัน)"""
+    if resolution is None:
+        return await _araw(visit_ids, n, series)
+    return await _arollup(visit_ids, resolution, n, series)
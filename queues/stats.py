@@ -0,0 +1,138 @@
+"""
+สถิติคิว: จำนวน Queue ต่อ (status, priority) ด้วย GROUP BY ครั้งเดียว (แทน COUNT 5 ครั้งต่อหน้า)
+
+counter cache (QUEUE_STATS_CACHE_ENABLED):
+- เก็บจำนวนต่อ (status, priority) ไว้ในหน่วยความจำ
+- signals.py จำสถานะตอนโหลด (post_init) แล้วหลัง save / ลบ ส่งผลต่าง -1 ช่องเดิม +1 ช่องใหม่ หลัง commit
+- reconcile: นับใหม่จาก DB ทุก QUEUE_STATS_RECONCILE_SECONDS
+  เก็บตก .update() / bulk_create / worker อื่น แล้ว log จำนวนช่องที่ไม่ตรง
+ข้อจำกัดเดียวกับ queue_index: อยู่ใน process เดียว จึงปิดไว้เป็นค่าเริ่มต้น
+"""
+import logging
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db.models import Count
+
+from .models import Queue
+
+logger = logging.getLogger(__name__)
+
+# priority → สี (RED=1, YELLOW=2, GREEN=3)
+SEVERITY_PRIORITY = {"red": 1, "yellow": 2, "green": 3}
+
+
+def is_enabled():
+    return getattr(settings, "QUEUE_STATS_CACHE_ENABLED", False)
+
+
+def state_of(q):
+    """(status, priority) ของ Queue  field ที่ถูก defer → None (ไม่ให้เกิด query)"""
+    d = q.__dict__
+    if "status" not in d or "priority" not in d:
+        return None
+    return (d["status"], d["priority"])
+
+
+def load_counts():
+    rows = (
+        Queue.objects
+        .order_by()
+        .values("status", "priority")
+        .annotate(n=Count("id"))
+        .values_list("status", "priority", "n")
+    )
+    return Counter({(status, priority): n for status, priority, n in rows})
+
+
+class QueueCounter:
+    def __init__(self):
+        self._counts = Counter()
+        self._lock = threading.Lock()
+        self._journal = None  # ระหว่าง reload: ผลต่างที่ต้องบวกเพิ่มหลังโหลดเสร็จ
+        self.built_at = None
+
+    def apply(self, old, new):
+        with self._lock:
+            for state, delta in ((old, -1), (new, 1)):
+                if state is None:
+                    continue
+                self._counts[state] += delta
+                if self._journal is not None:
+                    self._journal.append((state, delta))
+
+    def reload(self):
+        """นับใหม่จาก DB  return: จำนวนช่อง (status, priority) ที่ตัวนับเดิมไม่ตรง"""
+        with self._lock:
+            self._journal = []
+        try:
+            fresh = load_counts()
+        except Exception:
+            with self._lock:
+                self._journal = None
+            raise
+
+        with self._lock:
+            # การเปลี่ยนที่ commit ระหว่าง query อาจนับไปแล้วหรือยังก็ได้ → reconcile รอบหน้าแก้
+            for state, delta in self._journal:
+                fresh[state] += delta
+            self._journal = None
+            drift = sum(1 for k in set(fresh) | set(self._counts) if fresh[k] != self._counts[k])
+            self._counts = fresh
+            self.built_at = time.monotonic()
+        return drift
+
+    def counts(self):
+        with self._lock:
+            return Counter(self._counts)
+
+
+_counter = None
+_counter_lock = threading.Lock()
+
+
+def _get_counter():
+    global _counter
+    interval = getattr(settings, "QUEUE_STATS_RECONCILE_SECONDS", 60.0)
+    counter = _counter
+    if counter is None or time.monotonic() - counter.built_at > interval:
+        with _counter_lock:
+            counter = _counter or QueueCounter()
+            if counter.built_at is None or time.monotonic() - counter.built_at > interval:
+                drift = counter.reload()
+                if drift and _counter is not None:
+                    logger.warning("queue stats counter was off in %d buckets; recounted from DB", drift)
+                _counter = counter
+    return counter
+
+
+def queue_changed(old, new):
+    # ยังไม่มีใครเปิดตัวนับ → ข้าม (โหลดครั้งแรกนับจาก DB เอง)
+    if _counter is not None:
+        _counter.apply(old, new)
+
+
+def counts():
+    """Counter {(status, priority): n}"""
+    if is_enabled():
+        return _get_counter().counts()
+    return load_counts()
+
+
+def queue_stats():
+    """ตัวเลขที่หน้า dashboard ใช้"""
+    c = counts()
+    by_status = {s: 0 for s in Queue.Status.values}
+    for (status, _), n in c.items():
+        by_status[status] = by_status.get(status, 0) + n
+
+    stats = {
+        "waiting_total": by_status[Queue.Status.WAITING],
+        "called_total": by_status[Queue.Status.CALLED],
+        "by_status": by_status,
+    }
+    for color, priority in SEVERITY_PRIORITY.items():
+        stats[f"{color}_total"] = c[(Queue.Status.WAITING, priority)]
+    return stats
@@ -0,0 +1,107 @@
+"""
+Summary cache: คำนวณ /monitor/api/summary/ (ทั้งคิว ไม่มี since) ครั้งเดียวแล้วแจก bytes เดิมให้ทุกจอ
+
+entry ใช้ได้ตราบที่
+  - ยังไม่มีการเปลี่ยน (ingest / คิว / triage → events → invalidate())
+  - อายุไม่เกิน MONITOR_SUMMARY_CACHE_TTL วินาที (ONLINE เปลี่ยนตามเวลา และ worker อื่นเขียนโดยเราไม่รู้)
+single-flight: miss พร้อมกันหลาย request → สร้างคนเดียว ที่เหลือรอผลเดียวกัน
+TTL = 0 → ปิด (คำนวณทุก request)
+"""
+import asyncio
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+
+Entry = namedtuple("Entry", "generation built_at value")
+
+
+def ttl():
+    return getattr(settings, "MONITOR_SUMMARY_CACHE_TTL", 2.0)
+
+
+class SingleFlightCache:
+    """ค่าเดียวที่สร้างใหม่เมื่อ invalidate() หรือหมดอายุ (ใช้กับ map index ด้วย: queues/geo.py)"""
+
+    def __init__(self, wait_timeout=10.0):
+        self.wait_timeout = wait_timeout
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._entry = None
+        self._building = None  # threading.Event ของคนที่กำลังสร้าง
+        self.hits = self.builds = self.waits = 0
+
+    def invalidate(self, *args):
+        with self._lock:
+            self._generation += 1
+
+    def _fresh(self, entry, max_age):
+        return (
+            entry is not None
+            and entry.generation == self._generation
+            and time.monotonic() - entry.built_at < max_age
+        )
+
+    def _claim(self, max_age):
+        """return: (entry ที่ยังใช้ได้ | None, Event ที่ต้องรอ/ปล่อย, generation, เป็นคนสร้างหรือไม่)"""
+        with self._lock:
+            if self._fresh(self._entry, max_age):
+                self.hits += 1
+                return self._entry, None, None, False
+            building = self._building
+            if building is None:
+                building = self._building = threading.Event()
+                return None, building, self._generation, True
+            self.waits += 1
+            return None, building, None, False
+
+    def _store(self, entry):
+        with self._lock:
+            self.builds += 1
+            self._entry = entry
+        return entry
+
+    def _release(self, building):
+        with self._lock:
+            self._building = None
+        building.set()
+
+    def get(self, build, max_age):
+        """build() → ค่าใหม่  return: Entry"""
+        while True:
+            entry, building, generation, leader = self._claim(max_age)
+            if entry is not None:
+                return entry
+            if not leader:
+                # รอคนที่กำลังสร้าง แล้ววนกลับไปเช็คใหม่ (ถ้าเขาล้ม คนถัดไปจะเป็นคนสร้างแทน)
+                building.wait(self.wait_timeout)
+                continue
+            try:
+                return self._store(Entry(generation, time.monotonic(), build()))
+            finally:
+                self._release(building)
+
+    async def aget(self, build, max_age):
+        """get() สำหรับ async view: build เป็น coroutine function  ระหว่างรอคนอื่นสร้างไม่บล็อก event loop"""
+        while True:
+            entry, building, generation, leader = self._claim(max_age)
+            if entry is not None:
+                return entry
+            if not leader:
+                deadline = time.monotonic() + self.wait_timeout
+                while not building.is_set() and time.monotonic() < deadline:
+                    await asyncio.sleep(0.005)
+                continue
+            try:
+                return self._store(Entry(generation, time.monotonic(), await build()))
+            finally:
+                self._release(building)
+
+    def clear(self):
+        with self._lock:
+            self._entry = None
+            self._generation += 1
+
+
+summary_cache = SingleFlightCache()
@@ -0,0 +1,368 @@
+"""
+ข้อมูลสมมติขนาดใหญ่ทั้ง schema สำหรับทดสอบ monitor / map / dashboard ที่ปริมาณจริง
+(ai_triage/ml/train_dt.make_synth สร้างแค่ vitals สำหรับ train model)
+
+- สุ่มด้วย numpy ทีละก้อน (vectorized) seed เดิม → ข้อมูลเดิมทุกครั้ง
+- เขียนด้วย bulk_create ทีละ chunk ของ visit และทีละ batch ของ TelemetryLog → หน่วยความจำคงที่ไม่ขึ้นกับขนาดรวม
+- เวลา: visit กระจายตลอด `days` วันล่าสุด หนาแน่นช่วงเช้าวันทำการ รอคิว / ตรวจ ตามแจกแจง lognormal
+  visit ที่ยังไม่จบตอนนี้เป็น WAITING / CALLED และมี telemetry ถึงปัจจุบัน (หน้า monitor / map มีข้อมูล live)
+- GPS: เดินสุ่มรอบโรงพยาบาล ส่วนหนึ่งอยู่นอกโรงพยาบาล (รถพยาบาล / ติดตามที่บ้าน) กระจายทั้งจังหวัด
+- bulk_create ไม่ส่ง signal: VisitSnapshot สร้างต่อท้ายแต่ละก้อนด้วย snapshots.rebuild
+  rollup (sparkline) สร้างเมื่อขอเท่านั้น หรือทีหลังด้วย manage.py rollup_telemetry
+
+ใช้ผ่าน manage.py generate_synthetic_data --preset clinic|district|regional
+"""
+import math
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import numpy as np
+from django.db import transaction
+from django.utils import timezone
+
+from patients.models import Patient
+
+from . import rollups, snapshots
+from .models import Device, Queue, TelemetryLog, TriageResult, Visit, VitalSign
+
+# ขนาดโดยประมาณ (telemetry ≈ visits × monitored × 65 นาที × 60 / interval_s)
+PRESETS = {
+    "clinic": {
+        "patients": 2_000, "visits": 5_000, "devices": 20, "days": 30,
+        "monitored": 0.5, "interval_s": 60,
+    },
+    "district": {
+        "patients": 25_000, "visits": 60_000, "devices": 200, "days": 90,
+        "monitored": 0.5, "interval_s": 30,
+    },
+    "regional": {
+        "patients": 150_000, "visits": 300_000, "devices": 1_000, "days": 180,
+        "monitored": 0.5, "interval_s": 60,
+    },
+}
+
+HOSPITAL = (16.4419, 102.8350)  # ตรงกับจุดกลางแผนที่ (map.html)
+NATIONAL_ID_PREFIX = "99"      # เลขบัตรสมมติ ไม่ชนกับเลขจริง (ขึ้นต้น 1-8)
+DEVICE_PREFIX = "SYN-"
+MODEL_NAME = "synthetic"
+
+SEVERITIES = np.array([Visit.Severity.RED, Visit.Severity.YELLOW, Visit.Severity.GREEN])
+SEVERITY_MIX = [0.1, 0.3, 0.6]
+PRIORITY = np.array([1, 2, 3])  # ตาม index ของ SEVERITIES
+
+# ค่าเฉลี่ย / SD ของ vital ตอนคัดกรอง แยกตามความรุนแรง (RED, YELLOW, GREEN)
+VITALS = {
+    "rr": ((28, 5), (22, 3), (17, 2)),
+    "pr": ((118, 15), (105, 12), (82, 10)),
+    "sys_bp": ((100, 25), (128, 18), (122, 12)),
+    "dia_bp": ((62, 14), (82, 10), (78, 8)),
+    "bt": ((38.4, 0.8), (37.8, 0.6), (36.9, 0.3)),
+    "o2sat": ((91, 3), (95.5, 1.5), (98, 1)),
+}
+LIMITS = {"rr": (8, 45), "pr": (40, 180), "sys_bp": (70, 200), "dia_bp": (40, 120), "bt": (35.0, 41.5), "o2sat": (80, 100)}
+WALK_SD = {"rr": 0.4, "pr": 1.5, "sys_bp": 1.2, "dia_bp": 0.8, "bt": 0.02, "o2sat": 0.3}
+
+# คนมาโรงพยาบาลตามชั่วโมง (0-23) และวันในสัปดาห์ (จันทร์ = 0)
+HOURLY = np.array([1, 1, 1, 1, 1, 2, 4, 8, 12, 12, 11, 9, 6, 7, 8, 7, 6, 5, 4, 3, 3, 2, 2, 1], dtype=float)
+WEEKDAY = np.array([1.2, 1.1, 1.0, 1.0, 1.0, 0.6, 0.5])
+
+FIRST_NAMES = ["สมชาย", "สมหญิง", "อนุชา", "มาลี", "ประเสริฐ", "วิไล", "สุรชัย", "นภา", "ธนา", "กมล", "ปัณณ์", "ศิริพร"]
+LAST_NAMES = ["ใจดี", "ศรีสุข", "ทองดี", "บุญมา", "แก้วใส", "สายทอง", "พรหมมา", "คำแสน", "ภูผา", "นาคสุข"]
+
+
+def estimate(cfg):
+    """จำนวนแถวโดยประมาณ (ไว้ดูก่อนสั่งสร้างจริง)"""
+    per_visit = 65 * 60 / cfg["interval_s"]
+    return {
+        "patients": cfg["patients"],
+        "visits": cfg["visits"],
+        "devices": cfg["devices"],
+        "telemetry_logs": int(cfg["visits"] * cfg["monitored"] * per_visit),
+    }
+
+
+@contextmanager
+def _keep_timestamps(*fields):
+    """ปิด auto_now_add ชั่วคราว: bulk_create ใช้เวลาที่สุ่มไว้ (ไม่ใช่เวลาตอนรัน)"""
+    saved = [f.auto_now_add for f in fields]
+    for f in fields:
+        f.auto_now_add = False
+    try:
+        yield
+    finally:
+        for f, v in zip(fields, saved):
+            f.auto_now_add = v
+
+
+def _field(model, name):
+    return model._meta.get_field(name)
+
+
+def _seg_index(lengths):
+    """เลขลำดับภายในแต่ละ segment: lengths [2, 3] → [0, 1, 0, 1, 2]"""
+    starts = np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return np.arange(lengths.sum()) - starts
+
+
+def _seg_walk(rng, lengths, sd):
+    """random walk ที่เริ่มจาก 0 ใหม่ทุก segment (cumsum ครั้งเดียวทั้งก้อน)"""
+    steps = rng.normal(0.0, sd, lengths.sum())
+    cs = np.cumsum(steps)
+    first = np.cumsum(lengths) - lengths
+    return cs - np.repeat(cs[first] - steps[first], lengths)
+
+
+def _dt(now_ts, seconds):
+    """วินาทีเทียบกับตอนนี้ → datetime (NaN → None)"""
+    tz = timezone.get_current_timezone()
+    return [None if math.isnan(s) else datetime.fromtimestamp(s, tz) for s in (now_ts + seconds).tolist()]
+
+
+# -----------------------------
+# patients / devices
+# -----------------------------
+def create_patients(rng, n, chunk_size):
+    """return: np.array ของ patient id"""
+    taken_hn = set(Patient.objects.exclude(hn="").values_list("hn", flat=True))
+    if n > 1_000_000 - len(taken_hn):
+        raise ValueError("not enough free 6-digit HNs for that many patients")
+    free = np.setdiff1d(np.arange(1_000_000), np.fromiter((int(h) for h in taken_hn if h.isdigit()), dtype=np.int64))
+    hns = rng.choice(free, n, replace=False)
+    first_serial = Patient.objects.filter(national_id__startswith=NATIONAL_ID_PREFIX).count()
+
+    genders = rng.choice(["M", "F"], n)
+    ages = np.clip(rng.gamma(4.0, 11.0, n), 0, 99).astype(int)
+    first = rng.integers(len(FIRST_NAMES), size=n)
+    last = rng.integers(len(LAST_NAMES), size=n)
+    blood = rng.choice(["A", "B", "AB", "O"], n, p=[0.22, 0.33, 0.07, 0.38])
+    area = rng.choice(["AREA1", "AREA2", "AREA3", "OTHER"], n)
+
+    ids = []
+    for lo in range(0, n, chunk_size):
+        hi = min(n, lo + chunk_size)
+        batch = [
+            Patient(
+                first_name=FIRST_NAMES[first[i]], last_name=LAST_NAMES[last[i]],
+                national_id=f"{NATIONAL_ID_PREFIX}{first_serial + i:011d}", hn=f"{hns[i]:06d}",
+                gender=genders[i], age=int(ages[i]), blood_type=blood[i], address_area=area[i],
+            )
+            for i in range(lo, hi)
+        ]
+        Patient.objects.bulk_create(batch)
+        ids.extend(p.pk for p in batch)
+    return np.array(ids)
+
+
+def ensure_devices(n):
+    """อุปกรณ์ SYN-0001.. (ใช้ตัวที่มีอยู่แล้วซ้ำได้)  return: np.array ของ device pk"""
+    names = [f"{DEVICE_PREFIX}{i + 1:04d}" for i in range(n)]
+    Device.objects.bulk_create(
+        [Device(device_id=name, api_key="synthetic") for name in names], ignore_conflicts=True,
+    )
+    return np.array(list(Device.objects.filter(device_id__in=names).values_list("pk", flat=True)))
+
+
+# -----------------------------
+# visits
+# -----------------------------
+def _arrivals(rng, n, days, now_ts):
+    """เวลาลงทะเบียน (วินาทีเทียบกับตอนนี้ ≤ 0) หนาแน่นช่วงเช้าวันทำการ"""
+    today = timezone.localtime(timezone.now()).replace(hour=0, minute=0, second=0, microsecond=0)
+    day_starts = np.array([(today - timedelta(days=d)).timestamp() for d in range(days)])
+    weekday = np.array([(today - timedelta(days=d)).weekday() for d in range(days)])
+    day = rng.choice(days, n, p=WEEKDAY[weekday] / WEEKDAY[weekday].sum())
+    hour = rng.choice(24, n, p=HOURLY / HOURLY.sum())
+    ts = day_starts[day] + hour * 3600 + rng.uniform(0, 3600, n)
+    # เวลาที่ยังไม่ถึงของวันนี้ → ย้อนไปเมื่อวาน
+    ts = np.where(ts > now_ts, ts - 86400, ts)
+    return ts - now_ts
+
+
+def _triage_vitals(rng, sev):
+    out = {}
+    for name, params in VITALS.items():
+        mean = np.array([m for m, _ in params])[sev]
+        sd = np.array([s for _, s in params])[sev]
+        lo, hi = LIMITS[name]
+        v = np.clip(rng.normal(mean, sd), lo, hi)
+        out[name] = v.round(1) if name == "bt" else v.round().astype(int)
+    return out
+
+
+def _visit_chunk(rng, n, patient_ids, days, now_ts):
+    """สุ่มทุกคอลัมน์ของ visit ก้อนหนึ่ง (เวลาเป็นวินาทีเทียบกับตอนนี้)"""
+    registered = _arrivals(rng, n, days, now_ts)
+    triaged = np.minimum(registered + rng.uniform(60, 600, n), 0.0)
+    called = triaged + rng.lognormal(math.log(30 * 60), 0.7, n)  # รอคิว ~30 นาที หางยาว
+    done = called + rng.lognormal(math.log(15 * 60), 0.5, n)     # ตรวจ ~15 นาที
+
+    sev = rng.choice(3, n, p=SEVERITY_MIX)
+    # RED ได้คิวเร็วกว่า
+    called = np.where(sev == 0, triaged + rng.uniform(0, 300, n), called)
+    done = np.maximum(done, called + 60)
+
+    status = np.full(n, Queue.Status.DONE, dtype=object)
+    status[rng.random(n) < 0.03] = Queue.Status.CANCELLED
+    status[called > 0] = Queue.Status.WAITING
+    status[(called <= 0) & (done > 0)] = Queue.Status.CALLED
+
+    # พยาบาลเปลี่ยนผล AI ราว 10% (ขยับหนึ่งระดับ)
+    nurse = sev.copy()
+    changed = rng.random(n) < 0.1
+    nurse[changed] = np.clip(sev[changed] + rng.choice([-1, 1], changed.sum()), 0, 2)
+
+    return {
+        "patient": rng.choice(patient_ids, n),
+        "registered": registered,
+        "triaged": triaged,
+        "called": np.where(called > 0, np.nan, called),
+        "done": done,
+        "status": status,
+        "sev": sev,
+        "nurse": nurse,
+        "confidence": rng.beta(8, 2, n).round(3),
+        "vitals": _triage_vitals(rng, sev),
+    }
+
+
+def _telemetry_chunk(rng, c, monitored, interval_s, device_pks):
+    """
+    log ของ visit ที่ติด monitor: ตั้งแต่ triage ถึงตรวจเสร็จ (หรือถึงตอนนี้)
+    return: (visit_index, dict ของ array ต่อแถว) เรียงตาม visit แล้วเวลา
+    """
+    n = len(c["sev"])
+    chosen = np.flatnonzero(rng.random(n) < monitored)
+    start = c["triaged"][chosen]
+    end = np.minimum(c["done"][chosen], 0.0)
+    lengths = np.maximum(1, ((end - start) // interval_s).astype(int))
+    lengths[end <= start] = 0
+    chosen, start, lengths = chosen[lengths > 0], start[lengths > 0], lengths[lengths > 0]
+
+    idx = np.repeat(chosen, lengths)
+    k = _seg_index(lengths)
+    ts = np.repeat(start, lengths) + k * interval_s + rng.uniform(0, min(5, interval_s / 4), len(k))
+
+    rows = {"ts": ts, "device": np.repeat(rng.choice(device_pks, len(chosen)), lengths)}
+    for name, sd in WALK_SD.items():
+        base = np.repeat(c["vitals"][name][chosen], lengths).astype(float)
+        lo, hi = LIMITS[name]
+        v = np.clip(base + _seg_walk(rng, lengths, sd), lo, hi)
+        rows[name] = v.round(1) if name == "bt" else v.round().astype(int)
+    rows["bpm"] = rows.pop("pr")
+
+    # 85% อยู่ในโรงพยาบาล (~100 ม.) ที่เหลือกระจาย ~8 กม. รอบโรงพยาบาล
+    outside = rng.random(len(chosen)) < 0.15
+    spread = np.where(outside, 0.07, 0.001)
+    lat0 = HOSPITAL[0] + rng.normal(0, 1, len(chosen)) * spread
+    lng0 = HOSPITAL[1] + rng.normal(0, 1, len(chosen)) * spread
+    step = np.repeat(np.where(outside, 2e-4, 3e-5), lengths)  # รถ / คนเดินในตึก
+    rows["lat"] = (np.repeat(lat0, lengths) + _seg_walk(rng, lengths, 1.0) * step).round(6)
+    rows["lng"] = (np.repeat(lng0, lengths) + _seg_walk(rng, lengths, 1.0) * step).round(6)
+
+    last = np.cumsum(lengths) - 1
+    c["gps"] = (chosen, rows["lat"][last], rows["lng"][last], ts[last])
+    return idx, rows
+
+
+def _write_visits(c, now_ts):
+    n = len(c["sev"])
+    registered = _dt(now_ts, c["registered"])
+    triaged = _dt(now_ts, c["triaged"])
+    called = _dt(now_ts, c["called"])
+    gps = {int(i): (lat, lng, t) for i, lat, lng, t in zip(*c["gps"])}
+
+    visits = []
+    for i in range(n):
+        v = Visit(
+            patient_id=int(c["patient"][i]), registered_at=registered[i], triaged_at=triaged[i],
+            called_at=called[i], final_severity=SEVERITIES[c["nurse"][i]],
+        )
+        if i in gps:
+            lat, lng, t = gps[i]
+            v.lat, v.lng = round(float(lat), 6), round(float(lng), 6)
+            v.location_updated_at = _dt(now_ts, np.array([t]))[0]
+        visits.append(v)
+    with _keep_timestamps(_field(Visit, "registered_at")):
+        Visit.objects.bulk_create(visits)
+
+    vit = c["vitals"]
+    with _keep_timestamps(_field(Queue, "created_at"), _field(TriageResult, "created_at")):
+        Queue.objects.bulk_create([
+            Queue(visit=v, status=c["status"][i], priority=int(PRIORITY[c["nurse"][i]]), created_at=registered[i])
+            for i, v in enumerate(visits)
+        ])
+        TriageResult.objects.bulk_create([
+            TriageResult(
+                visit=v, ai_severity=SEVERITIES[c["sev"][i]], nurse_severity=SEVERITIES[c["nurse"][i]],
+                model_name=MODEL_NAME, confidence=float(c["confidence"][i]), created_at=triaged[i],
+            )
+            for i, v in enumerate(visits)
+        ])
+    VitalSign.objects.bulk_create([
+        VitalSign(
+            visit=v, rr=int(vit["rr"][i]), pr=int(vit["pr"][i]), sys_bp=int(vit["sys_bp"][i]),
+            dia_bp=int(vit["dia_bp"][i]), bt=float(vit["bt"][i]), o2sat=int(vit["o2sat"][i]),
+        )
+        for i, v in enumerate(visits)
+    ])
+    return np.array([v.pk for v in visits])
+
+
+def _write_telemetry(visit_pks, idx, rows, now_ts, batch_size):
+    written = 0
+    with _keep_timestamps(_field(TelemetryLog, "created_at")):
+        for lo in range(0, len(idx), batch_size):
+            hi = lo + batch_size
+            cols = {name: arr[lo:hi].tolist() for name, arr in rows.items() if name != "ts"}
+            stamps = _dt(now_ts, rows["ts"][lo:hi])
+            visit_ids = visit_pks[idx[lo:hi]].tolist()
+            TelemetryLog.objects.bulk_create([
+                TelemetryLog(
+                    visit_id=visit_ids[j], device_id=cols["device"][j], ts=stamps[j], created_at=stamps[j],
+                    bpm=cols["bpm"][j], o2sat=cols["o2sat"][j], bt=cols["bt"][j], rr=cols["rr"][j],
+                    sys_bp=cols["sys_bp"][j], dia_bp=cols["dia_bp"][j], lat=cols["lat"][j], lng=cols["lng"][j],
+                )
+                for j in range(len(visit_ids))
+            ])
+            written += len(visit_ids)
+    return written
+
+
+def generate(cfg, seed=42, chunk_size=5_000, batch_size=10_000, with_rollups=False, progress=None):
+    """
+    cfg: dict แบบเดียวกับ PRESETS
+    chunk_size: visit ต่อก้อน (สุ่ม + เขียนทีละก้อน)  batch_size: TelemetryLog ต่อ bulk_create
+    VisitSnapshot ของแต่ละก้อนถูกสร้างเสมอ (หน้า monitor / map ใช้)
+    with_rollups: สร้าง rollup ด้วย (sparkline) ช้ากว่าการ insert log หลายเท่า: 1 log ≈ 6-12 แถว rollup
+    return: {"patients", "visits", "devices", "telemetry_logs", "visit_ids": [min, max]}
+    """
+    rng = np.random.default_rng(seed)
+    now_ts = timezone.now().timestamp()
+    counts = {"patients": 0, "visits": 0, "devices": 0, "telemetry_logs": 0}
+
+    with transaction.atomic():
+        patient_ids = create_patients(rng, cfg["patients"], chunk_size)
+        device_pks = ensure_devices(cfg["devices"])
+    counts["patients"], counts["devices"] = len(patient_ids), len(device_pks)
+
+    first_visit = last_visit = None
+    for lo in range(0, cfg["visits"], chunk_size):
+        n = min(chunk_size, cfg["visits"] - lo)
+        c = _visit_chunk(rng, n, patient_ids, cfg["days"], now_ts)
+        idx, rows = _telemetry_chunk(rng, c, cfg["monitored"], cfg["interval_s"], device_pks)
+        with transaction.atomic():
+            visit_pks = _write_visits(c, now_ts)
+            counts["telemetry_logs"] += _write_telemetry(visit_pks, idx, rows, now_ts, batch_size)
+        del idx, rows
+        ids = visit_pks.tolist()
+        snapshots.rebuild(visit_ids=ids)
+        if with_rollups and rollups.is_enabled():
+            rollups.rebuild(visit_ids=ids)
+        counts["visits"] += n
+        first_visit = first_visit or int(visit_pks.min())
+        last_visit = int(visit_pks.max())
+        if progress:
+            progress(counts)
+
+    counts["visit_ids"] = [first_visit, last_visit]
+    return counts
@@ -0,0 +1,224 @@
+"""
+Telemetry ingest: แปลง payload จากอุปกรณ์ → TelemetryLog แล้วเขียนลง DB แบบ batch
+
+ใช้ร่วมกันระหว่าง iot_telemetry (ทีละ reading) และ iot_telemetry_batch (หลาย reading)
+"""
+import time
+from datetime import timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import events, metrics, recent, rollups, snapshots
+from .device_auth import credential_cache, last_seen_tracker
+from .models import TelemetryLog, Visit, VitalSign
+
+
+# ฟิลด์ vitals ที่รับจากอุปกรณ์ → ชนิดข้อมูล (ตรงกับ TelemetryLog)
+VITAL_FIELDS = {
+    "bpm": int,
+    "o2sat": int,
+    "bt": float,
+    "rr": int,
+    "sys_bp": int,
+    "dia_bp": int,
+}
+
+# TelemetryLog field → VitalSign field (pr = bpm)
+VITALSIGN_FIELDS = {
+    "rr": "rr",
+    "bpm": "pr",
+    "sys_bp": "sys_bp",
+    "dia_bp": "dia_bp",
+    "bt": "bt",
+    "o2sat": "o2sat",
+}
+
+BATCH_MAX = getattr(settings, "TELEMETRY_BATCH_MAX", 500)
+GPS_DIGITS = 6  # DecimalField(decimal_places=6) ของ lat/lng
+
+
+def round_gps(value):
+    """lat/lng → ทศนิยม 6 ตำแหน่ง ใช้ทั้ง JSON (parse_reading) และ wire (queues/wire.py) ให้ได้ค่าเดียวกัน"""
+    return round(value, GPS_DIGITS) if value is not None else None
+
+
+class TelemetryError(Exception):
+    """reading ใช้ไม่ได้ (status = HTTP status ที่ควรตอบ)"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def _device_headers(request):
+    device_id = request.headers.get("X-DEVICE-ID")
+    api_key = request.headers.get("X-API-KEY")
+    if not device_id or not api_key:
+        raise TelemetryError("Missing X-DEVICE-ID or X-API-KEY", status=401)
+    return device_id, api_key
+
+
+def authenticate_device(request):
+    """
+    ตรวจ X-DEVICE-ID / X-API-KEY
+    return: Device หรือ raise TelemetryError (401/403)
+    """
+    device = credential_cache.get(*_device_headers(request))
+    if device is None:
+        raise TelemetryError("Invalid device credentials", status=403)
+    return device
+
+
+async def aauthenticate_device(request):
+    device = await credential_cache.aget(*_device_headers(request))
+    if device is None:
+        raise TelemetryError("Invalid device credentials", status=403)
+    return device
+
+
+def parse_ts(ts_str):
+    """ISO-8601 → aware datetime (ถ้าไม่ส่งมา/ผิดรูปแบบ ใช้เวลาปัจจุบัน)"""
+    if not ts_str:
+        return timezone.now()
+    try:
+        ts = timezone.datetime.fromisoformat(str(ts_str).replace("Z", "+00:00"))
+        if timezone.is_naive(ts):
+            ts = timezone.make_aware(ts, dt_timezone.utc)
+        return ts.astimezone(timezone.get_current_timezone())
+    except Exception:
+        return timezone.now()
+
+
+def _coerce(name, value, cast):
+    if value is None or value == "":
+        return None
+    if isinstance(value, bool):
+        raise TelemetryError(f"{name} must be a number")
+    try:
+        return cast(value)
+    except (TypeError, ValueError):
+        raise TelemetryError(f"{name} must be a number")
+
+
+def parse_reading(data, device):
+    """
+    dict จาก JSON → TelemetryLog (ยังไม่ save)
+    raise TelemetryError ถ้า payload ใช้ไม่ได้
+    """
+    if not isinstance(data, dict):
+        raise TelemetryError("reading must be an object")
+
+    visit_id = data.get("visit_id")
+    if not visit_id:
+        raise TelemetryError("visit_id required")
+    visit_id = _coerce("visit_id", visit_id, int)
+
+    vitals = data.get("vitals") or {}
+    gps = data.get("gps") or {}
+    if not isinstance(vitals, dict) or not isinstance(gps, dict):
+        raise TelemetryError("vitals/gps must be objects")
+
+    log = TelemetryLog(
+        visit_id=visit_id,
+        device=device,
+        ts=parse_ts(data.get("ts")),
+    )
+    for name, cast in VITAL_FIELDS.items():
+        setattr(log, name, _coerce(name, vitals.get(name), cast))
+
+    lat = _coerce("lat", gps.get("lat"), float)
+    lng = _coerce("lng", gps.get("lng"), float)
+    if lat is not None and not -90 <= lat <= 90:
+        raise TelemetryError("lat out of range")
+    if lng is not None and not -180 <= lng <= 180:
+        raise TelemetryError("lng out of range")
+    log.lat = round_gps(lat)
+    log.lng = round_gps(lng)
+    return log
+
+
+def missing_visit_ids(logs):
+    """visit_id ที่ไม่มีอยู่จริงใน DB (เช็คทีเดียวทั้ง batch)"""
+    wanted = {log.visit_id for log in logs}
+    found = set(Visit.objects.filter(id__in=wanted).values_list("id", flat=True))
+    return wanted - found
+
+
+async def amissing_visit_ids(logs):
+    wanted = {log.visit_id for log in logs}
+    found = {
+        visit_id
+        async for visit_id in Visit.objects.filter(id__in=wanted).values_list("id", flat=True)
+    }
+    return wanted - found
+
+
+def _update_vitalsigns(logs, now):
+    """
+    อัปเดต VitalSign ครั้งเดียวต่อ visit ต่อ batch
+    ค่าที่ไม่ใช่ None ของ reading ที่ ts ใหม่สุดชนะ (เหมือนส่งทีละตัวเรียงตามเวลา)
+    return: {visit_id: VitalSign}
+    """
+    latest = {}
+    for log in sorted(logs, key=lambda x: x.ts):
+        fields = latest.setdefault(log.visit_id, {})
+        for src, dst in VITALSIGN_FIELDS.items():
+            value = getattr(log, src)
+            if value is not None:
+                fields[dst] = value
+
+    existing = {vs.visit_id: vs for vs in VitalSign.objects.filter(visit_id__in=latest)}
+    to_create = []
+    to_update = {}  # ชุด field ที่ batch ส่งมา → [VitalSign]
+    for visit_id, fields in latest.items():
+        vs = existing.get(visit_id)
+        if vs is None:
+            to_create.append(VitalSign(visit_id=visit_id, updated_at=now, **fields))
+            continue
+        for name, value in fields.items():
+            setattr(vs, name, value)
+        vs.updated_at = now  # bulk_update ไม่เรียก auto_now ให้
+        to_update.setdefault(tuple(sorted(fields)), []).append(vs)
+
+    if to_create:
+        VitalSign.objects.bulk_create(to_create)
+    # เขียนเฉพาะ field ที่ reading ส่งมา ค่าอื่น (เช่นพยาบาลเพิ่งแก้) ไม่ถูกทับด้วยค่าเก่าในหน่วยความจำ
+    for names, rows in to_update.items():
+        VitalSign.objects.bulk_update(rows, list(names) + ["updated_at"])
+    updated = [vs for rows in to_update.values() for vs in rows]
+    return {vs.visit_id: vs for vs in to_create + updated}
+
+
+def ingest_logs(logs):
+    """
+    เขียน TelemetryLog ที่ผ่านการตรวจแล้วลง DB:
+      1) bulk insert log ทั้งหมด
+      2) จด device.last_seen (รวบเขียนเป็นช่วง ๆ ดู device_auth.LastSeenTracker)
+      3) update VitalSign ล่าสุด (ครั้งเดียวต่อ visit)
+      4) upsert VisitSnapshot (queues/snapshots.py)
+      5) รวมเข้า rollup 1m/5m (queues/rollups.py)
+      6) เติม ring ของ reading ล่าสุด (queues/recent.py) และแจ้ง live update (queues/events.py) หลัง commit
+    return: logs (มี id แล้ว)
+    """
+    if not logs:
+        return logs
+
+    now = timezone.now()
+    started = time.perf_counter()
+    with transaction.atomic():
+        TelemetryLog.objects.bulk_create(logs)
+
+        vitalsigns = _update_vitalsigns(logs, now)
+        snapshots.apply_logs(logs, vitalsigns)
+        rollups.apply_logs(logs)
+    metrics.telemetry_ingest.observe(time.perf_counter() - started)
+    metrics.telemetry_readings.inc("written", amount=len(logs))
+
+    transaction.on_commit(lambda: recent.add_logs(logs))
+    events.publish_on_commit({log.visit_id for log in logs})
+    for device_id in {log.device_id for log in logs if log.device_id}:
+        last_seen_tracker.touch(device_id, now)
+    return logs
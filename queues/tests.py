@@ -1,3 +1,1612 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import random
+import re
+import tempfile
+import threading
+import time
+from contextlib import suppress
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection
+from django.db.models import Q
+from django.db.backends.signals import connection_created
+from django.test import AsyncClient, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from config import profiling
+from patients.models import Patient
+from queues import (
+    archive, claims, events, geo, ingest_buffer, metrics, queue_index, recent, rollups, snapshots, stats,
+    summary_cache, synth, tracks, wire,
+)
+from queues.device_auth import LastSeenTracker, credential_cache
+from queues.ingest_buffer import TelemetryBuffer
+from queues.management.commands import telemetry_loadgen as loadgen
+from queues.models import (
+    Device, Queue, TelemetryArchiveDay, TelemetryLog, TelemetryRollup, TriageResult, Visit, VisitSnapshot,
+    VisitTombstone, VitalSign,
+)
+from queues.summary_cache import SingleFlightCache
+from queues.telemetry import ingest_logs, parse_reading
+from queues.views import _visit_queryset_with_latest_vitals_and_gps
+
+DEVICE_HEADERS = {"HTTP_X_DEVICE_ID": "dev-1", "HTTP_X_API_KEY": "k"}
+
+
+def _make_visit(queue=True, **queue_fields):
+    """ผู้ป่วยใหม่ + visit (+ คิว WAITING)"""
+    n = Patient.objects.count()
+    patient = Patient.objects.create(first_name=f"p{n}", last_name="t", national_id=f"{n:013d}")
+    visit = Visit.objects.create(patient=patient)
+    if queue:
+        Queue.objects.create(visit=visit, **queue_fields)
+    return visit
+
+
+class MonitorLatestApiTests(TestCase):
+    """monitor_latest_api ต้องใช้จำนวน query คงที่ ไม่ขึ้นกับจำนวนคิว (ห้ามกลับไป query ทีละแถว)"""
+
+    # session + user + คิว + log ล่าสุดของทุก visit
+    QUERIES = 4
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_user("nurse", password="x"))
+        self.device = Device.objects.create(device_id="dev-1", api_key="k")
+        self.now = timezone.now()
+
+    def _add_visits(self, count):
+        return [_make_visit() for _ in range(count)]
+
+    def _add_logs(self, visit, count):
+        TelemetryLog.objects.bulk_create([
+            TelemetryLog(visit=visit, device=self.device, ts=self.now - timedelta(seconds=count - i), bpm=60 + i)
+            for i in range(count)
+        ])
+
+    def test_query_count_does_not_grow_with_queue(self):
+        for visit in self._add_visits(3):
+            self._add_logs(visit, 5)
+        with self.assertNumQueries(self.QUERIES):
+            self.client.get("/monitor/api/latest/")
+
+        for visit in self._add_visits(25):
+            self._add_logs(visit, 5)
+        with self.assertNumQueries(self.QUERIES):
+            rows = self.client.get("/monitor/api/latest/").json()["rows"]
+        self.assertEqual(len(rows), 28)
+
+    def test_returns_latest_log_per_visit(self):
+        with_logs, without_logs = self._add_visits(2)
+        self._add_logs(with_logs, 5)
+
+        rows = {r["visit_id"]: r for r in self.client.get("/monitor/api/latest/").json()["rows"]}
+
+        self.assertEqual(rows[with_logs.id]["bpm"], 64)
+        self.assertEqual(rows[with_logs.id]["device_id"], "dev-1")
+        self.assertTrue(rows[with_logs.id]["online"])
+        self.assertIsNone(rows[without_logs.id]["bpm"])
+        self.assertFalse(rows[without_logs.id]["online"])
+
+
+class TelemetryBatchApiTests(TestCase):
+    """POST /api/iot/telemetry/batch/ ตอบผลรายตัว และเขียนเฉพาะ reading ที่ผ่าน"""
+
+    def setUp(self):
+        credential_cache.clear()
+        Device.objects.create(device_id="dev-1", api_key="k")
+        self.visit = _make_visit()
+
+    def _post(self, body, url="/api/iot/telemetry/batch/"):
+        return self.client.post(url, data=json.dumps(body), content_type="application/json", **DEVICE_HEADERS)
+
+    def test_per_item_results(self):
+        resp = self._post({"readings": [
+            {"visit_id": self.visit.id, "ts": "2025-12-17T08:30:00Z", "vitals": {"bpm": 90, "o2sat": 97}},
+            {"visit_id": self.visit.id, "ts": "2025-12-17T08:31:00Z", "vitals": {"bpm": 95}},
+            {"visit_id": 999999, "vitals": {"bpm": 1}},
+            {"visit_id": self.visit.id, "vitals": {"bpm": "x"}},
+        ]})
+
+        self.assertEqual(resp.status_code, 200)
+        data = resp.json()
+        self.assertEqual((data["accepted"], data["rejected"]), (2, 2))
+        self.assertEqual([r["ok"] for r in data["results"]], [True, True, False, False])
+        self.assertEqual(data["results"][2]["error"], "Visit not found")
+        self.assertEqual(data["results"][3]["error"], "bpm must be a number")
+        self.assertEqual(TelemetryLog.objects.count(), 2)
+        # ค่าล่าสุดที่ไม่ใช่ None ของแต่ละ field ชนะ
+        vitals = VitalSign.objects.get(visit=self.visit)
+        self.assertEqual((vitals.pr, vitals.o2sat), (95, 97))
+
+    def test_plain_list_body(self):
+        resp = self._post([{"visit_id": self.visit.id, "vitals": {"bpm": 80}}])
+        self.assertEqual(resp.json()["accepted"], 1)
+
+    def test_rejects_whole_request(self):
+        self.assertEqual(self._post({"readings": []}).status_code, 400)
+        self.assertEqual(self._post({"readings": {"visit_id": 1}}).status_code, 400)
+        too_many = [{"visit_id": self.visit.id}] * 501
+        self.assertEqual(self._post(too_many).status_code, 413)
+        resp = self.client.post("/api/iot/telemetry/batch/", data="[]", content_type="application/json")
+        self.assertEqual(resp.status_code, 401)
+        self.assertFalse(TelemetryLog.objects.exists())
+
+    def test_single_endpoint_shares_validation(self):
+        resp = self._post({"visit_id": self.visit.id, "vitals": {"bpm": 90}}, url="/api/iot/telemetry/")
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(TelemetryLog.objects.get().pk, resp.json()["log_id"])
+        self.assertEqual(self._post({"visit_id": 999999}, url="/api/iot/telemetry/").status_code, 404)
+
+
+@override_settings(TELEMETRY_INGEST_MODE="buffered", TELEMETRY_RETRY_AFTER=3)
+class BufferedIngestTests(TestCase):
+    """โหมด buffered: ตอบ 202 แล้วค่อยเขียนตอน flush, buffer เต็ม → 429"""
+
+    def setUp(self):
+        credential_cache.clear()
+        Device.objects.create(device_id="dev-1", api_key="k")
+        self.visit = _make_visit()
+        # flush_interval ยาว: thread ไม่ flush เอง ให้ test เรียก flush() ใน connection ของ test
+        self.buffer = TelemetryBuffer(max_size=3, batch_size=100, flush_interval=60, sink=ingest_logs)
+        patcher = mock.patch.object(ingest_buffer, "_buffer", self.buffer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.buffer.stop)
+
+    def _post(self, body, url="/api/iot/telemetry/"):
+        return self.client.post(url, data=json.dumps(body), content_type="application/json", **DEVICE_HEADERS)
+
+    def test_queued_then_flushed(self):
+        for bpm in (80, 81):
+            resp = self._post({"visit_id": self.visit.id, "vitals": {"bpm": bpm}})
+            self.assertEqual(resp.status_code, 202)
+            self.assertTrue(resp.json()["queued"])
+        self.assertFalse(TelemetryLog.objects.exists())
+
+        self.assertEqual(self.buffer.flush(), 2)
+        self.assertEqual(TelemetryLog.objects.count(), 2)
+        self.assertEqual(VitalSign.objects.get(visit=self.visit).pr, 81)
+
+    def test_full_buffer_answers_429(self):
+        resp = self._post([{"visit_id": self.visit.id}] * 4, url="/api/iot/telemetry/batch/")
+        self.assertEqual(resp.status_code, 429)
+        self.assertEqual(resp["Retry-After"], "3")
+        self.assertEqual(self.buffer.stats()["rejected"], 4)
+        self.assertEqual(self.buffer.depth(), 0)
+
+
+class VitalSignIngestTests(TestCase):
+    def setUp(self):
+        credential_cache.clear()
+        self.device = Device.objects.create(device_id="dev-1", api_key="k")
+        self.visit = _make_visit()
+
+    def test_only_fields_in_batch_are_written(self):
+        VitalSign.objects.create(visit=self.visit, pr=70, o2sat=98)
+        log = TelemetryLog(visit=self.visit, device=self.device, ts=timezone.now(), bpm=90)
+        # พยาบาลแก้ o2sat ระหว่างที่ batch กำลังเขียน (หลัง ingest อ่าน VitalSign ไปแล้ว)
+        real_filter = VitalSign.objects.filter
+
+        def filter_then_edit(*args, **kwargs):
+            rows = list(real_filter(*args, **kwargs))
+            VitalSign.objects.get_queryset().filter(visit=self.visit).update(o2sat=93, rr=22)
+            return rows
+
+        with mock.patch.object(VitalSign.objects, "filter", side_effect=filter_then_edit):
+            ingest_logs([log])
+
+        vitals = VitalSign.objects.get(visit=self.visit)
+        self.assertEqual((vitals.pr, vitals.o2sat, vitals.rr), (90, 93, 22))
+
+
+class DeviceAuthCacheTests(TestCase):
+    def setUp(self):
+        credential_cache.clear()
+        self.device = Device.objects.create(device_id="dev-1", api_key="k")
+
+    def test_credentials_cached_until_device_changes(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(credential_cache.get("dev-1", "k"), self.device)
+            self.assertEqual(credential_cache.get("dev-1", "k"), self.device)
+        self.assertIsNone(credential_cache.get("dev-1", "wrong"))
+
+        self.device.is_active = False
+        self.device.save()
+        self.assertIsNone(credential_cache.get("dev-1", "k"))
+
+    def test_non_ascii_key_is_rejected_not_500(self):
+        visit = _make_visit()
+        body = json.dumps({"visit_id": visit.id, "vitals": {"bpm": 80}})
+        for key, status in (("k", 200), ("k\u00e9", 403)):  # ครั้งแรกเข้า cache แล้ว key เพี้ยนต้องเทียบกับ cache
+            response = self.client.post(
+                "/api/iot/telemetry/", data=body, content_type="application/json",
+                HTTP_X_DEVICE_ID="dev-1", HTTP_X_API_KEY=key,
+            )
+            self.assertEqual(response.status_code, status)
+
+    def test_last_seen_coalesced_into_one_update(self):
+        tracker = LastSeenTracker(flush_interval=60)
+        later = timezone.now()
+        tracker.touch(self.device.pk, later)
+        tracker.touch(self.device.pk, later - timedelta(seconds=5))  # มาช้า ไม่ทับค่าใหม่
+        with self.assertNumQueries(1):
+            self.assertEqual(tracker.flush(), 1)
+        self.device.refresh_from_db()
+        self.assertEqual(self.device.last_seen, later)
+        self.assertEqual(tracker.flush(), 0)
+
+
+class LastSeenTimerTests(TransactionTestCase):
+    def test_quiet_device_flushed_by_timer(self):
+        device = Device.objects.create(device_id="dev-1", api_key="k")
+        tracker = LastSeenTracker(flush_interval=0.05)
+        tracker.touch(device.pk, timezone.now())
+
+        deadline = time.monotonic() + 5
+        while not tracker.flush_count and time.monotonic() < deadline:
+            time.sleep(0.02)
+        device.refresh_from_db()
+        self.assertIsNotNone(device.last_seen)
+
+
+class WireFormatTests(TestCase):
+    """Content-Type: application/x-telemetry (queues/wire.py)"""
+
+    def setUp(self):
+        credential_cache.clear()
+        Device.objects.create(device_id="dev-1", api_key="k")
+        self.visit = _make_visit()
+
+    def _post(self, body, url="/api/iot/telemetry/batch/"):
+        return self.client.post(url, data=body, content_type=wire.CONTENT_TYPE, **DEVICE_HEADERS)
+
+    def test_round_trip(self):
+        body = wire.encode_packet([{
+            "visit_id": self.visit.id, "ts": "2025-12-17T08:30:00Z",
+            "vitals": {"bpm": 90, "bt": 37.15}, "gps": {"lat": 16.44, "lng": 102.83},
+        }])
+        self.assertEqual(len(body), wire.HEADER.size + wire.RECORD.size)
+        self.assertEqual(self._post(body, url="/api/iot/telemetry/").status_code, 200)
+
+        log = TelemetryLog.objects.get()
+        self.assertEqual(log.ts.isoformat(), "2025-12-17T08:30:00+00:00")
+        self.assertEqual((log.bpm, log.bt, log.o2sat), (90, 37.15, None))
+        self.assertEqual((float(log.lat), float(log.lng)), (16.44, 102.83))
+
+    def test_gps_matches_json_path(self):
+        device = Device.objects.get()
+        for lat, lng in ((68.0223915, -102.8300005), (16.44, 102.83), (-0.0000005, 179.9999995)):
+            with self.subTest(lat=lat, lng=lng):
+                reading = {"visit_id": self.visit.id, "gps": {"lat": lat, "lng": lng}}
+                [log] = wire.decode_packet(wire.encode_packet([reading]), device)
+                expected = parse_reading(reading, device)
+                self.assertEqual((log.lat, log.lng), (expected.lat, expected.lng))
+
+    def test_per_record_errors(self):
+        body = wire.encode_packet([{"visit_id": self.visit.id}, {"visit_id": 999999}])
+        data = self._post(body).json()
+        self.assertEqual((data["accepted"], data["rejected"]), (1, 1))
+
+    def test_out_of_range_timestamp_falls_back_to_now(self):
+        before = timezone.now()
+        body = wire.HEADER.pack(wire.VERSION, 3) + b"".join(
+            wire.RECORD.pack(0, self.visit.id, ts_ms, 0, 0, 0, 0, 0, 0, 0, 0)
+            for ts_ms in (2 ** 62, -(2 ** 62), 10 ** 15)
+        )
+        resp = self._post(body)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json()["accepted"], 3)
+        self.assertTrue(all(ts >= before for ts in TelemetryLog.objects.values_list("ts", flat=True)))
+
+    def test_rejects_packet(self):
+        body = wire.encode_packet([{"visit_id": self.visit.id}])
+        self.assertEqual(self._post(body[:-1]).status_code, 400)
+        self.assertEqual(self._post(b"\x02" + body[1:]).status_code, 400)
+        # count ใน header เกิน TELEMETRY_BATCH_MAX → ปฏิเสธก่อน decode record ใด ๆ
+        with mock.patch.object(wire, "RECORD") as record:
+            resp = self._post(wire.HEADER.pack(wire.VERSION, 65535))
+        self.assertEqual(resp.status_code, 413)
+        record.iter_unpack.assert_not_called()
+        self.assertFalse(TelemetryLog.objects.exists())
+
+
+def _stable(payload):
+    """payload ไม่รวม field ที่เปลี่ยนทุก request"""
+    return {k: v for k, v in payload.items() if k not in ("server_time", "cursor")}
+
+
+class AsyncApiTests(TestCase):
+    """/async/... ให้ผลเดียวกับ view แบบ sync"""
+
+    def setUp(self):
+        from queues import geo, summary_cache
+
+        credential_cache.clear()
+        summary_cache.summary_cache.clear()
+        geo._index.clear()
+        Device.objects.create(device_id="dev-1", api_key="k")
+        self.visit = _make_visit()
+        self.other = _make_visit()
+        self.user = User.objects.create_user("nurse", password="x")
+
+    async def test_ingest(self):
+        body = {"visit_id": self.visit.id, "vitals": {"bpm": 90}, "gps": {"lat": 16.44, "lng": 102.83}}
+        headers = {"X-Device-Id": "dev-1", "X-Api-Key": "k"}
+        resp = await self.async_client.post(
+            "/async/api/iot/telemetry/", body, content_type="application/json", headers=headers,
+        )
+        self.assertEqual(resp.status_code, 200)
+
+        resp = await self.async_client.post(
+            "/async/api/iot/telemetry/batch/", [body, {"visit_id": 999999}],
+            content_type="application/json", headers=headers,
+        )
+        self.assertEqual((resp.json()["accepted"], resp.json()["rejected"]), (1, 1))
+        self.assertEqual(await TelemetryLog.objects.acount(), 2)
+
+        resp = await self.async_client.post("/async/api/iot/telemetry/", body, content_type="application/json")
+        self.assertEqual(resp.status_code, 401)
+
+    def test_monitor_apis_match_sync_views(self):
+        self.client.post(
+            "/api/iot/telemetry/batch/",
+            data=json.dumps([
+                {"visit_id": self.visit.id, "vitals": {"bpm": 90, "o2sat": 97}, "gps": {"lat": 16.44, "lng": 102.83}},
+                {"visit_id": self.other.id, "vitals": {"bpm": 70}, "gps": {"lat": 16.45, "lng": 102.84}},
+            ]),
+            content_type="application/json", **DEVICE_HEADERS,
+        )
+        self.client.force_login(self.user)
+        ids = f"{self.visit.id},{self.other.id}"
+        urls = [
+            "/monitor/api/latest/",
+            "/monitor/api/summary/",
+            "/monitor/api/summary/?since=0",
+            f"/monitor/api/sparklines/?visit_ids={ids}",
+            f"/monitor/api/sparklines/?visit_ids={ids}&resolution=1m&series=bpm",
+            "/monitor/api/map/?zoom=19",
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                sync, async_ = (_stable(self.client.get(prefix + url).json()) for prefix in ("", "/async"))
+                self.assertTrue(sync["ok"])
+                self.assertEqual(async_, sync)
+
+    def test_bad_parameters(self):
+        self.client.force_login(self.user)
+        for url in (
+            "/async/monitor/api/summary/?since=abc",
+            "/async/monitor/api/sparklines/?visit_ids=1&n=0",
+            "/async/monitor/api/map/?bbox=1,2,3",
+        ):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 400)
+
+
+class RollupTests(TestCase):
+    def setUp(self):
+        self.visit = _make_visit()
+        self.now = timezone.now().replace(second=30, microsecond=0)
+
+    def _logs(self, visit, seconds):
+        return TelemetryLog.objects.bulk_create([
+            TelemetryLog(visit=visit, ts=self.now - timedelta(seconds=s), bpm=80 + s, o2sat=95) for s in seconds
+        ])
+
+    def _snapshot(self):
+        return sorted(TelemetryRollup.objects.values_list(
+            "visit_id", "resolution", "metric", "bucket", "count", "total", "min_value", "max_value", "last_value",
+        ))
+
+    def test_incremental_equals_rebuild(self):
+        rollups.apply_logs(self._logs(self.visit, range(0, 100, 10)))
+        rollups.apply_logs(self._logs(self.visit, range(100, 200, 10)))
+        incremental = self._snapshot()
+        bpm_1m = [r for r in incremental if r[1] == 60 and r[2] == "bpm"]
+        self.assertEqual(sum(r[4] for r in bpm_1m), 20)
+
+        call_command("rollup_telemetry", "--all", stdout=io.StringIO())
+        self.assertEqual(self._snapshot(), incremental)
+
+    def test_conflict_is_merged_on_retry(self):
+        rollups.apply_logs(self._logs(self.visit, [0]))
+        # ingest อีกตัวสร้าง bucket นี้ไปหลังจากเราอ่าน → bulk_create ชน unique ครั้งแรก
+        real_merge = rollups._merge
+        calls = []
+
+        def conflict_once(acc):
+            calls.append(acc)
+            if len(calls) == 1:
+                raise IntegrityError("UNIQUE constraint failed")
+            real_merge(acc)
+
+        with mock.patch.object(rollups, "_merge", side_effect=conflict_once):
+            rollups.apply_logs(self._logs(self.visit, [5]))
+        self.assertEqual(len(calls), 2)
+        row = TelemetryRollup.objects.get(visit=self.visit, resolution=60, metric="bpm")
+        self.assertEqual((row.count, row.total, row.max_value), (2, 165.0, 85.0))
+
+    def test_rebuild_commits_per_chunk(self):
+        visits = [self.visit, _make_visit(), _make_visit()]
+        for visit in visits:
+            self._logs(visit, [0, 10])
+        # rollup ค้างของ visit ที่ไม่มี log แล้วต้องหายไป
+        stale = _make_visit()
+        TelemetryRollup.objects.create(
+            visit=stale, resolution=60, metric="bpm", bucket=self.now, count=1, total=1,
+            min_value=1, max_value=1, last_value=1, last_ts=self.now,
+        )
+        with CaptureQueriesContext(connection) as ctx:
+            written = rollups.rebuild(visits_per_commit=2)
+        # 4 visit (รวมตัวที่มีแต่ rollup ค้าง) → 2 transaction (ใน TestCase เห็นเป็น savepoint)
+        savepoints = [q for q in ctx.captured_queries if q["sql"].startswith("SAVEPOINT")]
+        self.assertEqual(len(savepoints), 2)
+        self.assertEqual(written, len(visits) * 2 * 2)  # 2 metric x 2 resolution
+        self.assertFalse(TelemetryRollup.objects.filter(visit=stale).exists())
+
+    def test_rebuild_reads_archived_logs(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        archived_only, partly = self.visit, _make_visit()
+        rollups.apply_logs(self._logs(archived_only, range(0, 600, 30)))
+        rollups.apply_logs(self._logs(partly, range(0, 600, 30)))
+        incremental = self._snapshot()
+
+        with override_settings(TELEMETRY_ARCHIVE_DIR=tmp.name):
+            # visit แรกย้ายหมด, visit ที่สองย้ายเฉพาะครึ่งที่เก่ากว่า (bucket คร่อมทั้งสองฝั่ง)
+            archive.archive_queryset(TelemetryLog.objects.filter(
+                Q(visit=archived_only) | Q(visit=partly, ts__lt=self.now - timedelta(seconds=290)),
+            ))
+            call_command("rollup_telemetry", "--all", stdout=io.StringIO())
+            self.assertEqual(self._snapshot(), incremental)
+
+            call_command("rollup_telemetry", "--hours", "1", stdout=io.StringIO())
+            self.assertEqual(self._snapshot(), incremental)
+
+
+LOG_FIELDS = ("id", "visit_id", "device_id", "ts", "bpm", "bt", "lat", "lng")
+
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        archive_dir = override_settings(TELEMETRY_ARCHIVE_DIR=tmp.name)
+        archive_dir.enable()
+        self.addCleanup(archive_dir.disable)
+
+        self.device = Device.objects.create(device_id="dev-1", api_key="k")
+        self.visit = _make_visit()
+        self.start = timezone.now().replace(hour=12, minute=0, second=0, microsecond=0) - timedelta(days=7)
+        Visit.objects.filter(pk=self.visit.pk).update(registered_at=self.start)
+        self.visit.refresh_from_db()
+
+    def _day(self, n):
+        return (self.start + timedelta(days=n)).date()
+
+    def _archive_days(self, visit, days, per_day=10):
+        """log ของ visit วันละ per_day แถว แล้วย้ายลง archive ทั้งหมด → แถวเดิม (ใหม่ → เก่า)"""
+        TelemetryLog.objects.bulk_create([
+            TelemetryLog(
+                visit=visit, device=self.device if i % 2 else None,
+                ts=self.start + timedelta(days=d, minutes=i), bpm=60 + i,
+                bt=36.5551 if i % 3 else None, lat="16.123456", lng="102.654321",
+            )
+            for d in range(days) for i in range(per_day)
+        ])
+        hot = TelemetryLog.objects.filter(visit=visit)
+        rows = list(hot.order_by("-ts").values_list(*LOG_FIELDS))
+        archive.archive_queryset(hot)
+        return rows
+
+    def _visit_logs(self, visit, **kwargs):
+        """→ (logs, วันที่เปิดไฟล์ตามลำดับ)"""
+        with mock.patch.object(archive, "read_day", wraps=archive.read_day) as read_day:
+            logs = archive.visit_logs(visit, **kwargs)
+        return logs, [c.args[0] for c in read_day.call_args_list]
+
+    def test_round_trip(self):
+        # bt เป็น FloatField: อ่านกลับต้องได้ค่าเดิมทุกหลัก (ไม่ปัดเป็น 2 ตำแหน่ง)
+        before = self._archive_days(self.visit, 3)
+        self.assertFalse(TelemetryLog.objects.exists())
+
+        logs = archive.visit_logs(self.visit)
+        self.assertEqual([tuple(getattr(log, f) for f in LOG_FIELDS) for log in logs], before)
+        self.assertEqual(logs[0].device, self.device)
+
+    def test_legacy_bt_column_is_still_readable(self):
+        legacy = tuple(archive.LEGACY_COLUMNS.get(c[0], c) for c in archive.COLUMNS)
+        with mock.patch.object(archive, "COLUMNS", legacy):
+            self._archive_days(self.visit, 1, per_day=2)
+        self.assertEqual([log.bt for log in archive.visit_logs(self.visit)], [36.56, None])
+
+    def test_limit_stops_once_enough_rows_are_read(self):
+        self._archive_days(self.visit, 4)
+
+        logs, days = self._visit_logs(self.visit, limit=15)
+        self.assertEqual(len(logs), 15)
+        self.assertEqual(logs[0].ts, self.start + timedelta(days=3, minutes=9))
+        # วันล่าสุดมี 10 แถว → เปิดวันก่อนหน้าอีกวันเดียวพอ
+        self.assertEqual(days, [self._day(3), self._day(2)])
+
+    def test_only_days_holding_the_visit_are_opened(self):
+        self._archive_days(self.visit, 2)
+        self._archive_days(_make_visit(), 5)  # visit อื่นมีไฟล์ของวันหลัง ๆ
+
+        logs, days = self._visit_logs(self.visit)
+        self.assertEqual(len(logs), 20)
+        self.assertEqual(days, [self._day(1), self._day(0)])
+
+    def test_clock_skewed_logs_before_registration_are_kept(self):
+        skewed = TelemetryLog.objects.create(visit=self.visit, ts=self.start - timedelta(days=3), bpm=70)
+        archive.archive_queryset(TelemetryLog.objects.all())
+
+        logs, days = self._visit_logs(self.visit)
+        self.assertEqual([log.id for log in logs], [skewed.id])
+        self.assertEqual(days, [self._day(-3)])
+
+    def test_reindex_rebuilds_day_index_from_files(self):
+        before = self._archive_days(self.visit, 2)
+        TelemetryArchiveDay.objects.all().delete()
+        self.assertEqual(archive.visit_logs(self.visit), [])
+
+        call_command("archive_telemetry", "--reindex", stdout=io.StringIO())
+        self.assertEqual(archive.visit_days(self.visit.id), [self._day(0), self._day(1)])
+        self.assertEqual(len(archive.visit_logs(self.visit)), len(before))
+
+    def test_detail_and_export_include_archived_logs(self):
+        self._archive_days(self.visit, 6)
+        TelemetryLog.objects.create(visit=self.visit, ts=timezone.now(), bpm=99)
+        self.client.force_login(User.objects.create_user("nurse", password="x"))
+
+        logs = self.client.get(f"/monitor/visit/{self.visit.id}/").context["logs"]
+        self.assertEqual(len(logs), 50)
+        self.assertEqual(logs[0].bpm, 99)
+
+        response = self.client.get(f"/monitor/visit/{self.visit.id}/export.csv")
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 1 + 61)
+
+
+class VisitSnapshotTests(TestCase):
+    def setUp(self):
+        credential_cache.clear()
+        Device.objects.create(device_id="dev-1", api_key="k")
+        self.visit = _make_visit()
+
+    def _ingest(self, *readings):
+        body = {"readings": [{"visit_id": self.visit.id, **r} for r in readings]}
+        self.client.post(
+            "/api/iot/telemetry/batch/", data=json.dumps(body), content_type="application/json", **DEVICE_HEADERS,
+        )
+
+    def test_late_reading_does_not_overwrite_newer_state(self):
+        self._ingest(
+            {"ts": "2025-12-17T08:31:00Z", "vitals": {"bpm": 95}, "gps": {"lat": 16.5, "lng": 102.9}},
+            {"ts": "2025-12-17T08:30:00Z", "vitals": {"bpm": 90, "o2sat": 97}, "gps": {"lat": 16.4, "lng": 102.8}},
+        )
+        snap = VisitSnapshot.objects.get(visit=self.visit)
+        self.assertEqual((snap.bpm, snap.o2sat, float(snap.lat), snap.last_device_id), (95, 97, 16.5, "dev-1"))
+        self.assertEqual(snap.last_log_ts.isoformat(), "2025-12-17T08:31:00+00:00")
+
+    def test_rebuild_matches_ingest(self):
+        self._ingest({"ts": "2025-12-17T08:30:00Z", "vitals": {"bpm": 90}, "gps": {"lat": 16.4, "lng": 102.8}})
+        before = _visit_queryset_with_latest_vitals_and_gps().values().get(id=self.visit.id)
+
+        VisitSnapshot.objects.all().delete()
+        call_command("rebuild_visit_snapshots", stdout=io.StringIO())
+        after = _visit_queryset_with_latest_vitals_and_gps().values().get(id=self.visit.id)
+        self.assertEqual(after, before)
+
+    def test_vitalsign_save_syncs_snapshot(self):
+        VitalSign.objects.create(visit=self.visit, rr=22)
+        self.assertEqual(VisitSnapshot.objects.get(visit=self.visit).rr, 22)
+
+    def test_monitor_queryset_is_one_query(self):
+        for _ in range(3):
+            self.visit = _make_visit()
+            self._ingest({"vitals": {"bpm": 80}, "gps": {"lat": 16.4, "lng": 102.8}})
+        with self.assertNumQueries(1):
+            rows = list(_visit_queryset_with_latest_vitals_and_gps())
+        self.assertEqual(len(rows), 4)
+
+
+class SparklineApiTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user("nurse", password="x"))
+        self.visit = _make_visit()
+        self.other = _make_visit()
+        now = timezone.now()
+        TelemetryLog.objects.bulk_create([
+            TelemetryLog(visit=self.visit, ts=now - timedelta(seconds=100 - i), bpm=i, o2sat=i if i % 2 else None)
+            for i in range(50)
+        ])
+        TelemetryLog.objects.create(visit=self.other, ts=now, bpm=1)
+        self.url = f"/monitor/api/sparklines/?visit_ids={self.visit.id},{self.other.id},999999"
+
+    def _series(self, query=""):
+        return self.client.get(self.url + query).json()["series"]
+
+    def test_last_n_points_per_series(self):
+        # session + user + cutoff + series ละ 1 query (ไม่ขึ้นกับจำนวน visit)
+        with self.assertNumQueries(5):
+            series = self._series()
+        self.assertEqual(series[str(self.visit.id)]["bpm"], list(range(30, 50)))
+        self.assertEqual(series[str(self.visit.id)]["o2"], [i for i in range(50) if i % 2][-20:])
+        self.assertEqual(series[str(self.other.id)], {"bpm": [1], "o2": []})
+        self.assertNotIn("999999", series)
+
+    def test_n_and_series_params(self):
+        series = self._series("&n=3&series=bpm,rr")
+        self.assertEqual(series[str(self.visit.id)], {"bpm": [47, 48, 49], "rr": []})
+        self.assertEqual(self.client.get(self.url + "&n=0").status_code, 400)
+        self.assertEqual(self.client.get(self.url + "&series=xx").status_code, 400)
+
+    def test_rollup_resolution(self):
+        rollups.apply_logs(list(TelemetryLog.objects.all()))
+        resp = self.client.get(self.url + "&resolution=5m&series=bpm")
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.json()["series"][str(self.visit.id)]["bpm"])
+
+
+@override_settings(TELEMETRY_RECENT_ENABLED=True, TELEMETRY_RECENT_SIZE=5)
+class RecentReadingsTests(TestCase):
+    def setUp(self):
+        credential_cache.clear()
+        patcher = mock.patch.object(recent, "_store", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.client.force_login(User.objects.create_user("nurse", password="x"))
+        self.device = Device.objects.create(device_id="dev-1", api_key="k")
+        self.visit = _make_visit()
+        now = timezone.now()
+        TelemetryLog.objects.bulk_create([
+            TelemetryLog(
+                visit=self.visit, device=self.device, ts=now - timedelta(seconds=100 - i),
+                bpm=i, o2sat=90 + i if i % 2 else None,
+            )
+            for i in range(10)
+        ])
+        self.url = f"/monitor/api/sparklines/?visit_ids={self.visit.id}"
+        self.store = recent.get_store()
+
+    def _series(self, query):
+        return self.client.get(self.url + query).json()["series"][str(self.visit.id)]
+
+    def test_warm_keeps_last_readings(self):
+        self.assertEqual(self.store.stats()["readings"], 5)
+        with self.assertNumQueries(2):  # session + user เท่านั้น
+            self.assertEqual(self._series("&n=3"), {"bpm": [7, 8, 9], "o2": [95, 97, 99]})
+        # n เกินขนาด ring → อ่าน DB ผลเหมือนกัน
+        self.assertEqual(self._series("&n=4&series=o2"), {"o2": [93, 95, 97, 99]})
+
+    def test_ingest_updates_ring_and_latest_api(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            resp = self.client.post(
+                "/api/iot/telemetry/", data=json.dumps({"visit_id": self.visit.id, "vitals": {"bpm": 120}}),
+                content_type="application/json", **DEVICE_HEADERS,
+            )
+        self.assertEqual(resp.status_code, 200)
+        found, reading = self.store.latest(self.visit.id)
+        self.assertTrue(found)
+        self.assertEqual((reading.bpm, reading.device_id, reading.o2sat), (120, "dev-1", None))
+
+        with self.assertNumQueries(3):  # session + user + คิว
+            rows = self.client.get("/monitor/api/latest/").json()["rows"]
+        self.assertEqual((rows[0]["bpm"], rows[0]["device_id"]), (120, "dev-1"))
+
+    def test_late_reading_is_inserted_in_order(self):
+        last = TelemetryLog.objects.get(bpm=9)
+        late = TelemetryLog.objects.create(visit=self.visit, ts=last.ts - timedelta(seconds=0.5), bpm=555)
+        recent.add_logs([late])
+        series, _ = self.store.sparklines([self.visit.id], 3, {"bpm": "bpm"})
+        self.assertEqual(series[str(self.visit.id)]["bpm"], [8, 555, 9])
+
+    def test_queue_changes_track_and_evict(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            queue = self.visit.queue
+            queue.status = Queue.Status.DONE
+            queue.save()
+        self.assertEqual(self.store.latest(self.visit.id), (False, None))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            other = _make_visit()
+        self.assertEqual(self.store.latest(other.id), (True, None))
+
+
+def _text(chunk):
+    return chunk.decode() if isinstance(chunk, bytes) else chunk
+
+
+@override_settings(MONITOR_STREAM_COALESCE=0.05, MONITOR_STREAM_KEEPALIVE=0.3)
+class MonitorStreamTests(TransactionTestCase):
+    """SSE ต้องใช้ transaction จริง: signal ส่ง event ตอน on_commit"""
+
+    def setUp(self):
+        self.user = User.objects.create_user("nurse", password="x")
+        self.visit = _make_visit()
+        self.done = _make_visit()
+
+    def test_snapshot_then_coalesced_rows(self):
+        def change():
+            queue = self.done.queue
+            queue.status = Queue.Status.DONE
+            queue.save()
+            VitalSign.objects.create(visit=self.visit, pr=77)
+
+        async def run():
+            client = AsyncClient()
+            await client.aforce_login(self.user)
+            resp = await client.get("/async/monitor/api/stream/")
+            self.assertEqual(resp["Content-Type"], "text/event-stream")
+            stream = resp.streaming_content.__aiter__()
+            self.assertIn("event: snapshot", _text(await stream.__anext__()))
+
+            await sync_to_async(change)()
+            while True:
+                chunk = _text(await asyncio.wait_for(stream.__anext__(), 3))
+                if "event: rows" in chunk:
+                    break
+            data = json.loads(chunk.split("data: ", 1)[1])
+            self.assertEqual(data["removed"], [self.done.id])
+            self.assertEqual([item["visit_id"] for item in data["items"]], [self.visit.id])
+            self.assertEqual(data["items"][0]["vitals"]["bpm"], 77)
+            self.assertEqual(data["order"], [self.visit.id])
+            self.assertIn("keepalive", _text(await asyncio.wait_for(stream.__anext__(), 3)))
+
+            # client ปิด → ยกเลิก subscription
+            pending = asyncio.ensure_future(stream.__anext__())
+            await asyncio.sleep(0.05)
+            pending.cancel()
+            with suppress(asyncio.CancelledError):
+                await pending
+            self.assertEqual(events.broker.subscriber_count(), 0)
+
+        asyncio.run(run())
+
+    def test_sync_server_answers_503(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get("/async/monitor/api/stream/").status_code, 503)
+
+
+@override_settings(MONITOR_CURSOR_SLACK=0)
+class SinceCursorTests(TestCase):
+    """?since=<cursor> ตอบเฉพาะ visit ที่เปลี่ยน, ETag เดิม → 304"""
+
+    def setUp(self):
+        summary_cache.summary_cache.clear()
+        self.client.force_login(User.objects.create_user("nurse", password="x"))
+        self.visit = _make_visit()
+        self.other = _make_visit()
+
+    def _cursor(self, url):
+        cursor = self.client.get(url).json()["cursor"]
+        time.sleep(0.01)  # ให้การเปลี่ยนแปลงถัดไปได้เวลาหลัง cursor แน่นอน
+        return cursor
+
+    def test_only_changed_visits_after_cursor(self):
+        bpm = 60
+        for prefix in ("", "/async"):
+            for api, key in (("summary", "items"), ("latest", "rows")):
+                url = f"{prefix}/monitor/api/{api}/"
+                with self.subTest(url=url):
+                    bpm += 1
+                    resp = self.client.get(url)
+                    self.assertEqual(len(resp.json()[key]), 2)
+                    etag = resp["ETag"]
+                    self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+                    cursor = self._cursor(url)
+                    data = self.client.get(url, {"since": cursor}).json()
+                    self.assertEqual((data[key], data["removed"]), ([], []))
+
+                    with self.captureOnCommitCallbacks(execute=True):
+                        VitalSign.objects.update_or_create(visit=self.visit, defaults={"pr": bpm})
+                        TelemetryLog.objects.create(visit=self.visit, bpm=bpm)
+                    data = self.client.get(url, {"since": cursor}).json()
+                    self.assertEqual([row["visit_id"] for row in data[key]], [self.visit.id])
+                    self.assertEqual(data["order"], [self.visit.id, self.other.id])
+                    self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+                    self.assertEqual(self.client.get(url, {"since": "abc"}).status_code, 400)
+                    VitalSign.objects.filter(visit=self.visit).delete()
+
+    def test_visit_leaving_waiting_is_removed(self):
+        cursor = self._cursor("/monitor/api/summary/")
+        queue = self.other.queue
+        queue.status = Queue.Status.CALLED
+        queue.save()
+        data = self.client.get("/monitor/api/summary/", {"since": cursor}).json()
+        self.assertEqual((data["items"], data["removed"], data["order"]), ([], [self.other.id], [self.visit.id]))
+
+    def test_deleted_visit_is_removed(self):
+        for url in ("/monitor/api/summary/", "/async/monitor/api/latest/"):
+            with self.subTest(url=url):
+                visit = _make_visit()
+                cursor = self._cursor(url)
+                visit_id = visit.id
+                visit.delete()
+                self.assertTrue(VisitTombstone.objects.filter(visit_id=visit_id).exists())
+                data = self.client.get(url, {"since": cursor}).json()
+                self.assertEqual(data["removed"], [visit_id])
+                self.assertEqual(data["order"], [self.visit.id, self.other.id])
+
+    @override_settings(MONITOR_TOMBSTONE_SECONDS=60)
+    def test_old_tombstones_are_pruned(self):
+        VisitTombstone.objects.create(visit_id=999999, deleted_at=timezone.now() - timedelta(seconds=120))
+        snapshots.bury([999998])
+        self.assertEqual(list(VisitTombstone.objects.values_list("visit_id", flat=True)), [999998])
+
+    def test_sparklines_since(self):
+        url = f"/monitor/api/sparklines/?visit_ids={self.visit.id},{self.other.id}"
+        cursor = self._cursor(url)
+        self.assertEqual(self.client.get(f"{url}&since={cursor}").json()["series"], {})
+
+        snapshots.apply_logs([TelemetryLog.objects.create(visit=self.visit, bpm=50)])
+        data = self.client.get(f"/async{url}&since={cursor}&n=1").json()
+        self.assertEqual(data["series"], {str(self.visit.id): {"bpm": [50], "o2": []}})
+
+
+class SingleFlightCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.cache = SingleFlightCache()
+        self.builds = 0
+
+    def _build(self, waiters=0):
+        self.builds += 1
+        # ค้างไว้จนคนอื่นมารอครบ → พิสูจน์ว่าทุกคนได้ค่าจาก build ครั้งนี้
+        deadline = time.monotonic() + 5
+        while self.cache.waits < waiters and time.monotonic() < deadline:
+            time.sleep(0.001)
+        return b"body"
+
+    def test_concurrent_misses_build_once(self):
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(self.cache.get(lambda: self._build(7), 5).value))
+            for _ in range(8)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual((self.builds, results), (1, [b"body"] * 8))
+
+    def test_invalidate_and_max_age(self):
+        self.cache.get(self._build, 5)
+        self.cache.get(self._build, 5)
+        self.assertEqual(self.builds, 1)
+        self.cache.invalidate()
+        self.cache.get(self._build, 5)
+        self.assertEqual(self.builds, 2)
+        self.cache.get(self._build, 0)  # TTL 0 = สร้างทุกครั้ง
+        self.assertEqual(self.builds, 3)
+
+    async def test_async_misses_build_once(self):
+        async def build():
+            self.builds += 1
+            await asyncio.sleep(0.02)
+            return b"body"
+
+        entries = await asyncio.gather(*(self.cache.aget(build, 5) for _ in range(5)))
+        self.assertEqual(self.builds, 1)
+        self.assertEqual({entry.value for entry in entries}, {b"body"})
+
+
+class SummaryCacheViewTests(TestCase):
+    def setUp(self):
+        summary_cache.summary_cache.clear()
+        self.client.force_login(User.objects.create_user("nurse", password="x"))
+
+    def test_cached_until_change(self):
+        first = self.client.get("/monitor/api/summary/")
+        self.assertEqual(first["Content-Type"], "application/json")
+        builds = summary_cache.summary_cache.builds
+
+        second = self.client.get("/monitor/api/summary/")
+        self.assertEqual(summary_cache.summary_cache.builds, builds)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(self.client.get("/monitor/api/summary/", HTTP_IF_NONE_MATCH=first["ETag"]).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            _make_visit()
+        self.assertEqual(len(self.client.get("/monitor/api/summary/").json()["items"]), 1)
+
+
+@override_settings(MAP_MAX_CLUSTERS=50)
+class MapApiTests(TestCase):
+    BBOX = "102.7,16.3,103.0,16.6"
+
+    def setUp(self):
+        geo._index.clear()
+        self.addCleanup(geo._index.clear)
+        self.client.force_login(User.objects.create_user("nurse", password="x"))
+
+        patient = Patient.objects.create(first_name="p", last_name="t", national_id="0" * 13)
+        visits = Visit.objects.bulk_create([
+            Visit(patient=patient, final_severity="RED" if i == 7 else "GREEN") for i in range(300)
+        ])
+        Queue.objects.bulk_create([Queue(visit=v) for v in visits])
+        rnd = random.Random(1)
+        now = timezone.now()
+        VisitSnapshot.objects.bulk_create([
+            VisitSnapshot(visit=v, lat=16.4 + rnd.random() * 0.1, lng=102.8 + rnd.random() * 0.1, last_log_ts=now)
+            for v in visits
+        ])
+        done = _make_visit(status=Queue.Status.DONE)
+        VisitSnapshot.objects.update_or_create(visit=done, defaults={"lat": 16.45, "lng": 102.85})
+
+    def _map(self, query, prefix=""):
+        return self.client.get(f"{prefix}/monitor/api/map/?{query}").json()
+
+    def test_clusters_stay_under_limit(self):
+        for prefix in ("", "/async"):
+            with self.subTest(prefix=prefix):
+                data = self._map(f"bbox={self.BBOX}&zoom=12", prefix)
+                self.assertEqual(data["total"], 300)
+                self.assertLessEqual(len(data["items"]), 50)
+                self.assertEqual(sum(item.get("count", 1) for item in data["items"]), 300)
+                self.assertIn("RED", {item["severity"] for item in data["items"]})
+
+    def test_close_zoom_returns_points(self):
+        data = self._map("bbox=102.8,16.4,102.81,16.41&zoom=19")
+        self.assertTrue(all(item["type"] == "point" for item in data["items"]))
+        self.assertEqual(data["total"], len(data["items"]))
+
+    def test_index_is_reused(self):
+        self._map("zoom=3")
+        with self.assertNumQueries(2):  # session + user
+            data = self._map("zoom=0")
+        self.assertEqual(len(data["items"]), 1)
+
+    def test_bad_params(self):
+        self.assertEqual(self.client.get("/monitor/api/map/?bbox=1,2,3").status_code, 400)
+        self.assertEqual(self.client.get("/monitor/api/map/?zoom=40").status_code, 400)
+        self.assertEqual(self.client.get("/map/").status_code, 200)
+
+
+@override_settings(TRACK_SEGMENT_SECONDS=900)
+class TrackTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.client.force_login(User.objects.create_user("nurse", password="x"))
+        self.visit = _make_visit()
+
+    def _walk(self, start, seconds, step=1):
+        """เดินเป็นเส้นตรงทีละ 1 วินาที เลี้ยวทุก 30 นาที"""
+        TelemetryLog.objects.bulk_create([
+            TelemetryLog(
+                visit=self.visit, ts=start + timedelta(seconds=i),
+                lat=16.4 + (0.00001 * i if i // 1800 % 2 == 0 else 0.018),
+                lng=102.8 + (0.00001 * i if i // 1800 % 2 else 0),
+            )
+            for i in range(0, seconds, step)
+        ])
+
+    def test_simplify(self):
+        self.assertEqual(tracks.simplify([(0, 0), (0, 0.00001), (0, 0.00002), (0.001, 0.00003)], 5), [0, 3])
+        self.assertEqual(tracks.simplify([(0, 0), (0.0005, 0.0005), (0, 0.001)], 5), [0, 1, 2])
+
+    def test_api_simplifies_and_caches_segments(self):
+        self._walk(timezone.now() - timedelta(hours=3), 3 * 3600)
+        url = f"/monitor/api/visit/{self.visit.id}/track/?minutes=180"
+
+        first = self.client.get(url).json()
+        self.assertGreater(first["raw_count"], 3 * 3600 - 10)
+        self.assertLess(len(first["points"]), 100)
+        self.assertEqual(first["cached_segments"], 0)
+
+        second = self.client.get(url).json()
+        self.assertGreater(second["cached_segments"], 5)
+        self.assertEqual(second["points"], first["points"])
+        self.assertGreater(len(self.client.get(url + "&tolerance=0").json()["points"]), len(first["points"]))
+
+    def test_bad_params(self):
+        url = f"/monitor/api/visit/{self.visit.id}/track/"
+        self.assertEqual(self.client.get(url + "?tolerance=abc").status_code, 400)
+        self.assertEqual(self.client.get(url + "?minutes=5000").status_code, 400)
+        self.assertEqual(self.client.get("/monitor/api/visit/999999/track/").status_code, 404)
+
+    def test_loads_only_uncached_ranges(self):
+        start = datetime.fromtimestamp(int(timezone.now().timestamp()) // 900 * 900 - 4 * 3600, dt_timezone.utc)
+        end = start + timedelta(hours=1)
+        self._walk(start, 3600, step=10)
+        segments = [(start + timedelta(seconds=s), start + timedelta(seconds=s + 900)) for s in range(0, 3600, 900)]
+
+        def load(now):
+            with mock.patch.object(tracks, "_load_points", wraps=tracks._load_points) as load_points:
+                track = tracks.visit_track(self.visit, start, end, 5.0, now)
+            return track, [c.args[1:] for c in load_points.call_args_list]
+
+        first, ranges = load(end + timedelta(hours=1))
+        self.assertEqual(ranges, [(start, end)])  # segment ติดกันทั้งหมด → อ่านครั้งเดียว
+
+        # cache หายเฉพาะ segment ที่ 0 กับ 2 → อ่านสองช่วงแยกกัน ไม่อ่านทับ segment 1
+        cache.delete_many([tracks._cache_key(self.visit.id, segments[i][0], 5.0) for i in (0, 2)])
+        second, ranges = load(end + timedelta(hours=1))
+        self.assertEqual(ranges, [segments[0], segments[2]])
+        self.assertEqual(second["cached_segments"], 2)
+        self.assertEqual(second["points"], first["points"])
+
+
+class QueueIndexTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(queue_index, "_index", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client.force_login(User.objects.create_user("nurse", password="x"))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.visits = [_make_visit(priority=3 - i % 3) for i in range(6)]
+
+    def test_same_answer_as_db(self):
+        url = f"/api/queue/?top=6&visit_id={self.visits[4].id}"
+        from_db = self.client.get(url).json()
+        with override_settings(QUEUE_INDEX_ENABLED=True):
+            from_index = self.client.get(url).json()
+        self.assertEqual(from_index, from_db)
+        self.assertEqual(from_index["next"], self.visits[2].id)
+
+    @override_settings(QUEUE_INDEX_ENABLED=True)
+    def test_follows_queue_changes(self):
+        queue_index.get_index()
+        with self.captureOnCommitCallbacks(execute=True):
+            first = self.visits[0].queue
+            first.priority = 1
+            first.save()
+            called = self.visits[2].queue
+            called.status = Queue.Status.CALLED
+            called.save()
+        data = self.client.get(f"/api/queue/?visit_id={self.visits[0].id}").json()
+        self.assertEqual((data["next"], data["position"], data["size"]), (self.visits[0].id, 1, 5))
+        with self.assertNumQueries(2):  # session + user
+            self.client.get("/api/queue/?top=3")
+
+    @override_settings(QUEUE_INDEX_ENABLED=True)
+    def test_reload_picks_up_writes_without_signals(self):
+        index = queue_index.get_index()
+        Queue.objects.filter(visit=self.visits[5]).update(priority=0)
+        self.assertEqual(index.reload(), 1)
+        self.assertEqual(index.next(), self.visits[5].id)
+        self.assertEqual(self.client.get("/monitor/api/summary/?since=0").json()["order"][0], self.visits[5].id)
+
+    def test_bad_top(self):
+        self.assertEqual(self.client.get("/api/queue/?top=x").status_code, 400)
+
+
+class CallNextTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(queue_index, "_index", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client.force_login(User.objects.create_user("nurse", password="x"))
+        self.visits = [_make_visit(priority=3 - i) for i in range(3)]
+
+    def _call_next(self):
+        return self.client.post("/api/queue/call-next/").json()["visit"]
+
+    @override_settings(QUEUE_INDEX_ENABLED=True)
+    def test_claims_head_of_queue_and_updates_index(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            queue_index.get_index()
+            visit = self._call_next()
+        self.assertEqual(visit["visit_id"], self.visits[2].id)
+        self.assertEqual(Queue.objects.get(visit=self.visits[2]).status, Queue.Status.CALLED)
+        self.assertEqual(queue_index.get_index().next(), self.visits[1].id)
+
+    def test_lost_claim_moves_to_next_candidate(self):
+        real_claim = claims._claim
+
+        def taken_by_other_station(q):
+            if q.visit_id == self.visits[2].id:
+                Queue.objects.filter(pk=q.pk).update(status=Queue.Status.CALLED)
+                return False
+            return real_claim(q)
+
+        with mock.patch.object(claims, "_claim", side_effect=taken_by_other_station):
+            self.assertEqual(claims.call_next().id, self.visits[1].id)
+
+    def test_call_visit_once(self):
+        self.client.get(f"/call/{self.visits[0].id}/")
+        called_at = Visit.objects.get(pk=self.visits[0].id).called_at
+        self.assertIsNotNone(called_at)
+        self.assertIsNone(claims.call_visit(self.visits[0].id))
+        self.assertEqual(Visit.objects.get(pk=self.visits[0].id).called_at, called_at)
+
+    def test_empty_queue_and_method(self):
+        for _ in self.visits:
+            self.assertIsNotNone(self._call_next())
+        self.assertIsNone(self._call_next())
+        self.assertEqual(self.client.get("/api/queue/call-next/").status_code, 405)
+
+
+class QueueStatsTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(stats, "_counter", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client.force_login(User.objects.create_user("nurse", password="x"))
+        for i in range(7):
+            _make_visit(priority=1 + i % 3, status=Queue.Status.CALLED if i == 6 else Queue.Status.WAITING)
+
+    def _stats(self):
+        data = self.client.get("/dashboard/api/stats/").json()
+        data.pop("server_time")
+        return data
+
+    def test_one_grouped_query(self):
+        with self.assertNumQueries(3):  # session + user + GROUP BY
+            data = self._stats()
+        totals = [data[k] for k in ("waiting_total", "called_total", "red_total", "yellow_total", "green_total")]
+        self.assertEqual(totals, [6, 1, 2, 2, 2])
+        with self.assertNumQueries(3):
+            self.assertEqual(self.client.get("/dashboard/").status_code, 200)
+
+    def test_counter_cache_follows_changes(self):
+        from_db = self._stats()
+        with override_settings(QUEUE_STATS_CACHE_ENABLED=True):
+            self.assertEqual(self._stats(), from_db)
+            with self.captureOnCommitCallbacks(execute=True):
+                queue = Queue.objects.filter(priority=1, status=Queue.Status.WAITING).first()
+                queue.priority = 3
+                queue.save()
+                queue.status = Queue.Status.DONE
+                queue.save()
+                _make_visit(priority=2)
+                self.client.post("/api/queue/call-next/")
+                Queue.objects.filter(priority=3, status=Queue.Status.WAITING).first().delete()
+
+            with self.assertNumQueries(2):  # session + user
+                data = self._stats()
+            self.assertEqual(data["by_status"][Queue.Status.DONE], 1)
+            self.assertEqual(stats.counts(), stats.load_counts())
+            self.assertEqual(stats._counter.reload(), 0)
+
+    @override_settings(QUEUE_STATS_CACHE_ENABLED=True)
+    def test_reload_reports_drift(self):
+        stats.counts()
+        Queue.objects.filter(status=Queue.Status.CALLED).update(status=Queue.Status.DONE)  # ไม่ผ่าน signal
+        self.assertEqual(stats._counter.reload(), 2)
+        self.assertEqual(stats.counts(), stats.load_counts())
+
+
+class LoadgenTests(SimpleTestCase):
+    """telemetry_loadgen: กำหนดการส่ง / replay / สรุปผล (ใช้ transport ปลอม ไม่แตะ DB)"""
+
+    class FakeTransport:
+        def __init__(self, fail_device=None):
+            self.sent = []
+            self.fail_device = fail_device
+            self.lock = threading.Lock()
+
+        def post(self, path, device_id, payload):
+            with self.lock:
+                self.sent.append((path, device_id, json.loads(payload)))
+            if device_id == self.fail_device:
+                return 403, b""
+            if path == loadgen.BATCH_PATH:
+                n = len(json.loads(payload)["readings"])
+                return 200, json.dumps({"accepted": n, "rejected": 0}).encode()
+            return 201, b"{}"
+
+        def close(self):
+            pass
+
+    def _sims(self, n):
+        return [loadgen.DeviceSim(f"loadgen-{i}", i, random.Random(i)) for i in range(n)]
+
+    def test_simulate_schedule_is_staggered_and_counts_per_device(self):
+        items = list(loadgen.simulate_schedule(self._sims(3), rate=2, duration=1.5, batch=1))
+        offsets = [t for t, _, _ in items]
+        self.assertEqual(offsets, sorted(offsets))
+        self.assertEqual(sorted({t for t in offsets[:3]}), [0.0, 0.5 / 3, 1.0 / 3])
+        counts = {}
+        for _, device_id, _ in items:
+            counts[device_id] = counts.get(device_id, 0) + 1
+        self.assertEqual(counts, {"loadgen-0": 3, "loadgen-1": 3, "loadgen-2": 3})
+
+        body = items[0][2]()
+        self.assertEqual(set(body), {"visit_id", "ts", "vitals", "gps"})
+
+        _, _, make_body = next(loadgen.simulate_schedule(self._sims(1), rate=4, duration=1, batch=4))
+        readings = make_body()["readings"]
+        self.assertEqual(len(readings), 4)
+        stamps = [datetime.fromisoformat(r["ts"]) for r in readings]
+        self.assertEqual(stamps, sorted(stamps))
+
+    def test_replay_schedule_scales_offsets_and_shifts_ts(self):
+        base = datetime(2026, 1, 1, tzinfo=dt_timezone.utc)
+        lines = [
+            {"device_id": "d", "visit_id": 1, "ts": (base + timedelta(seconds=s)).isoformat(), "vitals": {"bpm": 80}}
+            for s in (0, 10, 20)
+        ]
+        fast = list(loadgen.replay_schedule(json.loads(json.dumps(lines)), speed=10, keep_ts=True))
+        self.assertEqual([t for t, _, _ in fast], [0.0, 1.0, 2.0])
+        self.assertEqual(fast[2][2]()["ts"], lines[2]["ts"])
+        self.assertNotIn("device_id", fast[0][2]())
+
+        flat = list(loadgen.replay_schedule(json.loads(json.dumps(lines)), speed=0, keep_ts=False))
+        self.assertEqual([t for t, _, _ in flat], [0.0, 0.0, 0.0])
+        shifted = datetime.fromisoformat(flat[0][2]()["ts"])
+        self.assertLess(abs(shifted.timestamp() - time.time()), 5)
+
+    def test_run_records_capture_and_summarizes(self):
+        sims = self._sims(2)
+        transport = self.FakeTransport(fail_device="loadgen-1")
+        schedule = loadgen.simulate_schedule(sims, rate=100, duration=0.06, batch=2)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = f"{tmp}/capture.jsonl"
+            with open(path, "w", encoding="utf-8") as record:
+                result, elapsed = loadgen.run(schedule, transport, concurrency=2, record=record)
+            lines = loadgen.load_capture(path)
+
+        # ส่งทุก 0.02 วินาที: อุปกรณ์แรกที่ 0 / .02 / .04, ตัวที่สองเหลื่อมไป .01 → ตัวละ 3 request
+        self.assertEqual(result.requests, 6)
+        self.assertEqual({path for path, _, _ in transport.sent}, {loadgen.BATCH_PATH})
+        self.assertEqual(len(lines), 6)
+        self.assertEqual(loadgen.capture_visit_ids(lines), {0, 1})
+
+        zero = {m.__name__: 0 for m in loadgen.COUNTED_MODELS}
+        summary = loadgen.summarize(result, elapsed, zero, zero)
+        self.assertEqual(summary["readings_accepted"], 6)
+        self.assertEqual(summary["readings_rejected"], 6)
+        self.assertEqual(summary["errors"], {"HTTP 403": 3})
+        self.assertEqual(summary["error_rate"], 0.5)
+
+    def test_percentile(self):
+        values = list(range(101))
+        self.assertEqual(loadgen.percentile(values, 50), 50)
+        self.assertEqual(loadgen.percentile(values, 99), 99)
+        self.assertEqual(loadgen.percentile([], 99), 0.0)
+
+
+class SyntheticDataTests(TestCase):
+    """generate_synthetic_data: ขนาดเล็กพอให้รันใน test ได้ แต่ข้ามหลาย chunk"""
+
+    TINY = {
+        "preset": "clinic", "patients": 20, "visits": 25, "devices": 3, "days": 2,
+        "monitored": 1.0, "interval_s": 600, "chunk_size": 10, "batch_size": 50,
+    }
+
+    def _run(self, **opts):
+        out = io.StringIO()
+        call_command("generate_synthetic_data", stdout=out, **{**self.TINY, **opts})
+        return out.getvalue()
+
+    def test_dry_run_writes_nothing(self):
+        out = self._run(dry_run=True)
+        self.assertIn("25 visits", out)
+        self.assertEqual((Patient.objects.count(), Visit.objects.count(), TelemetryLog.objects.count()), (0, 0, 0))
+
+    def test_creates_consistent_rows(self):
+        out = self._run()
+        self.assertIn("created 20 patients, 25 visits", out)
+        self.assertEqual(Patient.objects.count(), 20)
+        self.assertEqual(Device.objects.filter(device_id__startswith=synth.DEVICE_PREFIX).count(), 3)
+        # ทุก visit มีคิว / vitals / triage / snapshot ครบ
+        for model in (Queue, VitalSign, TriageResult, VisitSnapshot):
+            self.assertEqual(model.objects.count(), 25, model.__name__)
+
+        logs = TelemetryLog.objects.all()
+        self.assertGreater(logs.count(), 0)
+        self.assertFalse(logs.filter(ts__gt=timezone.now()).exists())
+        self.assertFalse(logs.exclude(device__device_id__startswith=synth.DEVICE_PREFIX).exists())
+        # snapshot ชี้ log ล่าสุดของ visit
+        visit = logs.latest("ts").visit
+        self.assertEqual(visit.snapshot.last_log_ts, logs.filter(visit=visit).latest("ts").ts)
+
+        # WAITING ยังไม่ถูกเรียก, CALLED / DONE ถูกเรียกแล้ว
+        self.assertFalse(Queue.objects.filter(status=Queue.Status.WAITING, visit__called_at__isnull=False).exists())
+        self.assertFalse(Queue.objects.filter(status=Queue.Status.CALLED, visit__called_at__isnull=True).exists())
+
+    def test_same_seed_same_data(self):
+        self._run(seed=7)
+        first = list(Visit.objects.order_by("id").values_list("final_severity", flat=True))
+        Patient.objects.all().delete()
+        self._run(seed=7)
+        self.assertEqual(list(Visit.objects.order_by("id").values_list("final_severity", flat=True)), first)
+
+    def test_rejects_bad_options(self):
+        with self.assertRaises(CommandError):
+            self._run(monitored=1.5)
+        with self.assertRaises(CommandError):
+            self._run(visits=0)
+
+
+@override_settings(PROFILING_ENABLED=True, PROFILING_SAMPLE_RATE=1.0)
+class ProfilingTests(TestCase):
+    """ProfilingMiddleware + /ops/profiling/ (store แยกต่อ test, ถอด execute_wrapper ออกหลังจบ)"""
+
+    def setUp(self):
+        patcher = mock.patch.object(profiling, "store", profiling.ProfileStore())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # production: install() ตอนสร้าง middleware ก่อนเปิด connection  ใน test connection เปิดไว้ก่อนแล้ว
+        profiling._attach(connection)
+        self.addCleanup(self._uninstall)
+        summary_cache.summary_cache.clear()
+        _make_visit()
+        self.staff = User.objects.create_user("ops", password="x", is_staff=True)
+        self.client.force_login(self.staff)
+
+    def _uninstall(self):
+        connection_created.disconnect(dispatch_uid="config.profiling.attach")
+        with suppress(ValueError):
+            connection.execute_wrappers.remove(profiling._sql_timer)
+
+    def _view(self, name, sort="total"):
+        return next(v for v in profiling.store.top(sort) if v["view"] == name)
+
+    def test_records_queries_per_view(self):
+        self.client.get("/monitor/api/summary/")
+        self.client.get("/monitor/api/summary/")
+        self.client.get("/monitor/api/latest/")
+
+        stats = self._view("monitor_summary_api", sort="queries")
+        self.assertEqual(stats["count"], 2)
+        self.assertGreater(stats["queries_mean"], 0)
+        self.assertTrue(stats["slowest_sql"])
+        self.assertLessEqual(len(stats["slowest_sql"]), 5)
+
+        data = self.client.get("/ops/profiling/?sort=queries").json()
+        self.assertIn("monitor_latest_api", [v["view"] for v in data["views"]])
+        self.assertEqual(self.client.get("/ops/profiling/?sort=bad").status_code, 400)
+
+    @override_settings(PROFILING_SAMPLE_RATE=0.0)
+    def test_unsampled_requests_are_not_recorded(self):
+        self.client.get("/monitor/api/summary/")
+        self.assertEqual(profiling.store.top(), [])
+
+    def test_cprofile_capture_for_staff(self):
+        resp = self.client.get("/monitor/api/summary/", headers={"X-Profile": "1"})
+        self.assertEqual(resp.status_code, 200)
+        profile_id = resp["X-Profile-Id"]
+        self.assertTrue(profile_id.isdigit(), profile_id)
+
+        text = self.client.get(f"/ops/profiling/{profile_id}/").content.decode()
+        self.assertIn("monitor_summary_api", text)
+        self.assertIn("cumulative", text)
+        self.assertEqual(self.client.get("/ops/profiling/999/").status_code, 404)
+
+    @override_settings(PROFILING_CPROFILE_TOKEN="secret", PROFILING_SAMPLE_RATE=0.0)
+    def test_non_staff_needs_token(self):
+        self.client.force_login(User.objects.create_user("nurse", password="x"))
+        for headers in ({"X-Profile": "1"}, {"X-Profile": "1", "X-Profile-Token": "wrong\u00e9"}):
+            resp = self.client.get("/monitor/api/summary/", headers=headers)
+            self.assertNotIn("X-Profile-Id", resp)
+        # X-Profile ที่ไม่มีสิทธิ์ไม่ถูกนับเป็นตัวอย่าง
+        self.assertEqual(profiling.store.top(), [])
+        self.assertEqual(self.client.get("/ops/profiling/").status_code, 302)
+
+        resp = self.client.get("/monitor/api/summary/", headers={"X-Profile": "1", "X-Profile-Token": "secret"})
+        self.assertTrue(resp["X-Profile-Id"].isdigit())
+
+    @override_settings(PROFILING_MAX_VIEWS=1)
+    def test_extra_views_fold_into_other(self):
+        prof = profiling.RequestProfile(keep=5)
+        for view in ("a", "b", "c"):
+            profiling.store.record(view, 3.0, 200, prof)
+        self.assertEqual(sorted(v["view"] for v in profiling.store.top()), ["<other>", "a"])
+        self.assertEqual(self._view("<other>")["count"], 2)
+
+    async def test_async_views_count_queries_but_not_cprofile(self):
+        await self.async_client.aforce_login(self.staff)
+        # ORM ของ async view วิ่งใน thread อื่น query ยังต้องนับเข้า request ผ่าน ContextVar
+        resp = await self.async_client.get("/async/monitor/api/latest/", headers={"X-Profile": "1"})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp["X-Profile-Id"], "unsupported")
+        self.assertGreater(self._view("async_monitor_latest_api")["queries_mean"], 0)
+
+
+class MetricsTests(TestCase):
+    """/metrics + counter ที่ view / ingest นับ (registry เป็นของทั้ง process → ตรวจเป็นส่วนต่าง)"""
+
+    def setUp(self):
+        credential_cache.clear()
+        Device.objects.create(device_id="dev-1", api_key="k")
+        self.visit = _make_visit()
+
+    def _post(self, body):
+        return self.client.post(
+            "/api/iot/telemetry/", data=json.dumps(body), content_type="application/json", **DEVICE_HEADERS,
+        )
+
+    def test_ingest_and_request_counters(self):
+        written = metrics.telemetry_readings.value("written")
+        rejected = metrics.telemetry_readings.value("rejected")
+        ok = metrics.http_requests.value("iot_telemetry", "2xx")
+        self.assertEqual(self._post({"visit_id": self.visit.id, "vitals": {"bpm": 80}}).status_code, 200)
+        self._post({"visit_id": 999999})
+
+        self.assertEqual(metrics.telemetry_readings.value("written"), written + 1)
+        self.assertEqual(metrics.telemetry_readings.value("rejected"), rejected + 1)
+        self.assertEqual(metrics.http_requests.value("iot_telemetry", "2xx"), ok + 1)
+
+    def test_scrape_renders_collectors(self):
+        self.client.force_login(User.objects.create_user("ops", password="x", is_staff=True))
+        self.client.post("/api/queue/call-next/")
+        resp = self.client.get("/metrics")
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp["Content-Type"].startswith("text/plain; version=0.0.4"))
+        body = resp.content.decode()
+        self.assertIn('hospital_queue_length{status="CALLED",priority="3"} 1', body)
+        self.assertIn('hospital_queue_actions_total{action="call"}', body)
+        self.assertIn('hospital_http_request_duration_seconds_bucket{view="call_next_api",le="+Inf"}', body)
+
+    def test_requires_staff_or_token(self):
+        # localhost ไม่ได้รับยกเว้น (หลัง reverse proxy ทุก request มาจาก 127.0.0.1)
+        self.assertEqual(self.client.get("/metrics", REMOTE_ADDR="127.0.0.1").status_code, 403)
+        with override_settings(METRICS_TOKEN="s3cret"):
+            self.assertEqual(self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer s3cret").status_code, 200)
+            self.assertEqual(self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer wrong").status_code, 403)
+            self.assertEqual(self.client.get("/metrics").status_code, 403)
+            self.client.force_login(User.objects.create_user("ops", password="x", is_staff=True))
+            self.assertEqual(self.client.get("/metrics").status_code, 200)
+
+    def test_instrument_counts_exceptions_as_5xx(self):
+        @metrics.instrument("test_broken")
+        def broken(request):
+            raise RuntimeError("boom")
+
+        @metrics.instrument("test_broken_async")
+        async def broken_async(request):
+            raise RuntimeError("boom")
+
+        with self.assertRaises(RuntimeError):
+            broken(None)
+        with self.assertRaises(RuntimeError):
+            asyncio.run(broken_async(None))
+        for name in ("test_broken", "test_broken_async"):
+            self.assertEqual(metrics.http_requests.value(name, "5xx"), 1)
+            self.assertEqual(metrics.http_latency.count(name), 1)
+
+
+class PerformanceBudgetTests(TestCase):
+    """
+    งบจำนวน query ของ view ที่ถูกเรียกบ่อย บนข้อมูลขนาดใหญ่พอให้ N+1 / full scan เห็นชัด
+    ถ้าเกินงบ: ดูว่าเพิ่ม query ต่อแถว หรือ filter บน column ที่ไม่มี index หรือเปล่า
+    (ไม่วัดเวลา: ขึ้นกับเครื่อง CI จับได้แต่ความช้าแบบสุ่ม)
+    """
+
+    VISITS = 300          # WAITING 200 (เต็ม MONITOR_QUEUE_LIMIT), CALLED 50, DONE 50
+    LOGS_PER_VISIT = 40
+
+    # url name → จำนวน query สูงสุด  ทุกตัวต้องไม่ขึ้นกับจำนวน visit / log
+    # transaction ใน TestCase เห็นเป็น SAVEPOINT + RELEASE (production เป็น BEGIN / COMMIT ที่ไม่นับ)
+    BUDGETS = {
+        # session + user + คิว WAITING
+        "queue_list": 3,
+        # session + user + คิว + log ล่าสุดของทุก visit
+        "monitor_latest_api": 4,
+        # session + user + visit (join snapshot / vitals / triage) + ลำดับคิว
+        "monitor_summary_api": 4,
+        # session + user + cutoff + series ละ 1 (bpm, o2)
+        "monitor_sparklines_api": 5,
+        # session + user (หน้า HTML เปล่า ข้อมูลมาจาก API)
+        "map_view": 2,
+        # session + user + สร้าง map index (ครั้งแรก ก่อนเข้า cache)
+        "monitor_map_api": 3,
+        # reading เดียว: baseline เดิม 7 = device (credential cache ว่าง) + visit + transaction 2
+        #   + insert log + VitalSign อ่าน / เขียน
+        # + VisitSnapshot อ่าน / upsert 2 (ไม่ให้ log ที่มาช้าทับค่าใหม่)
+        # + rollup อ่าน / เขียน 2 + savepoint 2 (ชน unique กับ ingest อื่นแล้ว retry ได้โดยไม่ทิ้ง log)
+        "iot_telemetry": 13,
+        # session + user + ฟอร์มเช็คซ้ำ national_id / hn 2 + transaction 2
+        # + get_or_create patient 4 (select + savepoint 2 + insert) + สุ่ม HN ไม่ซ้ำ 1
+        # + visit 1 + triage (อ่าน vitals) 1 + บันทึกสีกลับลง visit 1 + queue 1
+        # + snapshot.touch หลัง save visit (สร้าง / บันทึกสี) / queue 3
+        "register_patient": 18,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("perf", password="x")
+        cls.device = Device.objects.create(device_id="perf-dev", api_key="k")
+        now = timezone.now()
+
+        patients = Patient.objects.bulk_create([
+            Patient(first_name=f"p{i}", last_name="perf", national_id=f"9{i:012d}", hn=f"P{i:05d}")
+            for i in range(cls.VISITS)
+        ])
+        visits = Visit.objects.bulk_create([
+            Visit(patient=p, final_severity=("RED", "YELLOW", "GREEN")[i % 3]) for i, p in enumerate(patients)
+        ])
+        statuses = ["WAITING"] * 200 + ["CALLED"] * 50 + ["DONE"] * 50
+        Queue.objects.bulk_create([
+            Queue(visit=v, status=statuses[i], priority=1 + i % 3) for i, v in enumerate(visits)
+        ])
+        TelemetryLog.objects.bulk_create([
+            TelemetryLog(
+                visit=v, device=cls.device,
+                ts=now - timedelta(seconds=5 * (cls.LOGS_PER_VISIT - j)),
+                bpm=60 + j, o2sat=95, lat=16.44 + i * 1e-4, lng=102.83 + j * 1e-5,
+            )
+            for i, v in enumerate(visits)
+            for j in range(cls.LOGS_PER_VISIT)
+        ], batch_size=2000)
+        snapshots.rebuild()
+        cls.visits = visits
+
+    def setUp(self):
+        credential_cache.clear()
+        self.client.force_login(self.user)
+        # cache ระดับ process ต้องว่างทุก test ให้วัดงานจริง
+        summary_cache.summary_cache.clear()
+        geo._index.clear()
+
+    def _request(self, name):
+        ids = ",".join(str(v.id) for v in self.visits[:50])
+        if name == "monitor_sparklines_api":
+            return self.client.get(f"/monitor/api/sparklines/?visit_ids={ids}")
+        if name == "monitor_map_api":
+            return self.client.get("/monitor/api/map/?bbox=102.7,16.3,103.0,16.6&zoom=14")
+        if name == "iot_telemetry":
+            return self.client.post(
+                "/api/iot/telemetry/",
+                data={"visit_id": self.visits[0].id, "vitals": {"bpm": 88}, "gps": {"lat": 16.44, "lng": 102.83}},
+                content_type="application/json",
+                HTTP_X_DEVICE_ID="perf-dev",
+                HTTP_X_API_KEY="k",
+            )
+        if name == "register_patient":
+            return self.client.post("/patients/register/", data={
+                "first_name": "new", "last_name": "patient", "national_id": "1234567890123",
+                "gender": "UNKNOWN", "blood_type": "UNKNOWN",
+            })
+        return self.client.get(reverse(name))
+
+    def _measure(self, name):
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self._request(name)
+        self.assertLess(resp.status_code, 400, f"{name}: {resp.status_code}")
+        return ctx.captured_queries
+
+    def test_query_budgets(self):
+        for name, max_queries in self.BUDGETS.items():
+            with self.subTest(view=name):
+                queries = self._measure(name)
+                self.assertLessEqual(
+                    len(queries), max_queries,
+                    f"{name} ใช้ {len(queries)} query:\n" + "\n".join(q["sql"] for q in queries),
+                )
+
+    @skipUnless(connection.vendor == "sqlite", "EXPLAIN QUERY PLAN ของ SQLite")
+    def test_no_full_table_scans(self):
+        """query ของ view เหล่านี้ต้องไม่ SCAN ทั้งตาราง queue / visit / telemetrylog"""
+        watched = {"queues_queue", "queues_visit", "queues_telemetrylog"}
+        for name in self.BUDGETS:
+            with self.subTest(view=name):
+                queries = self._measure(name)
+                for q in queries:
+                    for table in _full_scans(q["sql"]):
+                        self.assertNotIn(table, watched, f"{name}: SCAN {table}\n{q['sql']}")
+
+
+SCAN_RE = re.compile(r"^SCAN (\w+)(?: AS (\w+))?(?! USING)")
+ALIAS_RE = re.compile(r'"(\w+)" (?:AS )?"?([A-Z]\d+)"?')
+
+
+def _full_scans(sql):
+    """ตารางที่ SQLite ต้องอ่านทั้งตาราง (SCAN ที่ไม่ใช้ index) ของ SELECT นี้"""
+    if not sql.lstrip().upper().startswith(("SELECT", "WITH")):
+        return []
+    aliases = dict((alias, table) for table, alias in ALIAS_RE.findall(sql))
+    with connection.cursor() as cursor:
+        cursor.execute("EXPLAIN QUERY PLAN " + sql)
+        details = [row[-1] for row in cursor.fetchall()]
+    out = []
+    for detail in details:
+        m = SCAN_RE.match(detail)
+        if m and "USING" not in detail:
+            name = m.group(2) or m.group(1)
+            out.append(aliases.get(name, name))
+    return out
@@ -0,0 +1,235 @@
+"""
+GPS track: เส้นทางของ visit จาก lat/lng ใน TelemetryLog (+ archive) ย่อด้วย Douglas-Peucker
+
+- ช่วงเวลาที่ขอถูกแบ่งเป็น segment ยาว TRACK_SEGMENT_SECONDS ตรงตามนาฬิกา (ไม่ขึ้นกับตอนที่ขอ)
+  แต่ละ segment ย่อแยกกันแล้วต่อกัน (จุดแรก/สุดท้ายของแต่ละ segment อยู่เสมอ)
+- segment ที่จบไปแล้วเกิน TRACK_FINALIZE_SECONDS (เผื่อ log มาช้า) เก็บผลไว้ใน django cache
+  ดูซ้ำ / เลื่อนช่วงเวลา → คำนวณเฉพาะ segment ล่าสุดที่ยังเปิดอยู่
+- tolerance เป็นเมตร (ระยะตั้งฉากสูงสุดที่ยอมให้เส้นที่ย่อแล้วเบี่ยงจากจุดจริง)
+"""
+import math
+from bisect import bisect_left
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import archive
+from .models import TelemetryLog
+
+METERS_PER_DEG_LAT = 110_540.0
+METERS_PER_DEG_LNG = 111_320.0
+MAX_TOLERANCE_M = 1000.0
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def segment_seconds():
+    return int(_setting("TRACK_SEGMENT_SECONDS", 900))
+
+
+# -----------------------------
+# params
+# -----------------------------
+def _parse_dt(value, name):
+    dt = parse_datetime(value)
+    if dt is None:
+        raise ValueError(f"{name} must be an ISO datetime")
+    if timezone.is_naive(dt):
+        dt = timezone.make_aware(dt)
+    return dt
+
+
+def parse_window(params, now):
+    """
+    ?from=&to= (ISO) หรือ ?minutes=N (ย้อนจาก to / ตอนนี้, ค่าเริ่มต้น 60)
+    return: (start, end)  ผิดรูป / ยาวเกิน TRACK_MAX_WINDOW_HOURS → ValueError
+    """
+    end = _parse_dt(params["to"], "to") if params.get("to") else now
+    if params.get("from"):
+        start = _parse_dt(params["from"], "from")
+    else:
+        try:
+            minutes = int(params.get("minutes") or 60)
+        except ValueError:
+            raise ValueError("minutes must be an integer")
+        if minutes <= 0:
+            raise ValueError("minutes must be positive")
+        start = end - timedelta(minutes=minutes)
+
+    if start >= end:
+        raise ValueError("from must be before to")
+    max_hours = _setting("TRACK_MAX_WINDOW_HOURS", 24)
+    if end - start > timedelta(hours=max_hours):
+        raise ValueError(f"window must not exceed {max_hours} hours")
+    return start, min(end, now)
+
+
+def parse_tolerance(value):
+    if value in (None, ""):
+        return float(_setting("TRACK_TOLERANCE_M", 5.0))
+    try:
+        tol = float(value)
+    except ValueError:
+        raise ValueError("tolerance must be a number (meters)")
+    if not 0 <= tol <= MAX_TOLERANCE_M:
+        raise ValueError(f"tolerance must be between 0 and {MAX_TOLERANCE_M:g} meters")
+    return tol
+
+
+# -----------------------------
+# Douglas-Peucker
+# -----------------------------
+def _project(points):
+    """(lat, lng) → (x, y) เมตร บนระนาบรอบจุดแรก (พอสำหรับระยะในโรงพยาบาล / เมือง)"""
+    lat0 = points[0][0]
+    kx = METERS_PER_DEG_LNG * math.cos(math.radians(lat0))
+    return [(lng * kx, lat * METERS_PER_DEG_LAT) for lat, lng in points]
+
+
+def _distance_to_segment(p, a, b):
+    (px, py), (ax, ay), (bx, by) = p, a, b
+    dx, dy = bx - ax, by - ay
+    length2 = dx * dx + dy * dy
+    if length2 == 0:
+        return math.hypot(px - ax, py - ay)
+    t = max(0.0, min(1.0, ((px - ax) * dx + (py - ay) * dy) / length2))
+    return math.hypot(px - (ax + t * dx), py - (ay + t * dy))
+
+
+def simplify(points, tolerance):
+    """
+    points: [(lat, lng), ...] เรียงตามเวลา
+    return: index ของจุดที่เหลือ (เรียงจากน้อยไปมาก, มีจุดแรกและจุดสุดท้ายเสมอ)
+    """
+    n = len(points)
+    if n <= 2:
+        return list(range(n))
+
+    xy = _project(points)
+    keep = [False] * n
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    # วนด้วย stack แทน recursion (track ยาว ๆ ไม่ชน recursion limit)
+    while stack:
+        first, last = stack.pop()
+        worst, worst_i = -1.0, None
+        for i in range(first + 1, last):
+            d = _distance_to_segment(xy[i], xy[first], xy[last])
+            if d > worst:
+                worst, worst_i = d, i
+        if worst_i is not None and worst > tolerance:
+            keep[worst_i] = True
+            stack.append((first, worst_i))
+            stack.append((worst_i, last))
+    return [i for i in range(n) if keep[i]]
+
+
+# -----------------------------
+# segments
+# -----------------------------
+def _segments(start, end):
+    """[(seg_start, seg_end)] ที่ตรงตามนาฬิกาและครอบ [start, end)"""
+    size = segment_seconds()
+    first = int(start.timestamp()) // size * size
+    out = []
+    t = first
+    while t < end.timestamp():
+        out.append((
+            datetime.fromtimestamp(t, dt_timezone.utc),
+            datetime.fromtimestamp(t + size, dt_timezone.utc),
+        ))
+        t += size
+    return out
+
+
+def _cache_key(visit_id, seg_start, tolerance):
+    return f"track:{visit_id}:{int(seg_start.timestamp())}:{segment_seconds()}:{tolerance:g}"
+
+
+def _load_points(visit, start, end):
+    """[(ts, lat, lng)] ใน [start, end) เรียงตามเวลา จากตารางหลัก + archive (ตัดซ้ำด้วย id)"""
+    rows = {
+        pk: (ts, float(lat), float(lng))
+        for pk, ts, lat, lng in (
+            TelemetryLog.objects
+            .filter(visit=visit, ts__gte=start, ts__lt=end, lat__isnull=False, lng__isnull=False)
+            .values_list("id", "ts", "lat", "lng")
+        )
+    }
+    first_day = start.astimezone(dt_timezone.utc).date()
+    last_day = end.astimezone(dt_timezone.utc).date()
+    for day in archive.archived_days(first_day):
+        if day > last_day:
+            break
+        for r in archive.read_day(day, visit_id=visit.id):
+            if r["id"] in rows or r["lat"] is None or r["lng"] is None:
+                continue
+            if start <= r["ts"] < end:
+                rows[r["id"]] = (r["ts"], float(r["lat"]), float(r["lng"]))
+    return sorted(rows.values())
+
+
+def _simplify_segment(points, tolerance):
+    kept = simplify([(lat, lng) for _, lat, lng in points], tolerance)
+    return {
+        "raw": len(points),
+        "points": [[points[i][1], points[i][2], points[i][0].isoformat()] for i in kept],
+    }
+
+
+def _adjacent_runs(ranges):
+    """[(lo, hi)] เรียงตามเวลา → กลุ่มของช่วงที่ต่อกันพอดี (hi ของตัวก่อน == lo ของตัวถัดไป)"""
+    runs = []
+    for lo, hi in ranges:
+        if runs and runs[-1][-1][1] == lo:
+            runs[-1].append((lo, hi))
+        else:
+            runs.append([(lo, hi)])
+    return runs
+
+
+def visit_track(visit, start, end, tolerance, now=None):
+    """
+    return: {"points": [[lat, lng, ts], ...], "raw_count": n, "cached_segments": k}
+    segment แรก / สุดท้ายถูกตัดตาม start / end ที่ขอ (ไม่ cache ถ้าไม่เต็ม segment)
+    """
+    now = now or timezone.now()
+    finalized_before = now - timedelta(seconds=_setting("TRACK_FINALIZE_SECONDS", 300))
+    cache_ttl = _setting("TRACK_CACHE_TTL", 24 * 3600)
+
+    segments = []
+    for seg_start, seg_end in _segments(start, end):
+        lo, hi = max(seg_start, start), min(seg_end, end)
+        cacheable = lo == seg_start and hi == seg_end and seg_end <= finalized_before
+        segments.append((lo, hi, _cache_key(visit.id, seg_start, tolerance) if cacheable else None))
+
+    cached = cache.get_many([key for _, _, key in segments if key])
+    todo = [(lo, hi) for lo, hi, key in segments if key not in cached]
+
+    loaded = {}
+    for run in _adjacent_runs(todo):
+        # segment ที่ติดกันอ่าน DB ครั้งเดียวแล้วแบ่งเอง (ไม่อ่านข้ามช่วงที่ cache ไว้แล้ว)
+        points = _load_points(visit, run[0][0], run[-1][1])
+        times = [p[0] for p in points]
+        for lo, hi in run:
+            loaded[lo] = points[bisect_left(times, lo):bisect_left(times, hi)]
+
+    out, raw, to_cache = [], 0, {}
+    for lo, hi, key in segments:
+        if key in cached:
+            seg = cached[key]
+        else:
+            seg = _simplify_segment(loaded[lo], tolerance)
+            if key:
+                to_cache[key] = seg
+        out.extend(seg["points"])
+        raw += seg["raw"]
+    if to_cache:
+        cache.set_many(to_cache, cache_ttl)
+
+    return {"points": out, "raw_count": raw, "cached_segments": len(cached)}
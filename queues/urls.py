@@ -1,6 +1,6 @@
 from django.urls import path
 from django.views.generic import RedirectView
-from . import views
+from . import metrics, views
 
 urlpatterns = [
     path("", views.queue_list, name="queue_list"),
@@ -8,6 +8,8 @@ urlpatterns = [
     # queue actions
     path("triage/<int:visit_id>/", views.triage_visit, name="triage_visit"),
     path("call/<int:visit_id>/", views.call_visit, name="call_visit"),
+    path("api/queue/", views.queue_api, name="queue_api"),
+    path("api/queue/call-next/", views.call_next_api, name="call_next_api"),
 
     # optional manual location update (ทางเลือก B)
     path("location/<int:visit_id>/", views.update_location, name="update_location"),
@@ -16,13 +18,19 @@ urlpatterns = [
     path("monitor/", views.monitor_dashboard, name="monitor_dashboard"),
     path("monitor/api/latest/", views.monitor_latest_api, name="monitor_latest_api"),
     path("monitor/visit/<int:visit_id>/", views.monitor_visit_detail, name="monitor_visit_detail"),
+    path("monitor/visit/<int:visit_id>/export.csv", views.monitor_visit_export, name="monitor_visit_export"),
     path("monitor/api/summary/", views.monitor_summary_api, name="monitor_summary_api"),
+    path("monitor/api/visit/<int:visit_id>/track/", views.monitor_track_api, name="monitor_track_api"),
 
     # map
     path("map/", views.map_view, name="map_view"),
+    path("monitor/api/map/", views.monitor_map_api, name="monitor_map_api"),
 
     # iot api
     path("api/iot/telemetry/", views.iot_telemetry, name="iot_telemetry"),
+    path("api/iot/telemetry/batch/", views.iot_telemetry_batch, name="iot_telemetry_batch"),
+    path("metrics", metrics.metrics_view, name="metrics"),  # Prometheus (queues/metrics.py)
+    path("api/iot/telemetry/stats/", views.iot_ingest_stats_api, name="iot_ingest_stats_api"),
 
     path("monitor/api/sparklines/", views.monitor_sparklines_api, name="monitor_sparklines_api"),
 
@@ -1,11 +1,17 @@
 from datetime import timedelta
+import csv
+import hashlib
+import io
 import json
 
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.db.models import OuterRef, Subquery
-from django.http import JsonResponse
+from django.db.models import F, OuterRef, Q, Subquery
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.utils import timezone
+from django.utils.http import parse_etags, quote_etag
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST, require_GET
 import random , string
@@ -16,6 +22,19 @@ from django.apps import apps
 
 
 from .models import Queue, Visit, Device, TelemetryLog, VitalSign
+from . import (
+    archive, claims, events, geo, metrics, queue_index, recent, rollups, snapshots, sparklines, summary_cache, tracks,
+)
+from .ingest_buffer import get_buffer, is_buffered
+from .wire import decode_packet, is_wire_request
+from .telemetry import (
+    BATCH_MAX as TELEMETRY_BATCH_MAX,
+    TelemetryError,
+    authenticate_device,
+    ingest_logs,
+    missing_visit_ids,
+    parse_reading,
+)
 
 
 # -----------------------------
@@ -25,27 +44,98 @@ from .models import Queue, Visit, Device, TelemetryLog, VitalSign
 def queue_list(request):
     q_items = (
         Queue.objects
-        .select_related("visit", "visit__patient")
+        # template แสดง AI severity ต่อแถว → ดึง triage_result มาพร้อมกัน
+        .select_related("visit", "visit__patient", "visit__triage_result")
         .filter(status="WAITING")
-        .order_by("priority", "created_at")
     )
+    index = queue_index.get_index()
+    if index is None:
+        q_items = q_items.order_by("priority", "created_at")
+    else:
+        # ลำดับจาก index ไม่ต้องให้ DB เรียง (ถ้า index ช้ากว่า DB แถวที่ไม่ WAITING แล้วหลุดไปเอง)
+        order = index.top()
+        rows = {q.visit_id: q for q in q_items.filter(visit_id__in=order)}
+        q_items = [rows[vid] for vid in order if vid in rows]
     return render(request, "queues/queue_list.html", {"q_items": q_items})
 
 
+def _queue_position_db(visit_id):
+    q = Queue.objects.filter(visit_id=visit_id, status="WAITING").first()
+    if q is None:
+        return None
+    ahead = Queue.objects.filter(status="WAITING").filter(
+        Q(priority__lt=q.priority)
+        | Q(priority=q.priority, created_at__lt=q.created_at)
+        | Q(priority=q.priority, created_at=q.created_at, id__lt=q.id)
+    )
+    return ahead.count() + 1
+
+
+@metrics.instrument("queue_api")
+@login_required
+@require_GET
+def queue_api(request):
+    """
+    GET /api/queue/?top=10&visit_id=5
+    → size, next (visit_id คนถัดไป), top (visit_id ตามลำดับ), position (ลำดับของ visit_id ที่ถาม, ไม่ได้รอ → null)
+    queue_index เปิดอยู่ → ตอบจากหน่วยความจำ ไม่งั้นถาม DB
+    """
+    try:
+        n = int(request.GET.get("top") or 10)
+        visit_id = int(request.GET["visit_id"]) if request.GET.get("visit_id") else None
+    except ValueError:
+        return JsonResponse({"ok": False, "error": "top / visit_id must be integers"}, status=400)
+    if not 0 <= n <= MONITOR_QUEUE_LIMIT:
+        return JsonResponse({"ok": False, "error": f"top must be between 0 and {MONITOR_QUEUE_LIMIT}"}, status=400)
+
+    index = queue_index.get_index()
+    if index is not None:
+        top = index.top(n)
+        payload = {"size": len(index), "next": index.next(), "top": top}
+        if visit_id is not None:
+            payload["position"] = index.position(visit_id)
+    else:
+        waiting = Queue.objects.filter(status="WAITING")
+        top = list(waiting.order_by("priority", "created_at", "id").values_list("visit_id", flat=True)[:max(n, 1)])
+        payload = {"size": waiting.count(), "next": top[0] if top else None, "top": top[:n]}
+        if visit_id is not None:
+            payload["position"] = _queue_position_db(visit_id)
+    return JsonResponse({"ok": True, **payload})
+
+
+@metrics.instrument("call_visit")
 @login_required
 def call_visit(request, visit_id: int):
-    visit = get_object_or_404(Visit, id=visit_id)
-    q = getattr(visit, "queue", None)
-    if q and q.status == "WAITING":
-        q.status = "CALLED"
-        q.save(update_fields=["status"])
+    get_object_or_404(Visit, id=visit_id)
+    # WAITING → CALLED แบบ atomic: กดพร้อมกันสองจุดมีแค่จุดเดียวที่เรียกได้
+    claims.call_visit(visit_id)
+    return redirect("queue_list")
 
-        visit.called_at = timezone.now()
-        visit.save(update_fields=["called_at"])
 
-    return redirect("queue_list")
+@metrics.instrument("call_next_api")
+@login_required
+@require_POST
+def call_next_api(request):
+    """
+    POST /api/queue/call-next/
+    เรียกคนถัดไป (priority แล้วมาก่อนก่อน) แบบ atomic ให้หลายจุดเรียกใช้พร้อมกันได้ (queues/claims.py)
+    → {"ok": true, "visit": {...}} หรือ "visit": null ถ้าไม่มีคิวรอ
+    """
+    visit = claims.call_next()
+    if visit is None:
+        return JsonResponse({"ok": True, "visit": None})
+    return JsonResponse({
+        "ok": True,
+        "visit": {
+            "visit_id": visit.id,
+            "patient_name": f"{visit.patient.first_name} {visit.patient.last_name}",
+            "severity": visit.final_severity,
+            "called_at": visit.called_at.isoformat(),
+        },
+    })
 
 
+@metrics.instrument("triage_visit")
 @login_required
 @require_POST
 def triage_visit(request, visit_id: int):
@@ -60,6 +150,7 @@ def triage_visit(request, visit_id: int):
         q = visit.queue
         q.priority = {"RED": 1, "YELLOW": 2, "GREEN": 3}[new_sev]
         q.save(update_fields=["priority"])
+        metrics.queue_actions.inc("triage")
 
     return redirect("queue_list")
 
@@ -67,6 +158,7 @@ def triage_visit(request, visit_id: int):
 # -----------------------------
 # IoT API
 # -----------------------------
+@metrics.instrument("iot_telemetry")
 @csrf_exempt
 @require_POST
 def iot_telemetry(request):
@@ -82,116 +174,200 @@ def iot_telemetry(request):
         "vitals": {"bpm": 90, "o2sat": 97, "bt": 37.1, "rr": 18, "sys_bp": 120, "dia_bp": 80},
         "gps": {"lat": 16.44, "lng": 102.83}
       }
+    หรือ Content-Type: application/x-telemetry (binary 1 record ดู queues/wire.py)
     """
-    device_id = request.headers.get("X-DEVICE-ID")
-    api_key = request.headers.get("X-API-KEY")
-    if not device_id or not api_key:
-        return JsonResponse({"ok": False, "error": "Missing X-DEVICE-ID or X-API-KEY"}, status=401)
+    try:
+        device = authenticate_device(request)
+    except TelemetryError as e:
+        return _telemetry_error(e.message, e.status)
 
     try:
-        device = Device.objects.get(device_id=device_id, api_key=api_key, is_active=True)
-    except Device.DoesNotExist:
-        return JsonResponse({"ok": False, "error": "Invalid device credentials"}, status=403)
+        log = _parse_single_body(request, device)
+    except TelemetryError as e:
+        return _telemetry_error(e.message, e.status)
+
+    if missing_visit_ids([log]):
+        return _telemetry_error("Visit not found", 404)
+
+    # โหมด buffered: เข้าคิวแล้วตอบทันที ให้ thread เบื้องหลังเขียน DB
+    if is_buffered():
+        if not get_buffer().offer([log]):
+            return _buffer_full_response()
+        return JsonResponse({"ok": True, "queued": True}, status=202)
+
+    # บันทึก log + last_seen + VitalSign ล่าสุด
+    ingest_logs([log])
+
+    return JsonResponse({"ok": True, "log_id": log.id})
+
+
+def _telemetry_error(message, status):
+    metrics.telemetry_readings.inc("rejected")
+    return JsonResponse({"ok": False, "error": message}, status=status)
+
+
+def _parse_single_body(request, device):
+    """body ของ iot_telemetry (JSON หรือ binary 1 record) → TelemetryLog"""
+    if is_wire_request(request):
+        entries = decode_packet(request.body, device, max_count=1)
+        if len(entries) != 1:
+            raise TelemetryError("Send exactly one record (use /api/iot/telemetry/batch/)")
+        if isinstance(entries[0], TelemetryError):
+            raise entries[0]
+        return entries[0]
 
     try:
         data = json.loads(request.body.decode("utf-8"))
     except Exception:
-        return JsonResponse({"ok": False, "error": "Invalid JSON"}, status=400)
+        raise TelemetryError("Invalid JSON")
+    return parse_reading(data, device)
 
-    visit_id = data.get("visit_id")
-    if not visit_id:
-        return JsonResponse({"ok": False, "error": "visit_id required"}, status=400)
 
+@metrics.instrument("iot_telemetry_batch")
+@csrf_exempt
+@require_POST
+def iot_telemetry_batch(request):
+    """
+    POST /api/iot/telemetry/batch/
+    Headers: X-DEVICE-ID, X-API-KEY
+    Body:
+      {"readings": [ {visit_id, ts, vitals, gps}, ... ]}   (หรือส่งเป็น list ตรง ๆ ก็ได้)
+      หรือ Content-Type: application/x-telemetry (binary หลาย record ดู queues/wire.py)
+
+    ตอบผลรายตัว เพื่อให้อุปกรณ์ส่งซ้ำเฉพาะตัวที่พัง:
+      {"ok": true, "accepted": 2, "rejected": 1,
+       "results": [{"index": 0, "ok": true, "log_id": 10},
+                   {"index": 1, "ok": false, "error": "Visit not found"}, ...]}
+    """
     try:
-        visit = Visit.objects.select_related("patient").get(id=visit_id)
-    except Visit.DoesNotExist:
-        return JsonResponse({"ok": False, "error": "Visit not found"}, status=404)
+        device = authenticate_device(request)
+        entries = _parse_batch_body(request, device)
+    except TelemetryError as e:
+        return _telemetry_error(e.message, e.status)
+
+    # 2) เช็ค visit ทีเดียวทั้ง batch
+    missing = missing_visit_ids([e for e in entries if not isinstance(e, TelemetryError)])
+    results, good = _batch_results(entries, missing)
+
+    # 3) bulk insert + อัปเดต VitalSign ครั้งเดียวต่อ visit
+    queued = is_buffered()
+    if queued:
+        if not get_buffer().offer([log for _, log in good]):
+            return _buffer_full_response()
+    else:
+        ingest_logs([log for _, log in good])
+
+    return _batch_response(entries, results, good, queued)
 
-    vitals = data.get("vitals") or {}
-    gps = data.get("gps") or {}
 
-    # parse ts (ถ้าไม่ส่งมา ใช้เวลาปัจจุบัน)
-    ts_str = data.get("ts")
-    ts = timezone.now()
-    if ts_str:
+def _parse_batch_body(request, device):
+    """
+    1) ตรวจทีละตัว (ยังไม่แตะ DB)
+    return: list ของ TelemetryLog หรือ TelemetryError รายตัว
+    """
+    if is_wire_request(request):
+        entries = decode_packet(request.body, device, max_count=TELEMETRY_BATCH_MAX)
+    else:
         try:
-            ts = timezone.datetime.fromisoformat(ts_str.replace("Z", "+00:00"))
-            if timezone.is_naive(ts):
-                ts = timezone.make_aware(ts, timezone.utc)
-            ts = ts.astimezone(timezone.get_current_timezone())
+            data = json.loads(request.body.decode("utf-8"))
         except Exception:
-            ts = timezone.now()
+            raise TelemetryError("Invalid JSON")
+
+        readings = data.get("readings") if isinstance(data, dict) else data
+        if not isinstance(readings, list):
+            raise TelemetryError("readings must be a non-empty list")
+        if len(readings) > TELEMETRY_BATCH_MAX:
+            raise TelemetryError(f"too many readings (max {TELEMETRY_BATCH_MAX})", status=413)
+
+        entries = []
+        for item in readings:
+            try:
+                entries.append(parse_reading(item, device))
+            except TelemetryError as e:
+                entries.append(e)
+
+    if not entries:
+        raise TelemetryError("readings must be a non-empty list")
+    if len(entries) > TELEMETRY_BATCH_MAX:
+        raise TelemetryError(f"too many readings (max {TELEMETRY_BATCH_MAX})", status=413)
+    return entries
+
+
+def _batch_results(entries, missing):
+    """แยกตัวที่พังออก return: (results ที่เติมเฉพาะตัวพัง, [(index, log) ที่จะเขียน])"""
+    results = [None] * len(entries)
+    good = []
+    for i, entry in enumerate(entries):
+        if isinstance(entry, TelemetryError):
+            results[i] = {"index": i, "ok": False, "error": entry.message}
+        elif entry.visit_id in missing:
+            results[i] = {"index": i, "ok": False, "error": "Visit not found"}
+        else:
+            good.append((i, entry))
+    if len(good) < len(entries):
+        metrics.telemetry_readings.inc("rejected", amount=len(entries) - len(good))
+    return results, good
+
+
+def _batch_response(entries, results, good, queued):
+    for i, log in good:
+        if queued:  # ยังอยู่ใน buffer ยังไม่มี log_id
+            results[i] = {"index": i, "ok": True, "queued": True}
+        else:
+            results[i] = {"index": i, "ok": True, "log_id": log.pk}
 
-    # 1) บันทึก log ทุกครั้ง
-    log = TelemetryLog.objects.create(
-        visit=visit,
-        device=device,
-        ts=ts,
-        bpm=vitals.get("bpm"),
-        o2sat=vitals.get("o2sat"),
-        bt=vitals.get("bt"),
-        rr=vitals.get("rr"),
-        sys_bp=vitals.get("sys_bp"),
-        dia_bp=vitals.get("dia_bp"),
-        lat=gps.get("lat"),
-        lng=gps.get("lng"),
-    )
+    return JsonResponse({
+        "ok": True,
+        "accepted": len(good),
+        "rejected": len(entries) - len(good),
+        "results": results,
+    }, status=202 if queued else 200)
 
-    # 2) update device last_seen
-    device.last_seen = timezone.now()
-    device.save(update_fields=["last_seen"])
-
-    # 3) update VitalSign ล่าสุด (อ่านง่ายใน monitor)
-    vs, _ = VitalSign.objects.get_or_create(visit=visit)
-    if vitals.get("rr") is not None:
-        vs.rr = vitals.get("rr")
-    if vitals.get("bpm") is not None:
-        vs.pr = vitals.get("bpm")  # pr = bpm
-    if vitals.get("sys_bp") is not None:
-        vs.sys_bp = vitals.get("sys_bp")
-    if vitals.get("dia_bp") is not None:
-        vs.dia_bp = vitals.get("dia_bp")
-    if vitals.get("bt") is not None:
-        vs.bt = vitals.get("bt")
-    if vitals.get("o2sat") is not None:
-        vs.o2sat = vitals.get("o2sat")
-    vs.save()
 
-    return JsonResponse({"ok": True, "log_id": log.id})
+def _buffer_full_response():
+    resp = JsonResponse({"ok": False, "error": "Telemetry buffer full, retry later"}, status=429)
+    resp["Retry-After"] = str(getattr(settings, "TELEMETRY_RETRY_AFTER", 1))
+    return resp
+
+
+@login_required
+@require_GET
+def iot_ingest_stats_api(request):
+    """
+    GET /api/iot/telemetry/stats/
+    counters ของ write-behind buffer (depth / flush latency)
+    """
+    store = recent.get_store()
+    return JsonResponse({
+        "ok": True,
+        "mode": "buffered" if is_buffered() else "sync",
+        "buffer": get_buffer().stats(),
+        "recent": store.stats() if store else None,
+    })
 
 
 # -----------------------------
-# helpers: ดึง "ล่าสุด" ด้วย Subquery
+# helpers: ดึง "ล่าสุด" จาก VisitSnapshot (join เดียว)
 # -----------------------------
 def _visit_queryset_with_latest_vitals_and_gps():
-    latest_vs = VitalSign.objects.filter(visit=OuterRef("pk")).order_by("-updated_at")
-
-    latest_gps_log = (
-        TelemetryLog.objects
-        .filter(visit=OuterRef("pk"), lat__isnull=False, lng__isnull=False)
-        .order_by("-ts")
-    )
-
-    latest_any_log = TelemetryLog.objects.filter(visit=OuterRef("pk")).order_by("-ts")
-
     return (
         Visit.objects
         .select_related("patient")
         .annotate(
-            last_ts=Subquery(latest_vs.values("updated_at")[:1]),
-            last_bpm=Subquery(latest_vs.values("pr")[:1]),
-            last_o2=Subquery(latest_vs.values("o2sat")[:1]),
-            last_bt=Subquery(latest_vs.values("bt")[:1]),
-            last_rr=Subquery(latest_vs.values("rr")[:1]),
-            last_sys=Subquery(latest_vs.values("sys_bp")[:1]),
-            last_dia=Subquery(latest_vs.values("dia_bp")[:1]),
-
-            last_lat=Subquery(latest_gps_log.values("lat")[:1]),
-            last_lng=Subquery(latest_gps_log.values("lng")[:1]),
-            last_gps_ts=Subquery(latest_gps_log.values("ts")[:1]),
-
-            last_log_ts=Subquery(latest_any_log.values("ts")[:1]),
-            last_device_id=Subquery(latest_any_log.values("device__device_id")[:1]),
+            last_ts=F("snapshot__vitals_updated_at"),
+            last_bpm=F("snapshot__bpm"),
+            last_o2=F("snapshot__o2sat"),
+            last_bt=F("snapshot__bt"),
+            last_rr=F("snapshot__rr"),
+            last_sys=F("snapshot__sys_bp"),
+            last_dia=F("snapshot__dia_bp"),
+
+            last_lat=F("snapshot__lat"),
+            last_lng=F("snapshot__lng"),
+            last_gps_ts=F("snapshot__gps_ts"),
+
+            last_log_ts=F("snapshot__last_log_ts"),
+            last_device_id=F("snapshot__last_device_id"),
         )
     )
 
@@ -211,123 +387,377 @@ def monitor_dashboard(request):
     return render(request, "queues/monitor_dashboard.html")
 
 
-@login_required
-def monitor_latest_api(request):
-    """
-    ส่งข้อมูลล่าสุดให้หน้า monitor (รีเฟรชทุก 5 วิ)
-    ONLINE = มี log ภายใน 3 นาที
-    """
-    offline_after = timezone.now() - timedelta(minutes=3)
+MONITOR_QUEUE_LIMIT = 200  # หน้า monitor แสดงคิวไม่เกินนี้
 
-    q_items = (
+
+def _waiting_queue():
+    return (
         Queue.objects
         .select_related("visit", "visit__patient", "visit__triage_result")
         .filter(status="WAITING")
-        .order_by("priority", "created_at")[:200]
+        .order_by("priority", "created_at")[:MONITOR_QUEUE_LIMIT]
     )
 
+
+def _waiting_order():
+    """visit_id ของคิว WAITING ตามลำดับ (queue_index ถ้าเปิด ไม่งั้นเรียงใน SQL)"""
+    index = queue_index.get_index()
+    if index is not None:
+        return index.top(MONITOR_QUEUE_LIMIT)
+    return list(_waiting_queue().values_list("visit_id", flat=True))
+
+
+def _latest_row(q, last_log, offline_after):
+    """last_log: recent.Reading (จาก ring หรือ reading_from_log) / None"""
+    visit = q.visit
+    online = bool(last_log and last_log.ts and last_log.ts >= offline_after)
+
+    return {
+        "visit_id": visit.id,
+        "name": f"{visit.patient.first_name} {visit.patient.last_name}",
+        "severity": visit.final_severity,
+        "ai": _get_ai_severity(visit),
+        "device_id": last_log.device_id if last_log else None,
+        "online": online,
+
+        "bpm": last_log.bpm if last_log else None,
+        "o2sat": last_log.o2sat if last_log else None,
+        "bt": last_log.bt if last_log else None,
+        "rr": last_log.rr if last_log else None,
+        "sys_bp": last_log.sys_bp if last_log else None,
+        "dia_bp": last_log.dia_bp if last_log else None,
+
+        "registered_at": visit.registered_at.isoformat() if visit.registered_at else None,
+    }
+
+
+def _latest_logs_query(visit_ids):
+    """
+    log ล่าสุดของแต่ละ visit ใน query เดียว (ไม่ต้อง query ทีละ visit)
+      SELECT ... FROM telemetrylog JOIN device
+      WHERE id IN (SELECT (SELECT id FROM telemetrylog WHERE visit_id = v.id ORDER BY ts DESC, id DESC LIMIT 1)
+                   FROM visit v WHERE v.id IN (...))
+    subquery ต่อ visit ใช้ index (visit, ts)
+    """
+    latest_id = (
+        TelemetryLog.objects
+        .filter(visit=OuterRef("pk"))
+        .order_by("-ts", "-id")
+        .values("id")[:1]
+    )
+    return (
+        TelemetryLog.objects
+        .select_related("device")
+        .filter(id__in=Visit.objects.filter(id__in=visit_ids).annotate(last_id=Subquery(latest_id)).values("last_id"))
+    )
+
+
+def _latest_rows(q_items, logs, store, offline_after):
+    """logs: {visit_id: TelemetryLog} ของ visit ที่ ring ตอบไม่ได้"""
     rows = []
     for q in q_items:
-        visit = q.visit
+        found, last_log = store.latest(q.visit_id) if store else (False, None)
+        if not found:
+            last_log = recent.reading_from_log(logs.get(q.visit_id))
+        rows.append(_latest_row(q, last_log, offline_after))
+    return rows
 
-        last_log = (
-            TelemetryLog.objects
-            .select_related("device")
-            .filter(visit=visit)
-            .order_by("-ts")
-            .first()
-        )
 
-        online = bool(last_log and last_log.ts and last_log.ts >= offline_after)
+def _latest_misses(q_items, store):
+    """visit ที่ต้องไปอ่าน log ล่าสุดจาก DB (ring ปิด / ไม่ได้ track / ไม่ครบ)"""
+    if store is None:
+        return [q.visit_id for q in q_items]
+    return [q.visit_id for q in q_items if not store.latest(q.visit_id)[0]]
+
+
+# -----------------------------
+# ?since= cursor + ETag (ใช้ร่วมกับ async_views)
+# -----------------------------
+def _changed_since(request, now, online_seconds):
+    """?since= → set ของ visit_id ที่เปลี่ยนหลัง cursor / None (ไม่ส่ง since)  cursor ผิด → ValueError"""
+    since = snapshots.parse_cursor(request.GET.get("since"))
+    if since is None:
+        return None
+    return snapshots.changed_visit_ids(since, now, online_seconds)
 
-        rows.append({
-            "visit_id": visit.id,
-            "name": f"{visit.patient.first_name} {visit.patient.last_name}",
-            "severity": visit.final_severity,
-            "ai": _get_ai_severity(visit),
-            "device_id": last_log.device.device_id if last_log and last_log.device else None,
-            "online": online,
 
-            "bpm": last_log.bpm if last_log else None,
-            "o2sat": last_log.o2sat if last_log else None,
-            "bt": last_log.bt if last_log else None,
-            "rr": last_log.rr if last_log else None,
-            "sys_bp": last_log.sys_bp if last_log else None,
-            "dia_bp": last_log.dia_bp if last_log else None,
+def _since_fields(changed, order, now):
+    """field เพิ่มใน response: cursor เสมอ, order / removed เมื่อส่ง since (ให้ client แทรก/ลบแถวเองได้)"""
+    out = {"cursor": snapshots.cursor_for(now)}
+    if changed is not None:
+        out["order"] = order
+        out["removed"] = sorted(changed - set(order))
+    return out
 
-            "registered_at": visit.registered_at.isoformat() if visit.registered_at else None,
-        })
 
-    return JsonResponse({"ok": True, "rows": rows})
+def _payload_etag(payload):
+    """ETag จากเนื้อหา (ไม่นับ server_time / cursor ที่เปลี่ยนทุกครั้ง)"""
+    body = {k: v for k, v in payload.items() if k not in ("server_time", "cursor")}
+    digest = hashlib.md5(json.dumps(body, sort_keys=True, cls=DjangoJSONEncoder).encode()).hexdigest()
+    return quote_etag(digest)
+
+
+def _not_modified(request, etag):
+    if_none_match = parse_etags(request.headers.get("If-None-Match", ""))
+    return etag in if_none_match or "*" in if_none_match
+
+
+def _etag_response(request, payload):
+    """
+    JsonResponse + ETag จากเนื้อหา
+    If-None-Match ตรง → 304 ไม่ส่ง body
+    """
+    etag = _payload_etag(payload)
+    resp = HttpResponseNotModified() if _not_modified(request, etag) else JsonResponse(payload)
+    resp["ETag"] = etag
+    return resp
 
 
+def _cached_response(request, entry):
+    """summary_cache.Entry ที่ value = (JSON bytes ที่ serialize ไว้แล้ว, etag) → response"""
+    body, etag = entry.value
+    if _not_modified(request, etag):
+        resp = HttpResponseNotModified()
+    else:
+        resp = HttpResponse(body, content_type="application/json")
+    resp["ETag"] = etag
+    return resp
+
+
+LATEST_ONLINE_SECONDS = 180  # หน้า latest: ONLINE = มี log ภายในกี่วินาที
+
+
+@metrics.instrument("monitor_latest_api")
+@login_required
+def monitor_latest_api(request):
+    """
+    ส่งข้อมูลล่าสุดให้หน้า monitor (รีเฟรชทุก 5 วิ)
+    ONLINE = มี log ภายใน 3 นาที
+    ?since=<cursor> → เฉพาะ visit ที่เปลี่ยน + order / removed  (ETag / If-None-Match → 304)
+    """
+    now = timezone.now()
+    offline_after = now - timedelta(seconds=LATEST_ONLINE_SECONDS)
+    try:
+        changed = _changed_since(request, now, LATEST_ONLINE_SECONDS)
+    except ValueError as e:
+        return JsonResponse({"ok": False, "error": str(e)}, status=400)
+    store = recent.get_store()
+
+    q_items = list(_waiting_queue())
+    order = [q.visit_id for q in q_items]
+    if changed is not None:
+        q_items = [q for q in q_items if q.visit_id in changed]
+
+    misses = _latest_misses(q_items, store)
+    logs = {log.visit_id: log for log in _latest_logs_query(misses)} if misses else {}
+    rows = _latest_rows(q_items, logs, store, offline_after)
+
+    return _etag_response(request, {"ok": True, "rows": rows, **_since_fields(changed, order, now)})
+
+
+SUMMARY_ONLINE_SECONDS = 60  # หน้า summary: ONLINE = มี log ภายในกี่วินาที
+
+
+def _summary_item(v, now):
+    online = False
+    if v.last_log_ts:
+        online = (now - v.last_log_ts).total_seconds() <= SUMMARY_ONLINE_SECONDS
+
+    return {
+        "visit_id": v.id,
+        "patient_name": f"{v.patient.first_name} {v.patient.last_name}",
+        "severity": v.final_severity,
+        "registered_at": v.registered_at.isoformat() if v.registered_at else None,
+        "online": online,
+        "device_id": v.last_device_id,
+        "vitals": {
+            "bpm": v.last_bpm,
+            "o2sat": v.last_o2,
+            "bt": v.last_bt,
+            "rr": v.last_rr,
+            "sys_bp": v.last_sys,
+            "dia_bp": v.last_dia,
+        },
+        "gps": {
+            "lat": float(v.last_lat) if v.last_lat is not None else None,
+            "lng": float(v.last_lng) if v.last_lng is not None else None,
+            "updated_at": v.last_gps_ts.isoformat() if v.last_gps_ts else None,
+        }
+    }
+
+
+@metrics.instrument("monitor_summary_api")
 @login_required
 def monitor_summary_api(request):
     """
     API ให้หน้า dashboard / monitor
     เรียงตาม: RED → YELLOW → GREEN → มาก่อนก่อน
+    ?since=<cursor> → เฉพาะ visit ที่เปลี่ยน + order / removed  (ETag / If-None-Match → 304)
+    ไม่มี since → ทุกจอได้ bytes ชุดเดียวกันจาก summary_cache
     """
+    if not request.GET.get("since"):
+        entry = _cached_summary()
+        if entry is not None:
+            return _cached_response(request, entry)
+    try:
+        payload = _summary_api_payload(request)
+    except ValueError as e:
+        return JsonResponse({"ok": False, "error": str(e)}, status=400)
+    return _etag_response(request, payload)
+
+
+def _summary_api_payload(request):
     now = timezone.now()
+    changed = _changed_since(request, now, SUMMARY_ONLINE_SECONDS)
+    payload, _ = _summary_payload(changed, now)
+    return _with_since_fields(payload, changed, now)
 
-    q_items = (
-        Queue.objects
-        .select_related("visit", "visit__patient")
-        .filter(status="WAITING")
-        .order_by("priority", "created_at")[:200]
-    )
 
-    visit_ids = [q.visit_id for q in q_items]
+def _with_since_fields(payload, changed, now):
+    payload.update(_since_fields(changed, payload.pop("order"), now))
+    return payload
+
+
+def _summary_body(payload, now):
+    """payload ทั้งคิว → (JSON bytes, etag) ที่เก็บใน summary_cache"""
+    payload = _with_since_fields(payload, None, now)
+    return json.dumps(payload, cls=DjangoJSONEncoder).encode(), _payload_etag(payload)
+
 
-    visits = {
-        v.id: v
-        for v in _visit_queryset_with_latest_vitals_and_gps()
-        .filter(id__in=visit_ids)
+def _build_summary_body():
+    now = timezone.now()
+    payload, _ = _summary_payload(None, now)
+    return _summary_body(payload, now)
+
+
+def _cached_summary():
+    """ทั้งคิว (ไม่มี since) จาก summary_cache  ปิดอยู่ (TTL = 0) → None"""
+    max_age = summary_cache.ttl()
+    if max_age <= 0:
+        return None
+    return summary_cache.summary_cache.get(_build_summary_body, max_age)
+
+
+def _summary_payload(changed=None, now=None):
+    """
+    changed=None → ทั้งคิว, set ของ visit_id → เฉพาะแถวที่เปลี่ยน + removed
+    ใช้ทั้ง monitor_summary_api และ SSE (async_views.monitor_stream)
+    return: (payload, {visit_id: เวลาที่จะกลายเป็น OFFLINE} ของแถวที่ส่งและยัง ONLINE)
+    """
+    now = now or timezone.now()
+    order = _waiting_order()
+    wanted = _summary_wanted(order, changed)
+    visits = {v.id: v for v in _summary_visits(wanted)}
+    return _summary_from(order, changed, wanted, visits, now)
+
+
+def _summary_wanted(order, changed):
+    return order if changed is None else [vid for vid in order if vid in changed]
+
+
+def _summary_visits(wanted):
+    return _visit_queryset_with_latest_vitals_and_gps().filter(id__in=wanted)
+
+
+def _summary_from(order, changed, wanted, visits, now):
+    """visits: {visit_id: Visit จาก _summary_visits} → (payload, offline_at) ของ _summary_payload"""
+    items = [_summary_item(visits[vid], now) for vid in wanted if vid in visits]
+
+    payload = {"ok": True, "items": items, "order": order, "server_time": now.isoformat()}
+    if changed is not None:
+        payload["removed"] = sorted(set(changed) - set(order))
+
+    window = timedelta(seconds=SUMMARY_ONLINE_SECONDS)
+    offline_at = {
+        v.id: v.last_log_ts + window
+        for v in visits.values()
+        if v.last_log_ts and v.last_log_ts + window > now
     }
+    return payload, offline_at
 
-    items = []
-    for q in q_items:
-        v = visits.get(q.visit_id)
-        if not v:
-            continue
-
-        online = False
-        if v.last_log_ts:
-            online = (now - v.last_log_ts).total_seconds() <= 60
-
-        items.append({
-            "visit_id": v.id,
-            "patient_name": f"{v.patient.first_name} {v.patient.last_name}",
-            "severity": v.final_severity,
-            "registered_at": v.registered_at.isoformat() if v.registered_at else None,
-            "online": online,
-            "device_id": v.last_device_id,
-            "vitals": {
-                "bpm": v.last_bpm,
-                "o2sat": v.last_o2,
-                "bt": v.last_bt,
-                "rr": v.last_rr,
-                "sys_bp": v.last_sys,
-                "dia_bp": v.last_dia,
-            },
-            "gps": {
-                "lat": float(v.last_lat) if v.last_lat is not None else None,
-                "lng": float(v.last_lng) if v.last_lng is not None else None,
-                "updated_at": v.last_gps_ts.isoformat() if v.last_gps_ts else None,
-            }
-        })
 
+@login_required
+def monitor_visit_detail(request, visit_id: int):
+    """?resolution=1m / 5m → ตารางสรุปต่อช่วงเวลาจาก rollup แทน log ดิบ"""
+    visit = get_object_or_404(Visit.objects.select_related("patient"), pk=visit_id)
+    # รวม log ที่ถูก archive ไปแล้วด้วย (อ่านไฟล์เฉพาะตอนตารางหลักมีไม่ถึง 50)
+    logs = archive.visit_logs(visit, limit=50)
+
+    try:
+        resolution = rollups.parse_resolution(request.GET.get("resolution"))
+    except ValueError:
+        resolution = None
+    buckets = rollups.visit_buckets(visit.id, resolution) if resolution else None
+
+    return render(request, "queues/monitor_visit_detail.html", {
+        "visit": visit,
+        "logs": logs,
+        "resolution": request.GET.get("resolution") if resolution else "raw",
+        "buckets": buckets,
+    })
+
+
+@metrics.instrument("monitor_track_api")
+@login_required
+@require_GET
+def monitor_track_api(request, visit_id: int):
+    """
+    GET /monitor/api/visit/<id>/track/?minutes=60 | ?from=&to=  &tolerance=<เมตร>
+    เส้นทาง GPS ที่ย่อแล้ว: points = [[lat, lng, ts], ...] เรียงเก่า → ใหม่ (queues/tracks.py)
+    """
+    visit = get_object_or_404(Visit, pk=visit_id)
+    now = timezone.now()
+    try:
+        start, end = tracks.parse_window(request.GET, now)
+        tolerance = tracks.parse_tolerance(request.GET.get("tolerance"))
+    except ValueError as e:
+        return JsonResponse({"ok": False, "error": str(e)}, status=400)
+
+    track = tracks.visit_track(visit, start, end, tolerance, now)
     return JsonResponse({
         "ok": True,
-        "items": items,
-        "server_time": now.isoformat()
+        "visit_id": visit.id,
+        "from": start.isoformat(),
+        "to": end.isoformat(),
+        "tolerance_m": tolerance,
+        **track,
+        "server_time": now.isoformat(),
     })
 
 
+EXPORT_FIELDS = ["ts", "device", "bpm", "o2sat", "bt", "rr", "sys_bp", "dia_bp", "lat", "lng"]
+
+
 @login_required
-def monitor_visit_detail(request, visit_id: int):
-    visit = get_object_or_404(Visit.objects.select_related("patient"), pk=visit_id)
-    logs = TelemetryLog.objects.filter(visit=visit).select_related("device").order_by("-ts")[:50]
-    return render(request, "queues/monitor_visit_detail.html", {"visit": visit, "logs": logs})
+@require_GET
+def monitor_visit_export(request, visit_id: int):
+    """
+    GET /monitor/visit/<id>/export.csv
+    telemetry ทั้งหมดของ visit (ตารางหลัก + archive) เรียงเก่า → ใหม่
+    """
+    visit = get_object_or_404(Visit, pk=visit_id)
+    logs = archive.visit_logs(visit)
+    logs.reverse()
+
+    def rows():
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerow(EXPORT_FIELDS)
+        for log in logs:
+            writer.writerow([
+                log.ts.isoformat(),
+                log.device.device_id if log.device else "",
+                *["" if getattr(log, f) is None else getattr(log, f) for f in EXPORT_FIELDS[2:]],
+            ])
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+        if buf.tell():
+            yield buf.getvalue()
+
+    resp = StreamingHttpResponse(rows(), content_type="text/csv; charset=utf-8")
+    resp["Content-Disposition"] = f'attachment; filename="visit-{visit.id}-telemetry.csv"'
+    return resp
 
 
 # -----------------------------
@@ -335,13 +765,46 @@ def monitor_visit_detail(request, visit_id: int):
 # -----------------------------
 @login_required
 def map_view(request):
-    visits = (
-        _visit_queryset_with_latest_vitals_and_gps()
-        .exclude(last_lat__isnull=True)
-        .exclude(last_lng__isnull=True)[:200]
-    )
+    # หมุด / cluster โหลดจาก monitor_map_api ตามกรอบที่เห็น
+    return render(request, "queues/map.html", {"now": timezone.now()})
+
+
+@metrics.instrument("monitor_map_api")
+@login_required
+@require_GET
+def monitor_map_api(request):
+    """
+    ?bbox=minLng,minLat,maxLng,maxLat&zoom=13
+    → items: จุดเดี่ยว (type=point) หรือกลุ่ม (type=cluster, count, bounds) เฉพาะในกรอบ
+    จำนวน items ไม่เกิน MAP_MAX_CLUSTERS ไม่ว่าผู้ป่วยกี่คน (queues/geo.py)
+    """
+    try:
+        payload = _map_api_payload(request)
+    except ValueError as e:
+        return JsonResponse({"ok": False, "error": str(e)}, status=400)
+    return _etag_response(request, payload)
+
+
+def _map_api_payload(request):
+    bbox, zoom = _map_params(request)
+    return _map_payload(geo.get_index(), bbox, zoom)
+
+
+def _map_params(request):
+    """query string → (bbox, zoom)  ค่าผิด → ValueError"""
+    return geo.parse_bbox(request.GET.get("bbox")), geo.parse_zoom(request.GET.get("zoom"))
+
+
+def _map_payload(index, bbox, zoom):
     now = timezone.now()
-    return render(request, "queues/map.html", {"visits": visits, "now": now})
+    points = index.query(bbox)
+    return {
+        "ok": True,
+        "zoom": zoom,
+        "total": len(points),
+        "items": geo.cluster_items(points, zoom, now, SUMMARY_ONLINE_SECONDS),
+        "server_time": now.isoformat(),
+    }
 
 
 @login_required
@@ -371,63 +834,76 @@ def update_location(request, visit_id: int):
         )
         device = last_log.device if last_log and last_log.device else None
 
-        TelemetryLog.objects.create(
-            visit=visit,
-            device=device,
-            ts=timezone.now(),
-            lat=lat,
-            lng=lng,
-        )
+        with transaction.atomic():
+            log = TelemetryLog.objects.create(
+                visit=visit,
+                device=device,
+                ts=timezone.now(),
+                lat=lat,
+                lng=lng,
+            )
+            snapshots.apply_logs([log])
+            transaction.on_commit(lambda: recent.add_logs([log]))
+            events.publish_on_commit([visit.id])
 
         return JsonResponse({"ok": True})
     except Exception as e:
         return JsonResponse({"ok": False, "error": str(e)}, status=400)
     
-@login_required
-@require_GET
-def monitor_sparklines_api(request):
-    """
-    GET /monitor/api/sparklines/?visit_ids=1,2,3
-    return: { ok:true, series: { "1": {"bpm":[...], "o2":[...]}, ... } }
-    """
+def _parse_visit_ids(request):
     ids_raw = request.GET.get("visit_ids", "").strip()
-    if not ids_raw:
-        return JsonResponse({"ok": True, "series": {}})
-
-    try:
-        visit_ids = [int(x) for x in ids_raw.split(",") if x.strip().isdigit()]
-    except Exception:
-        return JsonResponse({"ok": False, "error": "bad visit_ids"}, status=400)
+    return [int(x) for x in ids_raw.split(",") if x.strip().isdigit()]
 
-    N = 20  # จำนวนจุดในกราฟเล็ก (ปรับได้)
 
-    logs = (
-        TelemetryLog.objects
-        .filter(visit_id__in=visit_ids)
-        .order_by("visit_id", "-ts")
-        .values("visit_id", "bpm", "o2sat")
+def _sparkline_params(request):
+    """query string → (n, series, resolution)  ค่าผิด → ValueError"""
+    return (
+        sparklines.parse_points(request.GET.get("n")),
+        sparklines.parse_series(request.GET.get("series")),
+        rollups.parse_resolution(request.GET.get("resolution")),
     )
 
-    series = {}
-    for row in logs:
-        vid = str(row["visit_id"])
-        series.setdefault(vid, {"bpm": [], "o2": []})
 
-        if len(series[vid]["bpm"]) < N and row["bpm"] is not None:
-            series[vid]["bpm"].append(row["bpm"])
-        if len(series[vid]["o2"]) < N and row["o2sat"] is not None:
-            series[vid]["o2"].append(row["o2sat"])
+def _sparkline_data(visit_ids, n, series, resolution):
+    """log ดิบ: ตอบจาก ring (queues/recent.py) ก่อน visit ที่ ring ตอบไม่ได้ค่อยอ่าน DB"""
+    store = recent.get_store() if resolution is None else None
+    if store is None:
+        return sparklines.fetch(visit_ids, n, series, resolution)
 
-        # ถ้าทั้งสองครบแล้ว จะไม่ต้องเติมเพิ่ม (กันวนเยอะ)
-        if len(series[vid]["bpm"]) >= N and len(series[vid]["o2"]) >= N:
-            pass
+    data, missing = store.sparklines(visit_ids, n, {name: sparklines.SERIES[name] for name in series})
+    if missing:
+        data.update(sparklines.fetch(missing, n, series))
+    return data
 
-    # reverse ให้เก่า -> ใหม่ (กราฟวิ่งซ้ายไปขวา)
-    for vid in series:
-        series[vid]["bpm"] = list(reversed(series[vid]["bpm"]))
-        series[vid]["o2"]  = list(reversed(series[vid]["o2"]))
 
-    return JsonResponse({"ok": True, "series": series})
+@metrics.instrument("monitor_sparklines_api")
+@login_required
+@require_GET
+def monitor_sparklines_api(request):
+    """
+    GET /monitor/api/sparklines/?visit_ids=1,2,3[&n=20][&series=bpm,o2][&resolution=raw|1m|5m][&since=cursor]
+    return: { ok:true, series: { "1": {"bpm":[...], "o2":[...]}, ... }, cursor }  (เก่า → ใหม่)
+    since → เฉพาะ visit ที่มีข้อมูลใหม่หลัง cursor  (ETag / If-None-Match → 304)
+    series: bpm, o2, bt, rr, sys, dia
+    resolution=1m/5m → ค่าเฉลี่ยต่อ bucket จาก rollup (n bucket ล่าสุด)
+    """
+    try:
+        payload = _sparkline_api_payload(request)
+    except ValueError as e:
+        return JsonResponse({"ok": False, "error": str(e)}, status=400)
+    return _etag_response(request, payload)
+
+
+def _sparkline_api_payload(request):
+    now = timezone.now()
+    n, series, resolution = _sparkline_params(request)
+    visit_ids = _parse_visit_ids(request)
+    changed = _changed_since(request, now, 0) if visit_ids else None
+    if changed is not None:
+        visit_ids = [vid for vid in visit_ids if vid in changed]
+
+    data = _sparkline_data(visit_ids, n, series, resolution) if visit_ids else {}
+    return {"ok": True, "series": data, "cursor": snapshots.cursor_for(now)}
 
 @login_required
 @require_POST
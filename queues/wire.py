@@ -0,0 +1,169 @@
+"""
+Binary wire format สำหรับ telemetry (Content-Type: application/x-telemetry)
+
+ใช้แทน JSON บนบอร์ดเล็ก ๆ ที่ Wi-Fi ไม่เสถียร: 3 + 31*N ไบต์ต่อ packet
+(JSON แบบในเอกสาร iot_telemetry ประมาณ 150 ไบต์ต่อ reading)
+
+ทุกค่าเป็น little-endian
+
+Header (3 ไบต์)
+  B   version        = 1
+  H   count          จำนวน record
+
+Record v1 (31 ไบต์)
+  B   mask           bit ของฟิลด์ที่มีค่า (ไม่มี = None) ดู MASK_*
+  I   visit_id
+  q   ts_ms          epoch milliseconds (UTC), 0 = ใช้เวลาที่ server รับ
+  H   bpm
+  B   o2sat
+  h   bt_centi       อุณหภูมิ x100 (37.15 °C → 3715)
+  B   rr
+  H   sys_bp
+  H   dia_bp
+  i   lat_e6         ละติจูด x1e6 (ค่าเดียวกับ JSON ที่ปัด 6 ตำแหน่ง)
+  i   lng_e6         ลองจิจูด x1e6
+"""
+import struct
+from datetime import datetime, timezone as dt_timezone
+
+from django.utils import timezone
+
+from .models import TelemetryLog
+from .telemetry import TelemetryError, round_gps
+
+CONTENT_TYPE = "application/x-telemetry"
+VERSION = 1
+
+HEADER = struct.Struct("<BH")
+RECORD = struct.Struct("<BIqHBhBHHii")
+
+MASK_BPM = 1 << 0
+MASK_O2SAT = 1 << 1
+MASK_BT = 1 << 2
+MASK_RR = 1 << 3
+MASK_SYS_BP = 1 << 4
+MASK_DIA_BP = 1 << 5
+MASK_GPS = 1 << 6
+
+
+def is_wire_request(request):
+    return request.content_type == CONTENT_TYPE
+
+
+def _ts(ts_ms, now):
+    """epoch ms → aware datetime (0 หรือเกินช่วงที่ datetime รับได้ → เวลาที่ server รับ เหมือน parse_ts)"""
+    if not ts_ms:
+        return now
+    try:
+        return datetime.fromtimestamp(ts_ms / 1000, dt_timezone.utc)
+    except (ValueError, OverflowError, OSError):
+        return now
+
+
+def decode_packet(body, device, max_count=None):
+    """
+    bytes → list ของ TelemetryLog (ยังไม่ save) หรือ TelemetryError รายตัว
+    header/ความยาวผิด หรือ count เกิน max_count → raise TelemetryError ทั้ง packet (ก่อน decode)
+    """
+    if len(body) < HEADER.size:
+        raise TelemetryError("Truncated telemetry packet")
+    version, count = HEADER.unpack_from(body, 0)
+    if version != VERSION:
+        raise TelemetryError(f"Unsupported telemetry version {version}")
+    if max_count is not None and count > max_count:
+        raise TelemetryError(f"too many readings (max {max_count})", status=413)
+    if len(body) != HEADER.size + count * RECORD.size:
+        raise TelemetryError("Telemetry packet length does not match record count")
+
+    now = timezone.now()
+    out = []
+    for mask, visit_id, ts_ms, bpm, o2, bt, rr, sys_bp, dia_bp, lat, lng in RECORD.iter_unpack(
+        memoryview(body)[HEADER.size:]
+    ):
+        if not visit_id:
+            out.append(TelemetryError("visit_id required"))
+            continue
+        if mask & MASK_GPS and not (-90_000_000 <= lat <= 90_000_000 and -180_000_000 <= lng <= 180_000_000):
+            out.append(TelemetryError("lat/lng out of range"))
+            continue
+        out.append(TelemetryLog(
+            visit_id=visit_id,
+            device=device,
+            ts=_ts(ts_ms, now),
+            bpm=bpm if mask & MASK_BPM else None,
+            o2sat=o2 if mask & MASK_O2SAT else None,
+            bt=bt / 100 if mask & MASK_BT else None,
+            rr=rr if mask & MASK_RR else None,
+            sys_bp=sys_bp if mask & MASK_SYS_BP else None,
+            dia_bp=dia_bp if mask & MASK_DIA_BP else None,
+            lat=round_gps(lat / 1e6) if mask & MASK_GPS else None,
+            lng=round_gps(lng / 1e6) if mask & MASK_GPS else None,
+        ))
+    return out
+
+
+def _opt(value, bit, scale=1):
+    if value is None:
+        return 0, 0
+    return bit, int(round(value * scale))
+
+
+def encode_record(visit_id, ts=None, bpm=None, o2sat=None, bt=None, rr=None,
+                  sys_bp=None, dia_bp=None, lat=None, lng=None):
+    """
+    reference encoder (ฝั่งอุปกรณ์ทำตามนี้ได้เลย)
+    ts: datetime / epoch seconds (float) / None
+    """
+    if ts is None:
+        ts_ms = 0
+    elif isinstance(ts, datetime):
+        if timezone.is_naive(ts):
+            ts = ts.replace(tzinfo=dt_timezone.utc)  # เหมือน parse_ts: naive = UTC
+        ts_ms = int(ts.timestamp() * 1000)
+    else:
+        ts_ms = int(ts * 1000)
+
+    mask = 0
+    fields = []
+    for value, bit, scale in (
+        (bpm, MASK_BPM, 1),
+        (o2sat, MASK_O2SAT, 1),
+        (bt, MASK_BT, 100),
+        (rr, MASK_RR, 1),
+        (sys_bp, MASK_SYS_BP, 1),
+        (dia_bp, MASK_DIA_BP, 1),
+    ):
+        b, v = _opt(value, bit, scale)
+        mask |= b
+        fields.append(v)
+
+    lat_e6 = lng_e6 = 0
+    if lat is not None and lng is not None:
+        mask |= MASK_GPS
+        # ปัดแบบเดียวกับ parse_reading ก่อน (round(x * 1e6) ปัดคนละทางได้ เช่น 68.0223915)
+        lat_e6 = int(round(round_gps(lat) * 1e6))
+        lng_e6 = int(round(round_gps(lng) * 1e6))
+
+    return RECORD.pack(mask, visit_id, ts_ms, *fields, lat_e6, lng_e6)
+
+
+def encode_packet(readings):
+    """
+    readings: list ของ dict รูปแบบเดียวกับ JSON body ของ iot_telemetry
+      {"visit_id", "ts", "vitals": {...}, "gps": {"lat", "lng"}}
+    """
+    parts = [HEADER.pack(VERSION, len(readings))]
+    for r in readings:
+        vitals = r.get("vitals") or {}
+        gps = r.get("gps") or {}
+        ts = r.get("ts")
+        if isinstance(ts, str):
+            ts = datetime.fromisoformat(ts.replace("Z", "+00:00"))
+        parts.append(encode_record(
+            r["visit_id"],
+            ts=ts,
+            lat=gps.get("lat"),
+            lng=gps.get("lng"),
+            **{k: vitals.get(k) for k in ("bpm", "o2sat", "bt", "rr", "sys_bp", "dia_bp")},
+        ))
+    return b"".join(parts)
@@ -0,0 +1,81 @@
+"""
+เทียบ rule_based_triage (ทีละแถว, ai_triage/rules.py) กับ batch_triage (numpy ทั้งก้อน, ai_triage/batch.py)
+- สุ่ม vital sign --rows แถว (ค่าว่าง --null-rate) ครอบคลุมทั้ง RED / YELLOW / GREEN
+- วัดเวลาแบบ scalar ครั้งเดียว, batch --repeat ครั้ง (เอาค่าดีสุด) แล้วตรวจว่าผลตรงกันทุกแถว
+
+ไม่แตะ DB  รัน: python scripts/bench_batch_triage.py [--rows 1000000] [--null-rate 0.05] [--seed 42]
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import numpy as np  # noqa: E402
+
+from ai_triage.batch import COLUMNS, SEVERITIES, batch_triage, reason_text  # noqa: E402
+from ai_triage.rules import rule_based_triage  # noqa: E402
+
+
+def make_columns(n, null_rate, seed):
+    rng = np.random.default_rng(seed)
+    cols = {
+        "rr": rng.integers(8, 41, n).astype(np.float64),
+        "pr": rng.integers(40, 181, n).astype(np.float64),
+        "sys_bp": rng.integers(70, 201, n).astype(np.float64),
+        "bt": np.round(rng.normal(37.4, 0.9, n), 1),
+        "o2sat": rng.integers(85, 101, n).astype(np.float64),
+    }
+    for arr in cols.values():
+        arr[rng.random(n) < null_rate] = np.nan
+    return cols
+
+
+def as_objects(cols):
+    lists = [[None if x != x else x for x in cols[c].tolist()] for c in COLUMNS]
+    return [SimpleNamespace(**dict(zip(COLUMNS, row))) for row in zip(*lists)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--null-rate", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    cols = make_columns(args.rows, args.null_rate, args.seed)
+    objs = as_objects(cols)
+
+    t0 = time.perf_counter()
+    scalar = [rule_based_triage(v) for v in objs]
+    scalar_s = time.perf_counter() - t0
+
+    batch_s = float("inf")
+    for _ in range(args.repeat):
+        t0 = time.perf_counter()
+        codes, confidence, reasons = batch_triage(*(cols[c] for c in COLUMNS))
+        batch_s = min(batch_s, time.perf_counter() - t0)
+
+    # ตรวจผลทุกแถว: severity / confidence เทียบแบบ array, reason แปลง bitmask เฉพาะค่าที่ไม่ซ้ำ
+    sev_index = {s: i for i, s in enumerate(SEVERITIES)}
+    want_codes = np.fromiter((sev_index[s] for s, _, _ in scalar), dtype=np.uint8, count=len(scalar))
+    want_conf = np.fromiter((c for _, c, _ in scalar), dtype=np.float64, count=len(scalar))
+    texts = {int(m): reason_text(m) for m in np.unique(reasons)}
+    mismatched = int((codes != want_codes).sum() + (confidence != want_conf).sum())
+    mismatched += sum(texts[m] != r for m, (_, _, r) in zip(reasons.tolist(), scalar))
+
+    counts = np.bincount(codes, minlength=len(SEVERITIES))
+    print(f"rows        {args.rows}  (null rate {args.null_rate})")
+    print("severity    " + "  ".join(f"{s} {n}" for s, n in zip(SEVERITIES, counts.tolist())))
+    print(f"scalar      {scalar_s:8.3f} s  {args.rows / scalar_s:12,.0f} rows/s")
+    print(f"batch       {batch_s:8.3f} s  {args.rows / batch_s:12,.0f} rows/s  (best of {args.repeat})")
+    print(f"speedup     {scalar_s / batch_s:8.1f}x")
+    print(f"mismatches  {mismatched}")
+    return 1 if mismatched else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,121 @@
+"""
+จำลองหลายจุดเรียกคิว (station) เรียกคนถัดไปพร้อมกันจนคิวหมด
+- naive:  แบบ call_visit เดิม อ่านคนแรกที่ WAITING แล้ว save เป็น CALLED (ไม่มี lock)
+- atomic: queues/claims.call_next (SKIP LOCKED หรือ compare-and-set บน SQLite)
+
+วัด claim/วินาที และจำนวนครั้งที่ได้ผู้ป่วยซ้ำกับ station อื่น (double claim ต้องเป็น 0)
+สร้าง test database แยกเป็นไฟล์ (SQLite in-memory ใช้ข้าม thread ไม่ได้จริง) ไม่แตะ DB จริง
+รัน: python scripts/bench_call_next.py [--stations 8] [--patients 2000]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.db import OperationalError, connection, connections  # noqa: E402
+from django.test.utils import setup_test_environment  # noqa: E402
+
+from patients.models import Patient  # noqa: E402
+from queues import claims  # noqa: E402
+from queues.models import Queue, Visit  # noqa: E402
+
+
+def seed(patients):
+    p = Patient.objects.create(first_name="bench", last_name="x", national_id="C000000000000")
+    visits = Visit.objects.bulk_create([Visit(patient=p) for _ in range(patients)])
+    Queue.objects.bulk_create([Queue(visit=v, priority=1 + i % 3) for i, v in enumerate(visits)])
+
+
+def naive_call_next():
+    q = (
+        Queue.objects.select_related("visit")
+        .filter(status="WAITING")
+        .order_by("priority", "created_at", "id")
+        .first()
+    )
+    if q is None:
+        return None
+    q.status = "CALLED"
+    q.save(update_fields=["status"])
+    return q.visit
+
+
+def run(label, fn, stations):
+    Queue.objects.update(status="WAITING")
+    claimed = []
+    errors = Counter()
+    lock = threading.Lock()
+    start = threading.Barrier(stations)
+
+    def station():
+        mine = []
+        start.wait()
+        try:
+            while True:
+                try:
+                    visit = fn()
+                except OperationalError as e:  # SQLite: database is locked
+                    errors[str(e)] += 1
+                    continue
+                if visit is None:
+                    break
+                mine.append(visit.id)
+        finally:
+            connections.close_all()
+        with lock:
+            claimed.extend(mine)
+
+    threads = [threading.Thread(target=station) for _ in range(stations)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+
+    double = len(claimed) - len(set(claimed))
+    print(
+        f"{label:<8} {len(claimed):>6} claims  {len(claimed) / elapsed:>8.0f} claims/s  "
+        f"double={double:<5} errors={sum(errors.values())}"
+    )
+    return double
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stations", type=int, default=8)
+    parser.add_argument("--patients", type=int, default=2000)
+    args = parser.parse_args()
+
+    setup_test_environment()
+    tmp = tempfile.TemporaryDirectory()
+    if connection.vendor == "sqlite":
+        connection.settings_dict["TEST"]["NAME"] = os.path.join(tmp.name, "bench_call_next.sqlite3")
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        seed(args.patients)
+        print(
+            f"{args.patients} waiting, {args.stations} stations ({connection.vendor}, "
+            f"skip_locked={connection.features.has_select_for_update_skip_locked})"
+        )
+        run("naive", naive_call_next, args.stations)
+        double = run("atomic", claims.call_next, args.stations)
+        assert double == 0, "call_next ให้ผู้ป่วยคนเดียวกับสอง station"
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main()
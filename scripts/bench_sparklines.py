@@ -0,0 +1,152 @@
+"""
+เทียบวิธีดึง sparkline (N จุดล่าสุดต่อ visit) เมื่อ visit มี log เยอะ
+- full scan: ดึง log ทั้งหมดของทุก visit แล้วตัดเหลือ N ใน Python (แบบเดิม)
+- per-visit: query ละ visit ละ series, ORDER BY ts DESC LIMIT N
+- row_number: ROW_NUMBER() OVER (PARTITION BY visit ORDER BY ts DESC) <= N, query ละ series
+- cutoff:    queues/sparklines.py (หา ts จุดที่ N ต่อ visit แล้วดึงช่วง ts >= จุดตัด)
+
+สร้าง test database แยก (ไม่แตะ DB จริง) ใส่ log visit ละ --logs แถว
+รัน: python scripts/bench_sparklines.py [--visits 20] [--logs 10000] [--n 20]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.db import connection, reset_queries  # noqa: E402
+from django.db.models import F, Window  # noqa: E402
+from django.db.models.functions import RowNumber  # noqa: E402
+from django.test.utils import CaptureQueriesContext, setup_test_environment  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from patients.models import Patient  # noqa: E402
+from queues import sparklines  # noqa: E402
+from queues.models import TelemetryLog, Visit  # noqa: E402
+
+
+def seed(visits, logs_per_visit):
+    rng = random.Random(42)
+    now = timezone.now()
+    ids = []
+    for i in range(visits):
+        p = Patient.objects.create(first_name=f"bench{i}", last_name="x", national_id=f"B{i:012d}")
+        ids.append(Visit.objects.create(patient=p).id)
+
+    for vid in ids:
+        rows = []
+        for j in range(logs_per_visit):
+            rows.append(TelemetryLog(
+                visit_id=vid,
+                ts=now - timedelta(seconds=(logs_per_visit - j) * 5),
+                bpm=rng.randint(55, 140),
+                # o2sat หายบ้าง ให้เห็นว่าแต่ละ series มี N จุดของตัวเอง
+                o2sat=rng.randint(88, 100) if j % 3 else None,
+            ))
+        TelemetryLog.objects.bulk_create(rows, batch_size=2000)
+    return ids
+
+
+def full_scan(visit_ids, n):
+    rows = (
+        TelemetryLog.objects
+        .filter(visit_id__in=visit_ids)
+        .order_by("visit_id", "-ts")
+        .values("visit_id", "bpm", "o2sat")
+    )
+    series = {}
+    for row in rows:
+        s = series.setdefault(str(row["visit_id"]), {"bpm": [], "o2": []})
+        if len(s["bpm"]) < n and row["bpm"] is not None:
+            s["bpm"].append(row["bpm"])
+        if len(s["o2"]) < n and row["o2sat"] is not None:
+            s["o2"].append(row["o2sat"])
+    for s in series.values():
+        s["bpm"].reverse()
+        s["o2"].reverse()
+    return series
+
+
+def per_visit(visit_ids, n):
+    series = {}
+    for vid in visit_ids:
+        s = series.setdefault(str(vid), {"bpm": [], "o2": []})
+        for name, field in (("bpm", "bpm"), ("o2", "o2sat")):
+            values = list(
+                TelemetryLog.objects
+                .filter(visit_id=vid, **{f"{field}__isnull": False})
+                .order_by("-ts")
+                .values_list(field, flat=True)[:n]
+            )
+            values.reverse()
+            s[name] = values
+    return series
+
+
+def row_number(visit_ids, n):
+    series = {}
+    for name, field in (("bpm", "bpm"), ("o2", "o2sat")):
+        rows = (
+            TelemetryLog.objects
+            .filter(visit_id__in=visit_ids, **{f"{field}__isnull": False})
+            .annotate(rn=Window(RowNumber(), partition_by=F("visit_id"), order_by=F("ts").desc()))
+            .filter(rn__lte=n)
+            .order_by("visit_id", "ts")
+            .values_list("visit_id", field)
+        )
+        for vid, value in rows:
+            series.setdefault(str(vid), {"bpm": [], "o2": []})[name].append(value)
+    return series
+
+
+def cutoff(visit_ids, n):
+    return sparklines.fetch(visit_ids, n, ("bpm", "o2"))
+
+
+def bench(label, fn, visit_ids, n, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        reset_queries()
+        with CaptureQueriesContext(connection) as ctx:
+            t0 = time.perf_counter()
+            result = fn(visit_ids, n)
+            best = min(best, time.perf_counter() - t0)
+    print(f"{label:<12} {best * 1000:>10.1f} ms  {len(ctx.captured_queries):>5} queries")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--visits", type=int, default=20)
+    parser.add_argument("--logs", type=int, default=10000, help="log ต่อ visit")
+    parser.add_argument("--n", type=int, default=sparklines.DEFAULT_POINTS)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        t0 = time.perf_counter()
+        visit_ids = seed(args.visits, args.logs)
+        print(f"seeded {args.visits} visits x {args.logs} logs in {time.perf_counter() - t0:.1f}s "
+              f"({connection.vendor})")
+
+        expected = bench("full scan", full_scan, visit_ids, args.n, args.repeat)
+        for label, fn in (("per-visit", per_visit), ("row_number", row_number), ("cutoff", cutoff)):
+            result = bench(label, fn, visit_ids, args.n, args.repeat)
+            assert result == expected, f"{label} ได้ผลไม่ตรงกับ full scan"
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+เทียบ JSON กับ binary wire format (queues/wire.py)
+- bytes ต่อ reading
+- parse throughput (payload → TelemetryLog ที่พร้อม bulk_create)
+
+รัน: python scripts/bench_telemetry_wire.py [จำนวน reading]
+"""
+import json
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from queues.telemetry import parse_reading  # noqa: E402
+from queues.wire import decode_packet, encode_packet  # noqa: E402
+
+
+def make_readings(n, seed=42):
+    rng = random.Random(seed)
+    out = []
+    for i in range(n):
+        out.append({
+            "visit_id": rng.randint(1, 500),
+            "ts": f"2025-12-17T08:{(i // 60) % 60:02d}:{i % 60:02d}Z",
+            "vitals": {
+                "bpm": rng.randint(55, 140),
+                "o2sat": rng.randint(88, 100),
+                "bt": round(rng.uniform(36.0, 39.5), 1),
+                "rr": rng.randint(12, 32),
+                "sys_bp": rng.randint(85, 170),
+                "dia_bp": rng.randint(50, 100),
+            },
+            "gps": {
+                "lat": round(16.44 + rng.uniform(-0.01, 0.01), 6),
+                "lng": round(102.83 + rng.uniform(-0.01, 0.01), 6),
+            },
+        })
+    return out
+
+
+def bench(label, fn, n, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    print(f"{label:<28} {n / best:>12,.0f} readings/s  ({best * 1000:.1f} ms)")
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    readings = make_readings(n)
+
+    # JSON: แบบเดียวกับที่อุปกรณ์ส่งทีละ reading และแบบ batch
+    json_single = [json.dumps(r, separators=(",", ":")).encode() for r in readings]
+    json_batch = json.dumps({"readings": readings}, separators=(",", ":")).encode()
+    wire_single = [encode_packet([r]) for r in readings]
+    wire_batch = encode_packet(readings)
+
+    print(f"readings: {n:,}")
+    print(f"{'JSON (1 per request)':<28} {sum(map(len, json_single)) / n:>8.1f} bytes/reading")
+    print(f"{'JSON batch':<28} {len(json_batch) / n:>8.1f} bytes/reading")
+    print(f"{'binary (1 per request)':<28} {sum(map(len, wire_single)) / n:>8.1f} bytes/reading")
+    print(f"{'binary batch':<28} {len(wire_batch) / n:>8.1f} bytes/reading")
+    print()
+
+    bench("JSON parse (1 per request)",
+          lambda: [parse_reading(json.loads(b), None) for b in json_single], n)
+    bench("JSON parse batch",
+          lambda: [parse_reading(r, None) for r in json.loads(json_batch)["readings"]], n)
+    bench("binary decode (1 per req)",
+          lambda: [decode_packet(b, None) for b in wire_single], n)
+    bench("binary decode batch", lambda: decode_packet(wire_batch, None), n)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+Load test: เทียบจำนวน connection พร้อมกันที่รับไหว ระหว่าง WSGI กับ ASGI
+
+ใช้แค่ stdlib (asyncio) ยิง HTTP/1.1 ตรง ๆ เพิ่ม concurrency ทีละขั้น
+แล้วรายงาน req/s, p50/p95/p99 และ error (timeout / connection refused / 5xx)
+
+ตัวอย่าง (worker เท่ากันทั้งสองฝั่ง):
+  gunicorn config.wsgi:application -w 4 -b 127.0.0.1:8001
+  uvicorn  config.asgi:application --workers 4 --port 8002
+
+  # monitor API (ต้อง login: เอา sessionid จาก browser มาใส่)
+  python scripts/loadtest_asgi.py \\
+      --target wsgi=http://127.0.0.1:8001/monitor/api/summary/ \\
+      --target asgi=http://127.0.0.1:8002/async/monitor/api/summary/ \\
+      --cookie "sessionid=..." --levels 10,50,100,200,400
+
+  # telemetry ingest
+  python scripts/loadtest_asgi.py \\
+      --target wsgi=http://127.0.0.1:8001/api/iot/telemetry/ \\
+      --target asgi=http://127.0.0.1:8002/async/api/iot/telemetry/ \\
+      --device dev-001:secret --visit-id 1
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from urllib.parse import urlsplit
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[k]
+
+
+def build_request(url, args):
+    parts = urlsplit(url)
+    path = parts.path + (f"?{parts.query}" if parts.query else "")
+    headers = [f"Host: {parts.netloc}", "Connection: keep-alive"]
+    if args.cookie:
+        headers.append(f"Cookie: {args.cookie}")
+
+    body = b""
+    method = "GET"
+    if args.device:
+        device_id, api_key = args.device.split(":", 1)
+        method = "POST"
+        body = json.dumps({
+            "visit_id": args.visit_id,
+            "vitals": {"bpm": 88, "o2sat": 97, "bt": 36.9, "rr": 18, "sys_bp": 120, "dia_bp": 80},
+            "gps": {"lat": 16.44, "lng": 102.83},
+        }).encode()
+        headers += [
+            f"X-DEVICE-ID: {device_id}",
+            f"X-API-KEY: {api_key}",
+            "Content-Type: application/json",
+            f"Content-Length: {len(body)}",
+        ]
+
+    head = f"{method} {path} HTTP/1.1\r\n" + "\r\n".join(headers) + "\r\n\r\n"
+    return parts.hostname, parts.port or 80, head.encode() + body
+
+
+async def read_response(reader):
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("server closed connection")
+    status = int(status_line.split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.lower() == "content-length":
+            length = int(value.strip())
+    if length:
+        await reader.readexactly(length)
+    return status
+
+
+async def worker(host, port, payload, deadline, timeout, stats):
+    conn = None
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            if conn is None:
+                conn = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+            reader, writer = conn
+            writer.write(payload)
+            await writer.drain()
+            status = await asyncio.wait_for(read_response(reader), timeout)
+        except (OSError, asyncio.TimeoutError, ConnectionError, asyncio.IncompleteReadError, ValueError):
+            stats["errors"] += 1
+            if conn is not None:
+                conn[1].close()
+            conn = None
+            await asyncio.sleep(0.05)
+            continue
+
+        stats["latencies"].append(time.perf_counter() - started)
+        if status >= 500:
+            stats["errors"] += 1
+        elif status >= 400:
+            stats["rejected"] += 1
+    if conn is not None:
+        conn[1].close()
+
+
+async def run_level(url, concurrency, args):
+    host, port, payload = build_request(url, args)
+    stats = {"latencies": [], "errors": 0, "rejected": 0}
+    started = time.perf_counter()
+    deadline = started + args.duration
+    await asyncio.gather(*[
+        worker(host, port, payload, deadline, args.timeout, stats) for _ in range(concurrency)
+    ])
+    elapsed = time.perf_counter() - started
+    lat = sorted(stats["latencies"])
+    return {
+        "rps": len(lat) / elapsed,
+        "p50": percentile(lat, 50) * 1000,
+        "p95": percentile(lat, 95) * 1000,
+        "p99": percentile(lat, 99) * 1000,
+        "mean": (statistics.fmean(lat) * 1000) if lat else 0.0,
+        "ok": len(lat),
+        "errors": stats["errors"],
+        "rejected": stats["rejected"],
+    }
+
+
+async def main_async(args):
+    levels = [int(x) for x in args.levels.split(",")]
+    targets = [t.split("=", 1) for t in args.target]
+
+    print(f"{'target':<8} {'conc':>5} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7} {'4xx':>6}")
+    for name, url in targets:
+        for conc in levels:
+            r = await run_level(url, conc, args)
+            print(
+                f"{name:<8} {conc:>5} {r['rps']:>9.1f} {r['p50']:>8.1f} {r['p95']:>8.1f} "
+                f"{r['p99']:>8.1f} {r['errors']:>7} {r['rejected']:>6}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", action="append", required=True, help="name=url (ใส่ได้หลายตัว)")
+    parser.add_argument("--levels", default="10,50,100,200", help="concurrency ที่จะทดสอบ คั่นด้วย ,")
+    parser.add_argument("--duration", type=float, default=10.0, help="วินาทีต่อขั้น")
+    parser.add_argument("--timeout", type=float, default=5.0, help="timeout ต่อ request (วินาที)")
+    parser.add_argument("--cookie", default="", help='เช่น "sessionid=..." สำหรับ monitor API')
+    parser.add_argument("--device", default="", help="device_id:api_key → ยิง telemetry (POST)")
+    parser.add_argument("--visit-id", type=int, default=1)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
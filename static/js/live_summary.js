@@ -0,0 +1,88 @@
+/*
+ * liveSummary(render, opts)
+ * ส่งข้อมูลรูปแบบเดียวกับ /monitor/api/summary/ ({ok, items, server_time}) ให้ render()
+ *
+ * - เบราว์เซอร์รองรับ EventSource และ server รันแบบ ASGI → รับ push จาก /async/monitor/api/stream/
+ *   (snapshot ครั้งแรก แล้วเฉพาะแถวที่เปลี่ยน) แล้วประกอบ items เต็มชุดให้ render เอง
+ * - ต่อ stream ไม่ได้ (WSGI / proxy ตัด) → polling ทุก opts.interval ms
+ *   ครั้งแรกเอาทั้งคิว ครั้งต่อไปส่ง ?since=<cursor> ได้เฉพาะแถวที่เปลี่ยน + removed (visit ที่ถูกลบ / ออกจากคิว)
+ *
+ * return: { refresh() } สำหรับปุ่มรีเฟรช
+ */
+(function () {
+  const SUMMARY_URL = "/monitor/api/summary/";
+  const STREAM_URL = "/async/monitor/api/stream/";
+
+  window.liveSummary = function (render, opts = {}) {
+    const interval = opts.interval || 5000;
+    const rows = new Map();
+    let order = [];
+    let serverTime = null;
+    let timer = null;
+    let cursor = null;
+
+    async function poll() {
+      try {
+        const url = cursor ? `${SUMMARY_URL}?since=${encodeURIComponent(cursor)}` : SUMMARY_URL;
+        const res = await fetch(url);
+        const data = await res.json();
+        if (!data.ok) {
+          cursor = null;
+          render(data);
+          return;
+        }
+        const full = !cursor;
+        cursor = data.cursor;
+        apply(data, full);
+      } catch (e) {
+        render({ ok: false, error: e.message });
+      }
+    }
+
+    function startPolling() {
+      if (timer) return;
+      poll();
+      timer = setInterval(poll, interval);
+    }
+
+    function emit() {
+      render({
+        ok: true,
+        items: order.map(id => rows.get(id)).filter(Boolean),
+        server_time: serverTime,
+      });
+    }
+
+    function apply(data, replace) {
+      if (replace) rows.clear();
+      for (const item of data.items || []) rows.set(item.visit_id, item);
+      for (const id of data.removed || []) rows.delete(id);
+      order = data.order || (replace ? (data.items || []).map(x => x.visit_id) : order);
+      // order ถูกเสมอ: แถวที่ไม่อยู่แล้วทิ้งได้แม้ removed จะไม่มี (tombstone หมดอายุ)
+      const keep = new Set(order);
+      for (const id of rows.keys()) if (!keep.has(id)) rows.delete(id);
+      serverTime = data.server_time || serverTime;
+      emit();
+    }
+
+    if (!window.EventSource) {
+      startPolling();
+      return { refresh: () => { cursor = null; return poll(); } };
+    }
+
+    let opened = false;
+    const es = new EventSource(STREAM_URL);
+    es.addEventListener("snapshot", e => { opened = true; apply(JSON.parse(e.data), true); });
+    es.addEventListener("rows", e => apply(JSON.parse(e.data), false));
+    es.onerror = () => {
+      // หลุดกลางทาง: EventSource ต่อใหม่เองแล้วได้ snapshot ใหม่
+      // ต่อไม่ได้ตั้งแต่แรก / ถูกปิด: ใช้ polling แทน
+      if (!opened || es.readyState === EventSource.CLOSED) {
+        es.close();
+        startPolling();
+      }
+    };
+
+    return { refresh: () => { if (!timer) return emit(); cursor = null; return poll(); } };
+  };
+})();